@@ -12,6 +12,7 @@ from sipyco import pyon
 from sipyco.pipe_ipc import AsyncioChildComm
 
 from artiq.language.scan import ScanObject
+from artiq.master.publisher import filtered_notifier_name
 
 
 logger = logging.getLogger(__name__)
@@ -213,6 +214,11 @@ class SimpleApplet:
         group.add_argument(
             "--port-control", default=3251, type=int,
             help="TCP port to connect to for control (ignored in embedded mode)")
+        group.add_argument(
+            "--master-filter", default=False, action="store_true",
+            help="subscribe only to the datasets of the applet, instead of "
+                 "filtering all datasets locally (requires a master "
+                 "supporting filtered subscriptions, ignored in embedded mode)")
 
         self._arggroup_datasets = self.argparser.add_argument_group("datasets")
 
@@ -349,7 +355,13 @@ class SimpleApplet:
 
     def subscribe(self):
         if self.embed is None:
-            self.subscriber = Subscriber("datasets",
+            if self.args.master_filter:
+                notifier_name = filtered_notifier_name(
+                    "datasets", self.datasets - {None},
+                    self.dataset_prefixes)
+            else:
+                notifier_name = "datasets"
+            self.subscriber = Subscriber(notifier_name,
                                          self.sub_init, self.sub_mod)
             self.loop.run_until_complete(self.subscriber.connect(
                 self.args.server, self.args.port_notify))
@@ -9,10 +9,14 @@ from . import types
 # Types
 
 class TNone(types.TMono):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__("NoneType")
 
 class TBool(types.TMono):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__("bool")
 
@@ -25,6 +29,8 @@ class TBool(types.TMono):
         return True
 
 class TInt(types.TMono):
+    __slots__ = ()
+
     def __init__(self, width=None):
         if width is None:
             width = types.TVar()
@@ -55,6 +61,8 @@ def _int_printer(typ, printer, depth, max_depth):
 types.TypePrinter.custom_printers["int"] = _int_printer
 
 class TFloat(types.TMono):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__("float")
 
@@ -67,18 +75,26 @@ class TFloat(types.TMono):
         return 1.0
 
 class TStr(types.TMono):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__("str")
 
 class TBytes(types.TMono):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__("bytes")
 
 class TByteArray(types.TMono):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__("bytearray")
 
 class TList(types.TMono):
+    __slots__ = ()
+
     def __init__(self, elt=None):
         if elt is None:
             elt = types.TVar()
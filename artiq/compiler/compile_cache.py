@@ -0,0 +1,211 @@
+"""
+The :class:`CompileCache` class stores the kernel libraries produced from
+LLVM IR, so that kernels compiled again with the same code and embedded
+values skip optimization, code generation, linking and stripping.
+
+Entries are keyed by a hash of the unoptimized LLVM IR (which is derived
+from the stitched typed tree and the quoted host values), the target and
+the versions of ARTIQ, LLVM, the linker and the strip tool. The cache has
+an in-memory tier and an optional on-disk tier, which may be shared by
+several processes; both are bounded and evict the least recently used
+entries. It can be used from several threads.
+"""
+
+import os
+import struct
+import hashlib
+import tempfile
+import logging
+import threading
+import subprocess
+import functools
+from collections import OrderedDict
+
+from llvmlite import binding as llvm
+
+from artiq import __version__ as artiq_version
+
+
+logger = logging.getLogger(__name__)
+
+
+_magic = b"ARTIQKC1"
+_header = struct.Struct("<QQ")
+
+
+@functools.lru_cache(maxsize=None)
+def _tool_version(tool):
+    # Runs the tool once per process; a missing tool only fails later, when
+    # the kernel is actually linked.
+    try:
+        return subprocess.run([tool, "--version"], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, universal_newlines=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+class CompileCache:
+    """
+    :param directory: directory of the on-disk tier, or ``None`` to only
+        cache in memory. Created if it does not exist.
+    :param max_memory_entries: number of entries kept in memory.
+    :param max_disk_size: total size (in bytes) of the on-disk entries.
+
+    :var stats: numbers of hits in each tier and of misses.
+    """
+    def __init__(self, directory=None, max_memory_entries=16,
+                 max_disk_size=256*1024*1024):
+        self.directory = directory
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_size = max_disk_size
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(target, llvm_ir):
+        """Returns the cache key of the library compiled from ``llvm_ir``
+        (a string) for ``target``."""
+        h = hashlib.sha256()
+        for part in [artiq_version,
+                     ".".join(map(str, llvm.llvm_version_info)),
+                     _tool_version(target.tool_ld),
+                     _tool_version(target.tool_strip),
+                     str(target.in_process_strip),
+                     type(target).__module__, type(target).__qualname__,
+                     target.triple, target.data_layout,
+                     ",".join(target.features),
+                     ",".join(target.additional_linker_options),
+                     str(target.subkernel_id), target.optimization]:
+            h.update(part.encode())
+            h.update(b"\0")
+        h.update(llvm_ir.encode())
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".kcache")
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _read(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        if data[:len(_magic)] != _magic:
+            logger.warning("ignoring invalid kernel cache file %s", path)
+            return None
+        offset = len(_magic)
+        library_length, stripped_length = _header.unpack_from(data, offset)
+        offset += _header.size
+        library = data[offset:offset+library_length]
+        offset += library_length
+        stripped_library = data[offset:offset+stripped_length]
+        if len(stripped_library) != stripped_length:
+            logger.warning("ignoring truncated kernel cache file %s", path)
+            return None
+        try:
+            # mark as recently used
+            os.utime(path)
+        except OSError:
+            pass
+        return library, stripped_library
+
+    def _write(self, key, library, stripped_library):
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(_magic)
+                f.write(_header.pack(len(library), len(stripped_library)))
+                f.write(library)
+                f.write(stripped_library)
+            os.replace(temp_path, self._path(key))
+        except:
+            os.unlink(temp_path)
+            raise
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        total_size = 0
+        with os.scandir(self.directory) as it:
+            for de in it:
+                if not de.name.endswith(".kcache"):
+                    continue
+                try:
+                    st = de.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, de.path))
+                total_size += st.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.max_disk_size:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def get(self, key):
+        """Returns the ``(library, stripped_library)`` pair stored under
+        ``key``, or ``None``."""
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key):
+        try:
+            entry = self._memory[key]
+        except KeyError:
+            pass
+        else:
+            self._memory.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return entry
+        if self.directory is not None:
+            try:
+                entry = self._read(key)
+            except OSError:
+                logger.warning("failed to read kernel cache", exc_info=True)
+                entry = None
+            if entry is not None:
+                self._remember(key, entry)
+                self.stats["disk_hits"] += 1
+                return entry
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, key, library, stripped_library):
+        with self._lock:
+            self._put(key, library, stripped_library)
+
+    def _put(self, key, library, stripped_library):
+        self._remember(key, (library, stripped_library))
+        if self.directory is not None:
+            try:
+                self._write(key, library, stripped_library)
+            except OSError:
+                logger.warning("failed to write kernel cache", exc_info=True)
+
+    def clear(self):
+        """Removes all entries, including those on disk."""
+        with self._lock:
+            self._memory.clear()
+            if self.directory is not None:
+                with os.scandir(self.directory) as it:
+                    for de in it:
+                        if de.name.endswith(".kcache"):
+                            try:
+                                os.unlink(de.path)
+                            except FileNotFoundError:
+                                pass
@@ -6,7 +6,7 @@ annotated as ``@kernel`` when they are referenced.
 """
 
 import typing
-import os, re, linecache, inspect, textwrap, types as pytypes, numpy
+import os, re, linecache, inspect, textwrap, reprlib, types as pytypes, numpy
 from collections import OrderedDict, defaultdict
 
 from pythonparser import ast, algorithm, source, diagnostic, parse_buffer
@@ -15,7 +15,7 @@ from pythonparser import lexer as source_lexer, parser as source_parser
 from Levenshtein import ratio as similarity, jaro_winkler
 
 from ..language import core as language_core
-from . import types, builtins, asttyped, math_fns, prelude
+from . import types, builtins, asttyped, math_fns, prelude, profiler
 from .transforms import ASTTypedRewriter, Inferencer, IntMonomorphizer, TypedtreePrinter
 from .transforms.asttyped_rewriter import LocalExtractor
 
@@ -296,6 +296,40 @@ class _ValueInfo:
             attr_store.append(val_and_loc)
 
 
+# Homogeneous numeric lists with at least this many elements, and numeric
+# arrays, are quoted as a copy of constant data instead of one AST node per
+# element; the LLVM IR generator emits the data as a single blob.
+_CONSTANT_DATA_MIN_LENGTH = 32
+
+_constant_list_elt_types = {
+    int: builtins.TInt,
+    float: builtins.TFloat,
+    numpy.int32: builtins.TInt32,
+    numpy.int64: builtins.TInt64,
+}
+
+_constant_array_elt_types = {
+    numpy.dtype(numpy.int32): builtins.TInt32,
+    numpy.dtype(numpy.int64): builtins.TInt64,
+    numpy.dtype(numpy.float64): builtins.TFloat,
+}
+
+def _constant_data_type(value):
+    if isinstance(value, list):
+        if len(value) < _CONSTANT_DATA_MIN_LENGTH:
+            return None
+        elt_class = value[0].__class__
+        if elt_class not in _constant_list_elt_types:
+            return None
+        for elt in value:
+            if elt.__class__ is not elt_class:
+                return None
+        return builtins.TList(_constant_list_elt_types[elt_class]())
+    else:
+        if value.ndim == 0 or value.dtype not in _constant_array_elt_types:
+            return None
+        return builtins.TArray(_constant_array_elt_types[value.dtype](), value.ndim)
+
 class ASTSynthesizer:
     def __init__(self, embedding_map, value_map, quote_function=None, expanded_from=None):
         self.source = ""
@@ -389,6 +423,27 @@ class ASTSynthesizer:
                     self._add_iterable(", ")
         return elts
 
+    def quote_constant_data(self, value, data_type, constructor_type, constructor_name):
+        """Construct an AST fragment ``constructor(`value`)`` copying the
+        list or array `value`, quoted as a whole with type `data_type`."""
+        name_loc    = self._add(constructor_name)
+        begin_loc   = self._add("(")
+        quote_loc   = self._add("`")
+        repr_loc    = self._add(reprlib.repr(value))
+        unquote_loc = self._add("`")
+        end_loc     = self._add(")")
+
+        data_node = asttyped.QuoteT(value=value, type=data_type,
+                                    loc=quote_loc.join(unquote_loc))
+        constructor_node = asttyped.NameConstantT(value=None, type=constructor_type,
+                                                  loc=name_loc)
+        return asttyped.CallT(
+            func=constructor_node, args=[data_node], keywords=[],
+            starargs=None, kwargs=None,
+            type=types.TVar(), iodelay=None, arg_exprs={},
+            begin_loc=begin_loc, end_loc=end_loc, star_loc=None, dstar_loc=None,
+            loc=name_loc.join(end_loc))
+
     def quote(self, value):
         """Construct an AST fragment equal to `value`."""
         if value is None:
@@ -449,6 +504,11 @@ class ASTSynthesizer:
 
             return asttyped.QuoteT(value=value, type=builtins.TByteArray(), loc=loc)
         elif isinstance(value, list):
+            data_type = _constant_data_type(value)
+            if data_type is not None:
+                return self.quote_constant_data(value, data_type,
+                                                builtins.fn_list(), "list")
+
             begin_loc = self._add_iterable("[")
             elts = self.fast_quote_list(value)
             end_loc   = self._add_iterable("]")
@@ -464,6 +524,10 @@ class ASTSynthesizer:
                                    begin_loc=begin_loc, end_loc=end_loc,
                                    loc=begin_loc.join(end_loc))
         elif isinstance(value, numpy.ndarray):
+            data_type = _constant_data_type(value)
+            if data_type is not None:
+                return self.quote_constant_data(value, data_type,
+                                                builtins.fn_array(), "numpy.array")
             return self.call(numpy.array, [list(value)], {})
         elif inspect.isfunction(value) or inspect.ismethod(value) or \
                 isinstance(value, pytypes.BuiltinFunctionType) or \
@@ -724,6 +788,16 @@ class StitchingInferencer(Inferencer):
         self.value_map = value_map
         self.quote = quote
         self.attr_type_cache = {}
+        # The number of host objects of each instance type whose attributes
+        # were checked when they were first accessed; see Stitcher.finalize.
+        self.object_counts = {}
+        # The number of AST nodes visited so far.
+        self.node_count = 0
+
+    def visit(self, obj):
+        if isinstance(obj, ast.AST):
+            self.node_count += 1
+        return super().visit(obj)
 
     def _compute_attr_type(self, object_value, object_type, object_loc, attr_name, loc):
         if not hasattr(object_value, attr_name):
@@ -834,6 +908,7 @@ class StitchingInferencer(Inferencer):
         # Take all objects whose attribute we haven't checked yet.
         attribute_objects = values.unchecked_attributes.get(attr_name, values.objects)
         values.unchecked_attributes[attr_name] = []
+        self.object_counts.setdefault(object_type, len(values.objects))
 
         for object_value, object_loc in attribute_objects:
             attr_type_key = (id(object_value), attr_name)
@@ -874,23 +949,58 @@ class StitchingInferencer(Inferencer):
                                     loc=node.loc,
                                     self_loc=node.self_loc)
 
-class TypedtreeHasher(algorithm.Visitor):
-    def generic_visit(self, node):
-        def freeze(obj):
-            if isinstance(obj, ast.AST):
-                return self.visit(obj)
-            elif isinstance(obj, list):
-                return hash(tuple(freeze(elem) for elem in obj))
-            elif isinstance(obj, types.Type):
-                return hash(obj.find())
-            else:
-                # We don't care; only types change during inference.
-                pass
+class TypeVarCollector(algorithm.Visitor):
+    """
+    Collects the unresolved type variables occurring in a typed tree,
+    and counts its nodes.
+    """
+    def __init__(self):
+        self.type_vars = set()
+        self.node_count = 0
+
+    def _add_var(self, type_vars, typ):
+        if types.is_var(typ):
+            type_vars.add(typ)
+        return type_vars
+
+    def _collect(self, obj):
+        if isinstance(obj, ast.AST):
+            self.visit(obj)
+        elif isinstance(obj, list):
+            for elem in obj:
+                self._collect(elem)
+        elif isinstance(obj, types.Type):
+            obj.fold(self.type_vars, self._add_var)
+        else:
+            # We don't care; only types change during inference.
+            pass
 
+    def generic_visit(self, node):
+        self.node_count += 1
         fields = node._fields
         if hasattr(node, '_types'):
             fields = fields + node._types
-        return hash(tuple(freeze(getattr(node, field_name)) for field_name in fields))
+        for field_name in fields:
+            self._collect(getattr(node, field_name))
+
+class _InferenceState:
+    """
+    What the inference of a top-level node observed the last time it
+    reached a fixed point: its unresolved type variables, and the number
+    of host objects of each instance type whose attributes it accessed.
+    """
+    def __init__(self, type_vars, object_counts):
+        self.type_vars = type_vars
+        self.object_counts = object_counts
+
+    def changed(self, value_map):
+        for type_var in self.type_vars:
+            if type_var.find() is not type_var:
+                return True
+        for object_type, count in self.object_counts.items():
+            if len(value_map[object_type].objects) != count:
+                return True
+        return False
 
 class Stitcher:
     def __init__(self, core, dmgr, engine=None, print_as_rpc=True, destination=0, subkernel_arg_types=[], old_embedding_map=None):
@@ -917,7 +1027,10 @@ class Stitcher:
 
         self.embedding_map = EmbeddingMap(old_embedding_map)
         self.value_map = defaultdict(_ValueInfo)
-        self.definitely_changed = False
+        # Top-level nodes injected since finalize() last looked.
+        self.injected = []
+        # Statistics of the last finalize() call.
+        self.inference_stats = {}
 
         self.destination = destination
         self.first_call = True
@@ -939,26 +1052,59 @@ class Stitcher:
         inferencer = StitchingInferencer(engine=self.engine,
                                          value_map=self.value_map,
                                          quote=self._quote)
-        typedtree_hasher = TypedtreeHasher()
 
-        # Iterate inference to fixed point.
-        old_typedtree_hash = None
-        old_attr_count = None
-        while True:
-            inferencer.visit(self.typedtree)
-            if self.definitely_changed:
-                changed = True
-                self.definitely_changed = False
-            else:
-                typedtree_hash = typedtree_hasher.visit(self.typedtree)
-                attr_count = self.embedding_map.attribute_count()
-                changed = old_attr_count != attr_count or \
-                          old_typedtree_hash != typedtree_hash
-                old_typedtree_hash = typedtree_hash
-                old_attr_count = attr_count
-
-            if not changed:
-                break
+        # Iterate inference to fixed point. Rather than inferring the whole
+        # typedtree until it stops changing, we keep a worklist of top-level
+        # nodes (quoted functions and stitched calls). A node is inferred
+        # again when it is new, when its own inference resolved some of its
+        # types (which the nodes visited earlier may have been waiting for),
+        # or when one of its unresolved types was resolved or new host
+        # objects of a type whose attributes it accesses were quoted since.
+        states = {}
+        worklist = list(self.typedtree)
+        self.injected = []
+        rounds = visits = collected_nodes = 0
+        while worklist:
+            rounds += 1
+            next_worklist = []
+            with profiler.stage("inference (round {})".format(rounds)):
+                for node in worklist:
+                    collector = TypeVarCollector()
+                    collector.visit(node)
+                    visits += 1
+                    collected_nodes += collector.node_count
+
+                    inferencer.object_counts = {}
+                    inferencer.visit(node)
+
+                    # Newly quoted functions are inferred within this round.
+                    worklist.extend(self.injected)
+                    self.injected = []
+
+                    if _InferenceState(collector.type_vars, {}).changed(self.value_map):
+                        states.pop(id(node), None)
+                        next_worklist.append(node)
+                    else:
+                        collector = TypeVarCollector()
+                        collector.visit(node)
+                        collected_nodes += collector.node_count
+                        states[id(node)] = (node, _InferenceState(collector.type_vars,
+                                                                  inferencer.object_counts))
+
+                scheduled = set(id(node) for node in next_worklist)
+                for node_id, (node, state) in list(states.items()):
+                    if node_id not in scheduled and state.changed(self.value_map):
+                        del states[node_id]
+                        next_worklist.append(node)
+            worklist = next_worklist
+
+        self.inference_stats = {
+            "rounds": rounds,
+            "nodes": len(self.typedtree),
+            "node_visits": visits,
+            # Visited by the inferencer and by the type variable collector.
+            "ast_nodes_visited": inferencer.node_count + collected_nodes,
+        }
 
         # After we've discovered every referenced attribute, check if any kernel_invariant
         # specifications refers to ones we didn't encounter.
@@ -997,6 +1143,7 @@ class Stitcher:
     def _inject(self, node):
         self.typedtree.insert(self.inject_at, node)
         self.inject_at += 1
+        self.injected.append(node)
 
     def _synthesizer(self, expanded_from=None):
         return ASTSynthesizer(expanded_from=expanded_from,
@@ -1097,9 +1244,6 @@ class Stitcher:
         return types.TVar()
 
     def _quote_embedded_function(self, function, flags, remote_fn=False):
-        # we are now parsing new functions... definitely changed the type
-        self.definitely_changed = True
-
         if isinstance(function, SpecializedFunction):
             host_function = function.host_function
         else:
@@ -16,6 +16,8 @@ def escape_name(name):
         return "\"{}\"".format(name.replace("\"", "\\\""))
 
 class TBasicBlock(types.TMono):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__("label")
 
@@ -23,6 +25,8 @@ def is_basic_block(typ):
     return isinstance(typ, TBasicBlock)
 
 class TOption(types.TMono):
+    __slots__ = ()
+
     def __init__(self, value):
         super().__init__("option", {"value": value})
 
@@ -30,6 +34,8 @@ def is_option(typ):
     return isinstance(typ, TOption)
 
 class TKeyword(types.TMono):
+    __slots__ = ()
+
     def __init__(self, value):
         super().__init__("keyword", {"value": value})
 
@@ -83,11 +89,24 @@ class Value:
     An SSA value that keeps track of its uses.
 
     :ivar type: (:class:`.types.Type`) type of this value
-    :ivar uses: (list of :class:`Value`) values that use this value
+    :ivar uses: (set of :class:`Value`) values that use this value
     """
 
+    # Many values (terminators, stores, unused results) never acquire any
+    # uses, so the set is only allocated when the first use is added.
+    uses = frozenset()
+
     def __init__(self, typ):
-        self.uses, self.type = set(), typ.find()
+        self.type = typ.find()
+
+    def _add_use(self, user):
+        if self.uses:
+            self.uses.add(user)
+        else:
+            self.uses = {user}
+
+    def _remove_use(self, user):
+        self.uses.remove(user)
 
     def replace_all_uses_with(self, value):
         for user in set(self.uses):
@@ -173,10 +192,10 @@ class User(NamedValue):
 
     def set_operands(self, new_operands):
         for operand in set(self.operands):
-            operand.uses.remove(self)
+            operand._remove_use(self)
         self.operands = new_operands
         for operand in set(self.operands):
-            operand.uses.add(self)
+            operand._add_use(self)
 
     def drop_references(self):
         self.set_operands([])
@@ -188,8 +207,8 @@ class User(NamedValue):
             if operand == value:
                 self.operands[index] = replacement
 
-        value.uses.remove(self)
-        replacement.uses.add(self)
+        value._remove_use(self)
+        replacement._add_use(self)
 
 class Instruction(User):
     """
@@ -299,22 +318,22 @@ class Phi(Instruction):
     def add_incoming(self, value, block):
         assert value.type == self.type
         self.operands.append(value)
-        value.uses.add(self)
+        value._add_use(self)
         self.operands.append(block)
-        block.uses.add(self)
+        block._add_use(self)
 
     def remove_incoming_value(self, value):
         index = self.operands.index(value)
         assert index % 2 == 0
-        self.operands[index].uses.remove(self)
-        self.operands[index + 1].uses.remove(self)
+        self.operands[index]._remove_use(self)
+        self.operands[index + 1]._remove_use(self)
         del self.operands[index:index + 2]
 
     def remove_incoming_block(self, block):
         index = self.operands.index(block)
         assert index % 2 == 1
-        self.operands[index - 1].uses.remove(self)
-        self.operands[index].uses.remove(self)
+        self.operands[index - 1]._remove_use(self)
+        self.operands[index]._remove_use(self)
         del self.operands[index - 1:index + 1]
 
     def as_entity(self, type_printer):
@@ -1232,9 +1251,9 @@ class Branch(Terminator):
         return self.operands[0]
 
     def set_target(self, new_target):
-        self.operands[0].uses.remove(self)
+        self.operands[0]._remove_use(self)
         self.operands[0] = new_target
-        self.operands[0].uses.add(self)
+        self.operands[0]._add_use(self)
 
 class BranchIf(Terminator):
     """
@@ -1290,7 +1309,7 @@ class IndirectBranch(Terminator):
         return self.operands[1:]
 
     def add_destination(self, destination):
-        destination.uses.add(self)
+        destination._add_use(self)
         self.operands.append(destination)
 
     def _operands_as_string(self, type_printer):
@@ -1484,7 +1503,7 @@ class LandingPad(Terminator):
         assert typ is None or builtins.is_exception(typ)
         self.operands.append(target)
         self.types.append(typ.find() if typ is not None else None)
-        target.uses.add(self)
+        target._add_use(self)
 
     def _operands_as_string(self, type_printer):
         table = []
@@ -1527,17 +1546,17 @@ class Delay(Terminator):
         return self.operands[0]
 
     def set_decomposition(self, new_decomposition):
-        self.operands[0].uses.remove(self)
+        self.operands[0]._remove_use(self)
         self.operands[0] = new_decomposition
-        self.operands[0].uses.add(self)
+        self.operands[0]._add_use(self)
 
     def target(self):
         return self.operands[1]
 
     def set_target(self, new_target):
-        self.operands[1].uses.remove(self)
+        self.operands[1]._remove_use(self)
         self.operands[1] = new_target
-        self.operands[1].uses.add(self)
+        self.operands[1]._add_use(self)
 
     def _operands_as_string(self, type_printer):
         result = "decomp {}, to {}".format(self.decomposition().as_operand(type_printer),
@@ -1617,5 +1636,5 @@ class Interleave(Terminator):
         return self.operands
 
     def add_destination(self, destination):
-        destination.uses.add(self)
+        destination._add_use(self)
         self.operands.append(destination)
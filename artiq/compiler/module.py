@@ -10,7 +10,7 @@ string and infers types for it using a trivial :module:`prelude`.
 
 import os
 from pythonparser import source, diagnostic, parse_buffer
-from . import prelude, types, transforms, analyses, validators, embedding
+from . import prelude, types, transforms, analyses, validators, embedding, profiler
 
 class Source:
     def __init__(self, source_buffer, engine=None):
@@ -67,23 +67,38 @@ class Module:
         interleaver = transforms.Interleaver(engine=self.engine)
         invariant_detection = analyses.InvariantDetection(engine=self.engine)
 
-        int_monomorphizer.visit(src.typedtree)
-        cast_monomorphizer.visit(src.typedtree)
-        inferencer.visit(src.typedtree)
-        monomorphism_validator.visit(src.typedtree)
-        escape_validator.visit(src.typedtree)
-        iodelay_estimator.visit_fixpoint(src.typedtree)
-        constness_validator.visit(src.typedtree)
-        devirtualization.visit(src.typedtree)
-        self.artiq_ir = artiq_ir_generator.visit(src.typedtree)
-        artiq_ir_generator.annotate_calls(devirtualization)
-        dead_code_eliminator.process(self.artiq_ir)
-        interleaver.process(self.artiq_ir)
-        local_access_validator.process(self.artiq_ir)
-        local_demoter.process(self.artiq_ir)
-        constant_hoister.process(self.artiq_ir)
+        with profiler.stage("int monomorphization"):
+            int_monomorphizer.visit(src.typedtree)
+        with profiler.stage("cast monomorphization"):
+            cast_monomorphizer.visit(src.typedtree)
+        with profiler.stage("type inference"):
+            inferencer.visit(src.typedtree)
+        with profiler.stage("monomorphism validation"):
+            monomorphism_validator.visit(src.typedtree)
+        with profiler.stage("escape validation"):
+            escape_validator.visit(src.typedtree)
+        with profiler.stage("I/O delay estimation"):
+            iodelay_estimator.visit_fixpoint(src.typedtree)
+        with profiler.stage("constness validation"):
+            constness_validator.visit(src.typedtree)
+        with profiler.stage("devirtualization"):
+            devirtualization.visit(src.typedtree)
+        with profiler.stage("ARTIQ IR generation"):
+            self.artiq_ir = artiq_ir_generator.visit(src.typedtree)
+            artiq_ir_generator.annotate_calls(devirtualization)
+        with profiler.stage("dead code elimination"):
+            dead_code_eliminator.process(self.artiq_ir)
+        with profiler.stage("interleaving"):
+            interleaver.process(self.artiq_ir)
+        with profiler.stage("local access validation"):
+            local_access_validator.process(self.artiq_ir)
+        with profiler.stage("local demotion"):
+            local_demoter.process(self.artiq_ir)
+        with profiler.stage("constant hoisting"):
+            constant_hoister.process(self.artiq_ir)
         if remarks:
-            invariant_detection.process(self.artiq_ir)
+            with profiler.stage("invariant detection"):
+                invariant_detection.process(self.artiq_ir)
         # for subkernels: main kernel inferencer output, to be passed to further compilations
         self.subkernel_arg_types = inferencer.subkernel_arg_types
 
@@ -0,0 +1,92 @@
+"""
+The :class:`CompileProfiler` class records the wall time and, optionally,
+the peak memory usage of the stages of kernel compilation.
+
+The compiler marks its stages with :func:`stage`, which does nothing unless
+a profiler has been activated in the current context with
+:meth:`CompileProfiler.activate`. Memory is measured with :mod:`tracemalloc`
+and only covers allocations made by Python (not by LLVM).
+"""
+
+import time
+import tracemalloc
+import contextvars
+from contextlib import contextmanager
+
+
+_active = contextvars.ContextVar("artiq_compile_profiler", default=None)
+
+
+class CompileProfiler:
+    """
+    :param trace_memory: also record the peak memory allocated during each
+        stage. This slows compilation down noticeably.
+
+    :var stages: list of ``(name, time, peak_memory)`` tuples, in order of
+        completion. ``time`` is in seconds, ``peak_memory`` in bytes (or
+        ``None`` if memory is not traced).
+    """
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stages = []
+
+    @contextmanager
+    def activate(self):
+        """Records the stages of the compilation run within this context."""
+        start_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if start_tracing:
+            tracemalloc.start()
+        token = _active.set(self)
+        try:
+            yield self
+        finally:
+            _active.reset(token)
+            if start_tracing:
+                tracemalloc.stop()
+
+    def report(self):
+        """Returns the recorded stages as a dictionary suitable for
+        serialization with PYON."""
+        return {
+            "stages": [{"name": name, "time": duration, "peak_memory": peak_memory}
+                       for name, duration, peak_memory in self.stages],
+            "time": sum(duration for _, duration, _ in self.stages),
+        }
+
+    def format(self):
+        """Returns the recorded stages as a human-readable table."""
+        width = max((len(name) for name, _, _ in self.stages), default=0)
+        lines = []
+        for name, duration, peak_memory in self.stages:
+            line = "{:<{}} {:9.2f} ms".format(name, width, duration * 1e3)
+            if peak_memory is not None:
+                line += " {:9.1f} KiB".format(peak_memory / 1024)
+            lines.append(line)
+        lines.append("{:<{}} {:9.2f} ms".format("total", width,
+                                                self.report()["time"] * 1e3))
+        return "\n".join(lines)
+
+
+@contextmanager
+def stage(name):
+    """Records the compilation stage ``name`` in the active profiler, if any.
+    Stages must not be nested."""
+    profiler = _active.get()
+    if profiler is None:
+        yield
+        return
+
+    if profiler.trace_memory:
+        tracemalloc.reset_peak()
+        start_memory, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        if profiler.trace_memory:
+            _, peak_memory = tracemalloc.get_traced_memory()
+            peak_memory -= start_memory
+        else:
+            peak_memory = None
+        profiler.stages.append((name, duration, peak_memory))
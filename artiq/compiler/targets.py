@@ -1,5 +1,5 @@
-import os, sys, tempfile, subprocess, io
-from artiq.compiler import types, ir
+import os, sys, tempfile, subprocess, io, struct
+from artiq.compiler import types, ir, profiler
 from llvmlite import ir as ll, binding as llvm
 
 llvm.initialize()
@@ -49,6 +49,153 @@ class RunTool:
         for filename in self._tempnames.values():
             os.unlink(filename)
 
+def _run_in_memory(pattern, **inputs):
+    """Run a tool that reads its inputs from anonymous in-memory files and
+    writes its output to its standard output, without temporary files.
+
+    Each ``{key}`` in ``pattern`` is replaced by the path of a file containing
+    ``inputs[key]``. Returns the standard output of the tool."""
+    fds = {}
+    try:
+        for key, data in inputs.items():
+            fds[key] = fd = os.memfd_create(key)
+            with open(fd, "wb", closefd=False) as f:
+                f.write(data)
+
+        paths = {key: "/dev/fd/{}".format(fd) for key, fd in fds.items()}
+        cmdline = [argument.format(**paths) for argument in pattern]
+        process = subprocess.run(cmdline, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                 pass_fds=list(fds.values()))
+        if process.returncode != 0:
+            raise Exception("{} invocation failed: {}".
+                            format(cmdline[0], process.stderr.decode(errors="replace")))
+        return process.stdout
+    finally:
+        for fd in fds.values():
+            os.close(fd)
+
+_SHT_SYMTAB, _SHT_RELA, _SHT_NOBITS, _SHT_REL, _SHT_DYNSYM = 2, 4, 8, 9, 11
+_SHF_ALLOC, _SHF_INFO_LINK = 0x2, 0x40
+_SHN_LORESERVE = 0xff00
+
+def _strip_debug(library):
+    """Remove the debug sections of a 32-bit ELF shared library in memory,
+    like ``llvm-strip --strip-debug``, without running a process.
+
+    The loaded contents are kept as is, and the remaining non-loaded sections
+    (symbol table, string tables, ...) are moved after them. Returns ``None``
+    for libraries laid out in a way that is not handled."""
+    if library[:4] != b"\x7fELF" or library[4] != 1:
+        return None
+    endian = {1: "<", 2: ">"}.get(library[5])
+    if endian is None:
+        return None
+    ehdr = struct.Struct(endian + "16sHHIIIIIHHHHHH")
+    phdr = struct.Struct(endian + "IIIIIIII")
+    shdr = struct.Struct(endian + "IIIIIIIIII")
+    sym = struct.Struct(endian + "IIIBBH")
+    header = list(ehdr.unpack_from(library))
+    phoff, shoff, phentsize, phnum, shentsize, shnum, shstrndx = header[5:7] + header[9:]
+    if shnum == 0 or shstrndx >= shnum or shentsize != shdr.size:
+        return None
+
+    # [name, type, flags, addr, offset, size, link, info, addralign, entsize]
+    sections = [list(shdr.unpack_from(library, shoff + i*shentsize)) for i in range(shnum)]
+    shstrtab = sections[shstrndx]
+    def section_name(section):
+        start = shstrtab[4] + section[0]
+        return library[start:library.index(b"\0", start)]
+
+    removed = {i for i, section in enumerate(sections)
+               if not section[2] & _SHF_ALLOC
+               and section_name(section).startswith((b".debug", b".zdebug"))}
+    removed |= {i for i, section in enumerate(sections)
+                if section[1] in (_SHT_REL, _SHT_RELA) and section[7] in removed}
+    if not removed:
+        return library
+    index = {}
+    for i in range(shnum):
+        if i not in removed:
+            index[i] = len(index)
+
+    moved = sorted((i for i in index if i != 0 and not sections[i][2] & _SHF_ALLOC),
+                   key=lambda i: sections[i][4])
+    # Segments may also describe non-loaded sections (e.g. PT_RISCV_ATTRIBUTES),
+    # and are then moved along with them.
+    segments = [list(phdr.unpack_from(library, phoff + i*phentsize)) for i in range(phnum)]
+    segment_sections = {}
+    loaded_end = phoff + phnum*phentsize
+    for j, segment in enumerate(segments):
+        for i in moved:
+            if (segment[1], segment[4]) == (sections[i][4], sections[i][5]):
+                segment_sections[j] = i
+                break
+        else:
+            loaded_end = max(loaded_end, segment[1] + segment[4])
+    for section in sections[1:]:
+        if section[2] & _SHF_ALLOC and section[1] != _SHT_NOBITS:
+            loaded_end = max(loaded_end, section[4] + section[5])
+    if any(sections[i][4] < loaded_end for i in moved):
+        return None
+
+    output = bytearray(library[:loaded_end])
+    contents = {i: library[sections[i][4]:sections[i][4] + sections[i][5]] for i in moved}
+
+    # Rebuild the section name table with the remaining names only.
+    names = bytearray(b"\0")
+    for i in index:
+        if i != 0:
+            name = section_name(sections[i])
+            sections[i][0] = len(names)
+            names += name + b"\0"
+    contents[shstrndx] = bytes(names)
+    sections[shstrndx][5] = len(names)
+
+    for i, section in enumerate(sections):
+        if i in removed or section[1] not in (_SHT_SYMTAB, _SHT_DYNSYM):
+            continue
+        symbols = []
+        first_global = section[7]
+        data = contents.get(i, library[section[4]:section[4] + section[5]])
+        for j in range(section[5] // sym.size):
+            fields = list(sym.unpack_from(data, j*sym.size))
+            shndx = fields[5]
+            if 0 < shndx < _SHN_LORESERVE:
+                if shndx in removed:
+                    if section[1] == _SHT_DYNSYM:
+                        return None
+                    if j < section[7]:
+                        first_global -= 1
+                    continue
+                fields[5] = index[shndx]
+            symbols.append(sym.pack(*fields))
+        data = b"".join(symbols)
+        section[5], section[7] = len(data), first_global
+        if section[2] & _SHF_ALLOC:
+            output[section[4]:section[4] + len(data)] = data
+        else:
+            contents[i] = data
+
+    for i in moved:
+        align = max(sections[i][8], 1)
+        output += bytes(-len(output) % align)
+        sections[i][4] = len(output)
+        output += contents[i]
+    output += bytes(-len(output) % 4)
+
+    header[6], header[12], header[13] = len(output), len(index), index[shstrndx]
+    output[:ehdr.size] = ehdr.pack(*header)
+    for j, i in segment_sections.items():
+        segments[j][1] = sections[i][4]
+        phdr.pack_into(output, phoff + j*phentsize, *segments[j])
+    for i in index:
+        section = sections[i]
+        section[6] = index.get(section[6], 0)
+        if section[1] in (_SHT_REL, _SHT_RELA) or section[2] & _SHF_INFO_LINK:
+            section[7] = index.get(section[7], 0)
+        output += shdr.pack(*section)
+    return bytes(output)
+
 def _dump(target, kind, suffix, content):
     if target is not None:
         print("====== {} DUMP ======".format(kind.upper()), file=sys.stderr)
@@ -81,6 +228,17 @@ class Target:
         provided by the target, e.g. ``"printf"``.
     :var now_pinning: (boolean)
         Whether the target implements the now-pinning RTIO optimization.
+    :var optimization: (string)
+        Optimization profile: ``"fast"`` runs a minimal set of passes to
+        reduce compile time, ``"default"`` the usual pipeline and
+        ``"aggressive"`` additionally inlines more and unrolls and vectorizes
+        loops.
+    :var in_memory_tools: (boolean)
+        Whether the linker and strip tools are fed through in-memory files and
+        pipes instead of temporary files. Only supported on Linux.
+    :var in_process_strip: (boolean)
+        Whether debug information is stripped from 32-bit ELF libraries in
+        Python rather than by the strip tool, which avoids starting a process.
     """
     triple = "unknown"
     data_layout = ""
@@ -94,14 +252,23 @@ class Target:
     tool_symbolizer = "llvm-symbolizer"
     tool_cxxfilt = "llvm-cxxfilt"
 
-    def __init__(self, subkernel_id=None):
+    in_memory_tools = hasattr(os, "memfd_create") and os.path.isdir("/dev/fd")
+    in_process_strip = True
+
+    optimizations = ["fast", "default", "aggressive"]
+
+    def __init__(self, subkernel_id=None, optimization="default"):
+        if optimization not in self.optimizations:
+            raise ValueError("Unknown optimization profile: {}".format(optimization))
         self.llcontext = ll.Context()
         self.subkernel_id = subkernel_id
+        self.optimization = optimization
 
     def target_machine(self):
         lltarget = llvm.Target.from_triple(self.triple)
         llmachine = lltarget.create_target_machine(
                         features=",".join(["+{}".format(f) for f in self.features]),
+                        opt={"fast": 1, "default": 2, "aggressive": 3}[self.optimization],
                         reloc="pic", codemodel="default",
                         abiname="ilp32d" if isinstance(self, RV32GTarget) else "")
         llmachine.set_asm_verbosity(True)
@@ -114,6 +281,15 @@ class Target:
         llpassmgr.add_basic_alias_analysis_pass()
         llpassmgr.add_type_based_alias_analysis_pass()
 
+        if self.optimization == "fast":
+            # Only clean up after our codegen.
+            llpassmgr.add_sroa_pass()
+            llpassmgr.add_cfg_simplification_pass()
+            llpassmgr.add_dead_code_elimination_pass()
+            llpassmgr.add_global_dce_pass()
+            llpassmgr.run(llmodule)
+            return
+
         # Start by cleaning up after our codegen and exposing as much
         # information to LLVM as possible.
         llpassmgr.add_constant_merge_pass()
@@ -125,12 +301,20 @@ class Target:
         llpassmgr.add_global_optimizer_pass()
 
         # Now, actually optimize the code.
-        llpassmgr.add_function_inlining_pass(275)
-        llpassmgr.add_ipsccp_pass()
-        llpassmgr.add_instruction_combining_pass()
-        llpassmgr.add_gvn_pass()
-        llpassmgr.add_cfg_simplification_pass()
-        llpassmgr.add_licm_pass()
+        if self.optimization == "aggressive":
+            llpmbuilder = llvm.create_pass_manager_builder()
+            llpmbuilder.opt_level = 3
+            llpmbuilder.inlining_threshold = 1000
+            llpmbuilder.loop_vectorize = True
+            llpmbuilder.slp_vectorize = True
+            llpmbuilder.populate(llpassmgr)
+        else:
+            llpassmgr.add_function_inlining_pass(275)
+            llpassmgr.add_ipsccp_pass()
+            llpassmgr.add_instruction_combining_pass()
+            llpassmgr.add_gvn_pass()
+            llpassmgr.add_cfg_simplification_pass()
+            llpassmgr.add_licm_pass()
 
         # Clean up after optimizing.
         llpassmgr.add_dead_arg_elimination_pass()
@@ -138,8 +322,11 @@ class Target:
 
         llpassmgr.run(llmodule)
 
-    def compile(self, module):
-        """Compile the module to a relocatable object for this target."""
+    def _dump_suffix(self):
+        return "_subkernel_{}".format(self.subkernel_id) if self.subkernel_id is not None else ""
+
+    def generate_llvm_ir(self, module):
+        """Generate the unoptimized LLVM IR of the module for this target."""
 
         if os.getenv("ARTIQ_DUMP_SIG"):
             print("====== MODULE_SIGNATURE DUMP ======", file=sys.stderr)
@@ -149,23 +336,38 @@ class Target:
             ir.BasicBlock._dump_loc = False
 
         type_printer = types.TypePrinter()
-        suffix = "_subkernel_{}".format(self.subkernel_id) if self.subkernel_id is not None else ""
-        _dump(os.getenv("ARTIQ_DUMP_IR"), "ARTIQ IR", suffix + ".txt",
+        _dump(os.getenv("ARTIQ_DUMP_IR"), "ARTIQ IR", self._dump_suffix() + ".txt",
               lambda: "\n".join(fn.as_entity(type_printer) for fn in module.artiq_ir))
 
-        llmod = module.build_llvm_ir(self)
+        with profiler.stage("LLVM IR generation"):
+            return module.build_llvm_ir(self)
+
+    def compile(self, module):
+        """Compile the module to a relocatable object for this target."""
+        llmod = self.generate_llvm_ir(module)
+        with profiler.stage("LLVM IR serialization"):
+            llir = str(llmod)
+        del llmod
+        return self.compile_llvm_ir(llir)
+
+    def compile_llvm_ir(self, llir):
+        """Optimize the textual LLVM IR (``str``) of a module generated by
+        :meth:`generate_llvm_ir`."""
+        suffix = self._dump_suffix()
 
         try:
-            llparsedmod = llvm.parse_assembly(str(llmod))
-            llparsedmod.verify()
+            with profiler.stage("LLVM IR parsing"):
+                llparsedmod = llvm.parse_assembly(llir)
+                llparsedmod.verify()
         except RuntimeError:
-            _dump("", "LLVM IR (broken)", ".ll", lambda: str(llmod))
+            _dump("", "LLVM IR (broken)", ".ll", lambda: llir)
             raise
 
         _dump(os.getenv("ARTIQ_DUMP_UNOPT_LLVM"), "LLVM IR (generated)", suffix + "_unopt.ll",
               lambda: str(llparsedmod))
 
-        self.optimize(llparsedmod)
+        with profiler.stage("LLVM optimization"):
+            self.optimize(llparsedmod)
 
         _dump(os.getenv("ARTIQ_DUMP_LLVM"), "LLVM IR (optimized)", suffix + ".ll",
               lambda: str(llparsedmod))
@@ -181,34 +383,46 @@ class Target:
         _dump(os.getenv("ARTIQ_DUMP_OBJ"), "Object file", ".o",
               lambda: llmachine.emit_object(llmodule))
 
-        return llmachine.emit_object(llmodule)
+        with profiler.stage("machine code emission"):
+            return llmachine.emit_object(llmodule)
 
     def link(self, objects):
         """Link the relocatable objects into a shared library for this target."""
-        with RunTool([self.tool_ld, "-shared", "--eh-frame-hdr"] +
-                     self.additional_linker_options +
-                     ["-T" + os.path.join(os.path.dirname(__file__), "kernel.ld")] +
-                     ["{{obj{}}}".format(index) for index in range(len(objects))] +
-                     ["-x"] +
-                     ["-o", "{output}"],
-                     output=None,
-                     **{"obj{}".format(index): obj for index, obj in enumerate(objects)}) \
-                as results:
-            library = results["output"].read()
+        pattern = ([self.tool_ld, "-shared", "--eh-frame-hdr"] +
+                   self.additional_linker_options +
+                   ["-T" + os.path.join(os.path.dirname(__file__), "kernel.ld")] +
+                   ["{{obj{}}}".format(index) for index in range(len(objects))] +
+                   ["-x"])
+        objects = {"obj{}".format(index): obj for index, obj in enumerate(objects)}
+        with profiler.stage("linking"):
+            if self.in_memory_tools:
+                library = _run_in_memory(pattern + ["-o", "-"], **objects)
+            else:
+                with RunTool(pattern + ["-o", "{output}"], output=None, **objects) \
+                        as results:
+                    library = results["output"].read()
 
-            _dump(os.getenv("ARTIQ_DUMP_ELF"), "Shared library", ".elf",
-                  lambda: library)
+        _dump(os.getenv("ARTIQ_DUMP_ELF"), "Shared library", ".elf",
+              lambda: library)
 
-            return library
+        return library
 
     def compile_and_link(self, modules):
         return self.link([self.assemble(self.compile(module)) for module in modules])
 
     def strip(self, library):
-        with RunTool([self.tool_strip, "--strip-debug", "{library}", "-o", "{output}"],
-                     library=library, output=None) \
-                as results:
-            return results["output"].read()
+        with profiler.stage("stripping"):
+            if self.in_process_strip:
+                stripped = _strip_debug(library)
+                if stripped is not None:
+                    return stripped
+            if self.in_memory_tools:
+                return _run_in_memory([self.tool_strip, "--strip-debug", "{library}", "-o", "-"],
+                                      library=library)
+            with RunTool([self.tool_strip, "--strip-debug", "{library}", "-o", "{output}"],
+                         library=library, output=None) \
+                    as results:
+                return results["output"].read()
 
     def symbolize(self, library, addresses):
         if addresses == []:
@@ -0,0 +1,75 @@
+"""
+Measures the compile time and peak memory usage of kernels embedding host
+lists and arrays of increasing sizes. Each size is compiled in a separate
+process so that its peak resident set size can be measured.
+"""
+
+import sys, subprocess, time, resource
+import numpy
+from ...language.core import kernel
+from ...coredevice.core import Core
+from ..module import Module
+from ..embedding import Stitcher
+from ..targets import RV32GTarget
+
+
+SIZES = [10**2, 10**3, 10**4, 10**5]
+
+
+class _Kernel:
+    def __init__(self, core, size):
+        self.core = core
+        self.array = numpy.linspace(0, 1, size)
+
+    @kernel
+    def run(self, table, waveform):
+        acc = 0
+        for x in table:
+            acc += x
+        for y in waveform:
+            acc += y
+        total = 0.0
+        for z in self.array:
+            total += z
+        return acc + round(total)
+
+
+def compile_size(size):
+    # Stand-in for the device manager; the stitcher only looks up the core.
+    dmgr = dict()
+    core = dmgr["core"] = Core(dmgr=dmgr, host=None, ref_period=1e-9)
+    env = _Kernel(core, size)
+    table = list(range(size))
+    waveform = numpy.arange(size, dtype=numpy.int32)
+
+    start = time.perf_counter()
+    stitcher = Stitcher(core=core, dmgr=dmgr)
+    stitcher.stitch_call(env.run, (table, waveform), {})
+    stitcher.finalize()
+    module = Module(stitcher)
+    target = RV32GTarget()
+    target.assemble(target.compile(module))
+    end = time.perf_counter()
+
+    # ru_maxrss is in kilobytes on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print("{} {:.3f} {:.1f}".format(size, end - start, peak))
+
+
+def main():
+    if len(sys.argv) == 2:
+        compile_size(int(sys.argv[1]))
+        return
+
+    print("| Elements | Compile time (s) | Peak RSS (MiB) |")
+    print("| -------: | ---------------: | -------------: |")
+    for size in SIZES:
+        output = subprocess.run(
+            [sys.executable, "-m", "artiq.compiler.testbench.perf_constant_data",
+             str(size)],
+            check=True, capture_output=True, text=True).stdout
+        size, duration, peak = output.split()
+        print("| {} | {} | {} |".format(size, duration, peak))
+
+if __name__ == "__main__":
+    main()
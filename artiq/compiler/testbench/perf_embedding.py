@@ -4,7 +4,7 @@ from ...language.environment import ProcessArgumentManager
 from ...master.databases import DeviceDB, DatasetDB
 from ...master.worker_db import DeviceManager, DatasetManager
 from ..module import Module
-from ..embedding import Stitcher
+from ..embedding import Stitcher, TypeVarCollector
 from ..targets import RV32GTarget
 from . import benchmark
 
@@ -45,6 +45,15 @@ def main():
         return stitcher
 
     stitcher = embed()
+
+    stats = stitcher.inference_stats
+    collector = TypeVarCollector()
+    collector.visit(stitcher.typedtree)
+    print("Type inference: {} rounds, {} inferences of {} top-level nodes, "
+          "{} AST nodes visited ({} per full pass)".format(
+            stats["rounds"], stats["node_visits"], stats["nodes"],
+            stats["ast_nodes_visited"], collector.node_count))
+
     module = Module(stitcher)
     target = RV32GTarget()
     llvm_ir = target.compile(module)
@@ -69,6 +78,19 @@ def main():
     benchmark(lambda: target.strip(elf_shlib),
               "Stripping debug information")
 
+    target.in_process_strip = False
+    benchmark(lambda: target.strip(elf_shlib),
+              "Stripping debug information (strip tool)")
+
+    if target.in_memory_tools:
+        target.in_memory_tools = False
+
+        benchmark(lambda: target.link([elf_obj]),
+                  "Linking (temporary files)")
+
+        benchmark(lambda: target.strip(elf_shlib),
+                  "Stripping debug information (temporary files)")
+
     dataset_db.close_db()
 
 if __name__ == "__main__":
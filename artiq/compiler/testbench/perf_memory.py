@@ -0,0 +1,81 @@
+"""
+Measures the peak memory allocated by the compiler front-end (parsing,
+inference, ARTIQ transforms and LLVM IR generation) for each module of a
+corpus, by default the lit integration tests. Memory is measured with
+:mod:`tracemalloc` and only covers allocations made by Python.
+
+With ``--max-peak``, exits with a non-zero status if the peak of any module
+exceeds the given number of KiB, so that regressions can be caught in CI.
+"""
+
+import sys, os, glob, time, argparse, tracemalloc
+from pythonparser import diagnostic
+from ..module import Module, Source
+from ..targets import RV32GTarget
+
+
+def default_corpus():
+    lit_dir = os.path.join(os.path.dirname(__file__), "..", "..", "test", "lit")
+    return sorted(glob.glob(os.path.join(lit_dir, "integration", "*.py")))
+
+
+def get_argparser():
+    parser = argparse.ArgumentParser(
+        description="Peak memory usage of the compiler front-end")
+    parser.add_argument("--max-peak", type=float, default=None, metavar="KIB",
+                        help="fail if the peak of any module exceeds KIB")
+    parser.add_argument("files", nargs="*",
+                        help="modules to compile (default: lit integration tests)")
+    return parser
+
+
+def measure(filename):
+    def process_diagnostic(diag):
+        if diag.level in ("fatal", "error"):
+            raise diagnostic.Error(diag)
+
+    engine = diagnostic.Engine()
+    engine.process = process_diagnostic
+
+    with open(filename) as f:
+        code = f.read()
+
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        module = Module(Source.from_string(code, filename, engine=engine))
+        RV32GTarget().compile(module)
+        duration = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return duration, peak
+
+
+def main():
+    args = get_argparser().parse_args()
+    files = args.files or default_corpus()
+
+    print("| Module | Time (ms) | Peak memory (KiB) |")
+    print("| ------ | --------: | ----------------: |")
+    total_peak = 0
+    max_peak = 0
+    for filename in files:
+        try:
+            duration, peak = measure(filename)
+        except diagnostic.Error as error:
+            print("\n".join(error.diagnostic.render()), file=sys.stderr)
+            continue
+        print("| {} | {:.1f} | {:.1f} |".format(
+            os.path.basename(filename), duration * 1000, peak / 1024))
+        total_peak += peak
+        max_peak = max(max_peak, peak)
+    print("| total | | {:.1f} |".format(total_peak / 1024))
+
+    if args.max_peak is not None and max_peak / 1024 > args.max_peak:
+        print("Peak memory {:.1f} KiB exceeds limit of {:.1f} KiB".format(
+            max_peak / 1024, args.max_peak), file=sys.stderr)
+        exit(1)
+
+if __name__ == "__main__":
+    main()
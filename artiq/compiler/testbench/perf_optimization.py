@@ -0,0 +1,63 @@
+"""
+Compares the compile time of a kernel with the size of its code for each
+optimization profile. The module must define a ``Benchmark`` experiment,
+like for :mod:`artiq.compiler.testbench.perf_embedding`.
+"""
+
+import sys, os, time, tokenize
+from llvmlite import binding as llvm
+from ...language.environment import ProcessArgumentManager
+from ...master.databases import DeviceDB, DatasetDB
+from ...master.worker_db import DeviceManager, DatasetManager
+from ..module import Module
+from ..embedding import Stitcher
+from ..targets import RV32GTarget
+
+
+def text_size(obj):
+    return sum(section.size() for section in llvm.ObjectFileRef.from_data(obj).sections()
+               if section.is_text())
+
+
+def main():
+    if not len(sys.argv) == 2:
+        print("Expected exactly one module filename", file=sys.stderr)
+        exit(1)
+
+    with tokenize.open(sys.argv[1]) as f:
+        testcase_code = compile(f.read(), f.name, "exec")
+        testcase_vars = {'__name__': 'testbench'}
+        exec(testcase_code, testcase_vars)
+
+    device_db_path = os.path.join(os.path.dirname(sys.argv[1]), "device_db.py")
+    device_mgr = DeviceManager(DeviceDB(device_db_path))
+
+    dataset_db_path = os.path.join(os.path.dirname(sys.argv[1]), "dataset_db.mdb")
+    dataset_db = DatasetDB(dataset_db_path)
+    dataset_mgr = DatasetManager(dataset_db)
+
+    argument_mgr = ProcessArgumentManager({})
+
+    experiment = testcase_vars["Benchmark"]((device_mgr, dataset_mgr, argument_mgr, {}))
+    stitcher = Stitcher(core=experiment.core, dmgr=device_mgr)
+    stitcher.stitch_call(experiment.run, (), {})
+    stitcher.finalize()
+    module = Module(stitcher)
+
+    print("| Profile | Compile time (ms) | Code size (bytes) |")
+    print("| ------- | ----------------: | ----------------: |")
+    for optimization in RV32GTarget.optimizations:
+        target = RV32GTarget(optimization=optimization)
+        runs = 0
+        start = end = time.perf_counter()
+        while end - start < 5 or runs < 5:
+            obj = target.assemble(target.compile(module))
+            runs += 1
+            end = time.perf_counter()
+        print("| {} | {:.1f} | {} |".format(
+            optimization, (end - start) / runs * 1000, text_size(obj)))
+
+    dataset_db.close_db()
+
+if __name__ == "__main__":
+    main()
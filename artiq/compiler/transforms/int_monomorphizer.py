@@ -26,3 +26,22 @@ class IntMonomorphizer(algorithm.Visitor):
                     return
 
                 node.type["width"].unify(types.TValue(width))
+
+    def visit_QuoteT(self, node):
+        # Integer lists quoted as constant data by the embedding stage.
+        if builtins.is_list(node.type) and builtins.is_int(node.type["elt"]):
+            elt_type = node.type["elt"].find()
+            if types.is_var(elt_type["width"]):
+                low, high = min(node.value), max(node.value)
+                if -2**31 <= low and high <= 2**31-1:
+                    width = 32
+                elif -2**63 <= low and high <= 2**63-1:
+                    width = 64
+                else:
+                    diag = diagnostic.Diagnostic("error",
+                        "integer literal out of range for a signed 64-bit value", {},
+                        node.loc)
+                    self.engine.process(diag)
+                    return
+
+                elt_type["width"].unify(types.TValue(width))
@@ -1876,23 +1876,10 @@ class LLVMIRGenerator:
 
     def _quote_listish_to_llglobal(self, value, elt_type, path, kind_name):
         fail_msg = "at " + ".".join(path())
-        if len(value) > 0:
-            if builtins.is_int(elt_type):
-                int_typ = (int, numpy.int32, numpy.int64)
-                for v in value:
-                    assert isinstance(v, int_typ), fail_msg
-                llty = self.llty_of_type(elt_type)
-                llelts = [ll.Constant(llty, int(v)) for v in value]
-            elif builtins.is_float(elt_type):
-                for v in value:
-                    assert isinstance(v, float), fail_msg
-                llty = self.llty_of_type(elt_type)
-                llelts = [ll.Constant(llty, v) for v in value]
-            else:
-                llelts = [self._quote(value[i], elt_type, lambda: path() + [str(i)])
-                          for i in range(len(value))]
-        else:
-            llelts = []
+        if builtins.is_int(elt_type) or builtins.is_float(elt_type):
+            return self._quote_numeric_to_llglobal(value, elt_type, fail_msg, kind_name)
+        llelts = [self._quote(value[i], elt_type, lambda: path() + [str(i)])
+                  for i in range(len(value))]
         lleltsary = ll.Constant(ll.ArrayType(self.llty_of_type(elt_type), len(llelts)),
                                 list(llelts))
         name = self.llmodule.scope.deduplicate("quoted.{}".format(kind_name))
@@ -1901,6 +1888,33 @@ class LLVMIRGenerator:
         llglobal.linkage = "private"
         return llglobal.bitcast(lleltsary.type.element.as_pointer())
 
+    def _quote_numeric_to_llglobal(self, value, elt_type, fail_msg, kind_name):
+        # Numeric elements are emitted as a single blob of bytes in the target
+        # byte order rather than as one LLVM constant each, which is much
+        # faster to generate and parse for large lists and arrays.
+        if builtins.is_int(elt_type):
+            if not (isinstance(value, numpy.ndarray) and value.dtype.kind == "i"):
+                int_typ = (int, numpy.int32, numpy.int64)
+                for v in value:
+                    assert isinstance(v, int_typ), fail_msg
+            dtype = "i{}".format(builtins.get_int_width(elt_type) // 8)
+        else:
+            if not (isinstance(value, numpy.ndarray) and value.dtype.kind == "f"):
+                for v in value:
+                    assert isinstance(v, float), fail_msg
+            dtype = "f8"
+        byteorder = ">" if self.llmodule.data_layout.startswith("E") else "<"
+        data = numpy.asarray(value, dtype=byteorder + dtype).tobytes()
+
+        llty = self.llty_of_type(elt_type)
+        lldata = ll.Constant(ll.ArrayType(lli8, len(data)), bytearray(data))
+        name = self.llmodule.scope.deduplicate("quoted.{}".format(kind_name))
+        llglobal = ll.GlobalVariable(self.llmodule, lldata.type, name)
+        llglobal.initializer = lldata
+        llglobal.linkage = "private"
+        llglobal.align = llty.get_abi_alignment(self.lldatalayout)
+        return llglobal.bitcast(llty.as_pointer())
+
     def _quote_attributes(self, value, typ, path, value_id, llty):
         llglobal = None
         llfields = []
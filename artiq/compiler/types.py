@@ -43,6 +43,10 @@ def _map_find(elts):
 
 
 class Type(object):
+    # Type objects are allocated in large numbers during inference; the
+    # common ones below declare their fields in __slots__ to keep them small.
+    __slots__ = ()
+
     def __str__(self):
         return TypePrinter().name(self)
 
@@ -54,6 +58,8 @@ class TVar(Type):
     folded into this class.
     """
 
+    __slots__ = ("parent", "rank")
+
     def __init__(self):
         self.parent = self
         self.rank = 0
@@ -66,10 +72,15 @@ class TVar(Type):
             # The recursive find() invocation is turned into a loop
             # because paths resulting from unification of large arrays
             # can easily cause a stack overflow.
-            root = self
-            while parent.__class__ == TVar and root is not parent:
-                _, parent = root, root.parent = parent, parent.parent
-            return root.parent
+            root = parent
+            while root.__class__ == TVar and root.parent is not root:
+                root = root.parent
+            # Path compression: point every variable on the path directly
+            # at the representative, so that later lookups are O(1).
+            var = self
+            while var is not root:
+                var.parent, var = root, var.parent
+            return root
 
     def unify(self, other):
         if other is self:
@@ -118,6 +129,8 @@ class TMono(Type):
     as that will break the type-sniffing code in :mod:`builtins`.
     """
 
+    __slots__ = ("name", "params")
+
     attributes = OrderedDict()
 
     def __init__(self, name, params={}):
@@ -170,6 +183,8 @@ class TTuple(Type):
     :ivar elts: (list of :class:`Type`) elements
     """
 
+    __slots__ = ("elts",)
+
     attributes = OrderedDict()
 
     def __init__(self, elts=[]):
@@ -210,6 +225,8 @@ class TTuple(Type):
         return hash(tuple(self.elts))
 
 class _TPointer(TMono):
+    __slots__ = ()
+
     def __init__(self, elt=None):
         if elt is None:
             elt = TMono("int", {"width": 8})  # i8*
@@ -229,6 +246,8 @@ class TFunction(Type):
         RTIO delay
     """
 
+    __slots__ = ("args", "optargs", "ret", "delay")
+
     attributes = OrderedDict([
         ('__closure__', _TPointer()),
         ('__code__',    _TPointer()),
@@ -555,6 +574,8 @@ class TValue(Type):
     a generic integer type.
     """
 
+    __slots__ = ("value",)
+
     def __init__(self, value):
         self.value = value
 
@@ -10,6 +10,8 @@ import logging
 import socket
 import math
 
+import numpy
+
 
 logger = logging.getLogger(__name__)
 
@@ -99,6 +101,86 @@ def decode_message(data):
         raise ValueError
 
 
+# Layout of the (big endian) messages sent by the analyzer.
+_record_dtype = numpy.dtype({
+    "names": ["data", "address", "rtio_counter", "timestamp", "type_channel"],
+    "formats": [">u8", ">u4", ">u8", ">u8", ">u4"],
+    "offsets": [0, 8, 12, 20, 28],
+    "itemsize": 32})
+
+# Decoded messages. Exception and stopped messages have their RTIO counter
+# as timestamp, so that messages can be sorted by timestamp, and exception
+# messages have the exception type as data. Fields are aligned, which
+# makes accessing them faster.
+message_dtype = numpy.dtype({
+    "names": ["type", "channel", "timestamp", "rtio_counter", "address", "data"],
+    "formats": ["u1", "u4", "u8", "u8", "u4", "u8"],
+    "offsets": [32, 24, 0, 8, 28, 16],
+    "itemsize": 40})
+
+
+def _to_message(type, channel, timestamp, rtio_counter, address, data):
+    if type == MessageType.output.value:
+        return OutputMessage(channel, timestamp, rtio_counter, address, data)
+    elif type == MessageType.input.value:
+        return InputMessage(channel, timestamp, rtio_counter, data)
+    elif type == MessageType.exception.value:
+        return ExceptionMessage(channel, rtio_counter, ExceptionType(data))
+    else:
+        return StoppedMessage(rtio_counter)
+
+
+class MessageArray:
+    """Sequence of analyzer messages, stored in a numpy structured array
+    (:attr:`array`, of dtype :data:`message_dtype`). Messages are converted
+    to :class:`OutputMessage`, :class:`InputMessage`,
+    :class:`ExceptionMessage` or :class:`StoppedMessage` when accessed."""
+    def __init__(self, array):
+        self.array = array
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, index):
+        if isinstance(index, (slice, numpy.ndarray)):
+            return MessageArray(self.array[index])
+        return _to_message(*self.array[index].item())
+
+    def __iter__(self):
+        columns = [self.array[name].tolist() for name in message_dtype.names]
+        for fields in zip(*columns):
+            yield _to_message(*fields)
+
+    def sort_by_time(self):
+        """Returns the messages sorted by time, keeping the order of
+        simultaneous messages (like ``sorted`` with :func:`get_message_time`)."""
+        order = numpy.argsort(self.array["timestamp"], kind="stable")
+        return MessageArray(numpy.take(self.array, order))
+
+
+def decode_messages(data):
+    """Decodes the messages of an analyzer dump into a :class:`MessageArray`."""
+    records = numpy.frombuffer(data, _record_dtype, count=len(data)//32)
+    messages = numpy.empty(len(records), message_dtype)
+
+    type_channel = records["type_channel"]
+    types = (type_channel & 0b11).astype("u1")
+    messages["type"] = types
+    messages["channel"] = type_channel >> 2
+    messages["rtio_counter"] = records["rtio_counter"]
+    timed = types <= MessageType.input.value
+    messages["timestamp"] = numpy.where(timed, records["timestamp"], records["rtio_counter"])
+    messages["address"] = numpy.where(types == MessageType.output.value, records["address"], 0)
+    exceptions = types == MessageType.exception.value
+    # The exception type is the last byte of the address field.
+    exception_types = records["address"] & 0xff
+    if not numpy.isin(exception_types[exceptions], [t.value for t in ExceptionType]).all():
+        raise ValueError("analyzer dump has unknown exception types")
+    messages["data"] = numpy.where(exceptions, exception_types,
+                                   numpy.where(timed, records["data"], 0))
+    return MessageArray(messages)
+
+
 DecodedDump = namedtuple(
     "DecodedDump", "log_channel dds_onehot_sel messages")
 
@@ -134,13 +216,10 @@ def decode_dump(data):
     if sent_bytes == 0:
         logger.warning("analyzer dump is empty")
 
-    position = 15
-    messages = []
-    for _ in range(sent_bytes//32):
-        messages.append(decode_message(data[position:position+32]))
-        position += 32
+    messages = decode_messages(data[15:])
 
-    if len(messages) == 1 and isinstance(messages[0], StoppedMessage):
+    if (len(messages) == 1 and
+            messages.array["type"][0] == MessageType.stopped.value):
         logger.warning("analyzer dump is empty aside from stop message")
 
     return DecodedDump(log_channel, bool(dds_onehot_sel), messages)
@@ -728,12 +807,18 @@ def decoded_dump_to_target(manager, devices, dump, uniform_interval):
         logger.warning("unable to determine DDS sysclk")
         dds_sysclk = 3e9  # guess
 
-    messages = sorted(dump.messages, key=get_message_time)
+    if isinstance(dump.messages, MessageArray):
+        messages = dump.messages.sort_by_time()
+        log_messages = messages[(messages.array["type"] == MessageType.output.value) &
+                                (messages.array["channel"] == dump.log_channel)]
+    else:
+        messages = sorted(dump.messages, key=get_message_time)
+        log_messages = messages
 
     channel_handlers = create_channel_handlers(
         manager, devices, ref_period,
         dds_sysclk, dump.dds_onehot_sel)
-    log_channels = get_log_channels(dump.log_channel, messages)
+    log_channels = get_log_channels(dump.log_channel, log_messages)
     channel_handlers[dump.log_channel] = LogHandler(
         manager, log_channels)
     if uniform_interval:
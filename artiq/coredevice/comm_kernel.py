@@ -4,9 +4,12 @@ import traceback
 import numpy
 import socket
 import builtins
+import threading
+import concurrent.futures
 from enum import Enum
 from fractions import Fraction
-from collections import namedtuple
+from collections import namedtuple, deque
+from itertools import chain
 
 from artiq.coredevice import exceptions
 from artiq import __version__ as software_version
@@ -74,7 +77,7 @@ def _receive_list(kernel, embedding_map):
         return list(struct.unpack(kernel.endian + "%sl" % length, buffer))
     elif tag == "I":
         buffer = kernel._read(8 * length)
-        return list(numpy.ndarray((length, ), kernel.endian + 'i8', buffer))
+        return list(numpy.frombuffer(buffer, kernel.endian + 'i8'))
     elif tag == "f":
         buffer = kernel._read(8 * length)
         return list(struct.unpack(kernel.endian + "%sd" % length, buffer))
@@ -96,18 +99,19 @@ def _receive_array(kernel, embedding_map):
     tag = chr(kernel._read_int8())
     fn = receivers[tag]
     length = numpy.prod(shape)
+    # The elements are received directly into the memory of the array.
     if tag == "b":
-        buffer = kernel._read(length)
-        elems = numpy.ndarray((length, ), '?', buffer)
+        buffer = kernel._read_owned(length)
+        elems = numpy.frombuffer(buffer, '?')
     elif tag == "i":
-        buffer = kernel._read(4 * length)
-        elems = numpy.ndarray((length, ), kernel.endian + 'i4', buffer)
+        buffer = kernel._read_owned(4 * length)
+        elems = numpy.frombuffer(buffer, kernel.endian + 'i4')
     elif tag == "I":
-        buffer = kernel._read(8 * length)
-        elems = numpy.ndarray((length, ), kernel.endian + 'i8', buffer)
+        buffer = kernel._read_owned(8 * length)
+        elems = numpy.frombuffer(buffer, kernel.endian + 'i8')
     elif tag == "f":
-        buffer = kernel._read(8 * length)
-        elems = numpy.ndarray((length, ), kernel.endian + 'd', buffer)
+        buffer = kernel._read_owned(8 * length)
+        elems = numpy.frombuffer(buffer, kernel.endian + 'd')
     else:
         fn = receivers[tag]
         elems = []
@@ -156,6 +160,201 @@ receivers = {
 }
 
 
+def _type_mismatch(value, expected, root, function):
+    return RPCReturnValueError(
+        "type mismatch: cannot serialize {value} as {type}"
+        " ({function} has returned {root})".format(
+            value=repr(value), type=expected,
+            function=function, root=root))
+
+
+# Element tags of lists and arrays that are sent as a packed sequence, with
+# their struct format character.
+_packed_formats = {"b": "?", "i": "l", "I": "q", "f": "d"}
+
+# Types accepted for the fields of tuples sent as a packed sequence; ranges
+# are checked by struct.
+_packed_types = {"b": bool, "i": (int, numpy.int32),
+                 "I": (int, numpy.int32, numpy.int64), "f": float}
+
+
+def _compile_encoder(tags, index, endian):
+    # Compiles the type tags starting at ``tags[index]`` (see rpc_proto.rs and
+    # compiler/ir.py:rpc_tag) into a function ``encode(buffer, value, root,
+    # function)`` that appends ``value`` to ``buffer``. Returns the function
+    # and the index of the tags that follow.
+    tag = chr(tags[index])
+    index += 1
+    pack_int32 = struct.Struct(endian + "l").pack
+    pack_int64 = struct.Struct(endian + "q").pack
+    pack_float64 = struct.Struct(endian + "d").pack
+
+    if tag == "t":
+        length = tags[index]
+        index += 1
+        elements = []
+        for _ in range(length):
+            element, index = _compile_encoder(tags, index, endian)
+            elements.append(element)
+        def encode(buffer, value, root, function):
+            if not (isinstance(value, tuple) and length == len(value)):
+                raise _type_mismatch(value, "tuple of {}".format(length), root, function)
+            for element, elt in zip(elements, value):
+                element(buffer, elt, root, function)
+    elif tag == "n":
+        def encode(buffer, value, root, function):
+            if value is not None:
+                raise _type_mismatch(value, "None", root, function)
+    elif tag == "b":
+        def encode(buffer, value, root, function):
+            if not isinstance(value, bool):
+                raise _type_mismatch(value, "bool", root, function)
+            buffer += b"\x01" if value else b"\x00"
+    elif tag == "i":
+        def encode(buffer, value, root, function):
+            if not (isinstance(value, (int, numpy.int32)) and
+                    (-2**31 <= value <= 2**31-1)):
+                raise _type_mismatch(value, "32-bit int", root, function)
+            buffer += pack_int32(value)
+    elif tag == "I":
+        def encode(buffer, value, root, function):
+            if not (isinstance(value, (int, numpy.int32, numpy.int64)) and
+                    (-2**63 <= value <= 2**63-1)):
+                raise _type_mismatch(value, "64-bit int", root, function)
+            buffer += pack_int64(value)
+    elif tag == "f":
+        def encode(buffer, value, root, function):
+            if not isinstance(value, float):
+                raise _type_mismatch(value, "float", root, function)
+            buffer += pack_float64(value)
+    elif tag == "F":
+        def encode(buffer, value, root, function):
+            if not (isinstance(value, Fraction) and
+                    (-2**63 <= value.numerator <= 2**63-1) and
+                    (-2**63 <= value.denominator <= 2**63-1)):
+                raise _type_mismatch(value, "64-bit Fraction", root, function)
+            buffer += pack_int64(value.numerator)
+            buffer += pack_int64(value.denominator)
+    elif tag == "s":
+        def encode(buffer, value, root, function):
+            if not (isinstance(value, str) and "\x00" not in value):
+                raise _type_mismatch(value, "str", root, function)
+            value = value.encode("utf-8")
+            buffer += pack_int32(len(value))
+            buffer += value
+    elif tag in "BA":
+        expected_type = bytes if tag == "B" else bytearray
+        def encode(buffer, value, root, function):
+            if not isinstance(value, expected_type):
+                raise _type_mismatch(value, expected_type.__name__, root, function)
+            buffer += pack_int32(len(value))
+            buffer += value
+    elif tag == "l":
+        element_tag = chr(tags[index])
+        element_index = index
+        element, index = _compile_encoder(tags, index, endian)
+        encode_elements = _compile_list_encoder(element_tag, element, tags, element_index, endian)
+        def encode(buffer, value, root, function):
+            if not isinstance(value, list):
+                raise _type_mismatch(value, "list", root, function)
+            buffer += pack_int32(len(value))
+            encode_elements(buffer, value, root, function)
+    elif tag == "a":
+        num_dims = tags[index]
+        element_tag = chr(tags[index + 1])
+        element, index = _compile_encoder(tags, index + 1, endian)
+        if element_tag == "b":
+            def encode_elements(buffer, value, root, function):
+                buffer += value.reshape((-1,), order="C").tobytes()
+        elif element_tag in "iIf":
+            dtype = endian + {"i": "i4", "I": "i8", "f": "d"}[element_tag]
+            def encode_elements(buffer, value, root, function):
+                buffer += value.reshape((-1,), order="C").astype(dtype).tobytes()
+        else:
+            def encode_elements(buffer, value, root, function):
+                for elt in value.reshape((-1,), order="C"):
+                    element(buffer, elt, root, function)
+        def encode(buffer, value, root, function):
+            if not isinstance(value, numpy.ndarray):
+                raise _type_mismatch(value, "numpy.ndarray", root, function)
+            if num_dims != len(value.shape):
+                raise _type_mismatch(value, "{}-dimensional numpy.ndarray".format(num_dims),
+                                     root, function)
+            for s in value.shape:
+                buffer += pack_int32(s)
+            encode_elements(buffer, value, root, function)
+    elif tag == "r":
+        element, index = _compile_encoder(tags, index, endian)
+        def encode(buffer, value, root, function):
+            if not isinstance(value, range):
+                raise _type_mismatch(value, "range", root, function)
+            element(buffer, value.start, root, function)
+            element(buffer, value.stop, root, function)
+            element(buffer, value.step, root, function)
+    else:
+        raise IOError("Unknown RPC value tag: {}".format(repr(tag)))
+    return encode, index
+
+
+def _compile_list_encoder(element_tag, element, tags, index, endian):
+    def encode_each(buffer, value, root, function):
+        for elt in value:
+            element(buffer, elt, root, function)
+
+    if element_tag == "t":
+        fields = [chr(field) for field in tags[index + 2:index + 2 + tags[index + 1]]]
+
+    if element_tag == "b":
+        def encode(buffer, value, root, function):
+            buffer += bytes(value)
+    elif element_tag in "iI":
+        width = "32" if element_tag == "i" else "64"
+        list_format = endian + "%s" + _packed_formats[element_tag]
+        def encode(buffer, value, root, function):
+            try:
+                buffer += struct.pack(list_format % len(value), *value)
+            except struct.error:
+                raise RPCReturnValueError(
+                    "type mismatch: cannot serialize {value} as {type}".format(
+                        value=repr(value), type=width + "-bit integer list"))
+    elif element_tag == "f":
+        def encode(buffer, value, root, function):
+            buffer += struct.pack(endian + "%sd" % len(value), *value)
+    elif element_tag == "t" and all(field in _packed_formats for field in fields):
+        # Tuples of numbers are packed all at once; lists that do not fit
+        # go through the generic path, which reports mismatches.
+        width = len(fields)
+        item_format = "".join(_packed_formats[field] for field in fields)
+        field_types = [_packed_types[field] for field in fields]
+        def encode(buffer, value, root, function):
+            if all(type(elt) is tuple and len(elt) == width for elt in value):
+                flat = list(chain.from_iterable(value))
+                if all(all(isinstance(x, accepted) for x in flat[i::width])
+                       for i, accepted in enumerate(field_types)):
+                    try:
+                        buffer += struct.pack(endian + item_format * len(value), *flat)
+                        return
+                    except struct.error:
+                        pass
+            encode_each(buffer, value, root, function)
+    else:
+        encode = encode_each
+    return encode
+
+
+_encoders = {}
+
+
+def _get_encoder(tags, endian):
+    # Encoders are compiled once for each RPC return type.
+    key = (bytes(tags), endian)
+    encoder = _encoders.get(key)
+    if encoder is None:
+        encoder, _ = _compile_encoder(key[0], 0, endian)
+        _encoders[key] = encoder
+    return encoder
+
+
 class CommKernelDummy:
     def __init__(self):
         pass
@@ -184,16 +383,41 @@ def incompatible_versions(v1, v2):
 
 
 class CommKernel:
+    """
+    :param async_rpc_workers: number of threads executing async RPCs while
+        the kernel keeps running. With the default (0), they are executed
+        before the next message from the core device is read, so that a slow
+        RPC can stall the kernel. With 1, they are executed in order by a
+        background thread; with more, RPCs to the same function are executed
+        in order, but RPCs to different functions may run concurrently.
+        Synchronous RPCs wait for the async RPCs before them, and
+        :meth:`serve` waits for all of them before returning and raises the
+        first exception they raised, if any.
+    """
     warned_of_mismatch = False
 
-    def __init__(self, host, port=1381):
+    # Size of the receive buffer. Larger reads bypass it.
+    read_buffer_size = 65536
+
+    def __init__(self, host, port=1381, async_rpc_workers=0):
         self._read_type = None
         self.host = host
         self.port = port
-        self.read_buffer = bytearray()
+        self.async_rpc_workers = async_rpc_workers
+        self._async_rpc_executor = None
+        self._async_rpc_lock = threading.Lock()
+        # Calls waiting for execution, keyed by service ID (or None if
+        # all calls are ordered), and futures of the tasks executing them.
+        self._async_rpc_queues = {}
+        self._async_rpc_tasks = {}
+        self._async_rpc_exceptions = []
+        # Received data that has not been read yet is kept in
+        # read_buffer[read_start:read_end].
+        self.read_buffer = bytearray(self.read_buffer_size)
+        self.read_view = memoryview(self.read_buffer)
+        self.read_start = self.read_end = 0
         self.write_buffer = bytearray()
 
-
     def open(self):
         if hasattr(self, "socket"):
             return
@@ -201,14 +425,17 @@ class CommKernel:
         self.socket.sendall(b"ARTIQ coredev\n")
         endian = self._read(1)
         if endian == b"e":
-            self.endian = "<"
+            self._set_endian("<")
         elif endian == b"E":
-            self.endian = ">"
+            self._set_endian(">")
         else:
             raise IOError("Incorrect reply from device: expected e/E.")
-        self.unpack_int32 = struct.Struct(self.endian + "l").unpack
-        self.unpack_int64 = struct.Struct(self.endian + "q").unpack
-        self.unpack_float64 = struct.Struct(self.endian + "d").unpack
+
+    def _set_endian(self, endian):
+        self.endian = endian
+        self.unpack_int32 = struct.Struct(self.endian + "l").unpack_from
+        self.unpack_int64 = struct.Struct(self.endian + "q").unpack_from
+        self.unpack_float64 = struct.Struct(self.endian + "d").unpack_from
 
         self.pack_header = struct.Struct(self.endian + "lB").pack
         self.pack_int8 = struct.Struct(self.endian + "B").pack
@@ -217,6 +444,9 @@ class CommKernel:
         self.pack_float64 = struct.Struct(self.endian + "d").pack
 
     def close(self):
+        if self._async_rpc_executor is not None:
+            self._async_rpc_executor.shutdown()
+            self._async_rpc_executor = None
         if not hasattr(self, "socket"):
             return
         self.socket.close()
@@ -227,21 +457,54 @@ class CommKernel:
     # Reader interface
     #
 
-    def _read(self, length):
-        # cache the reads to avoid frequent call to recv
-        while len(self.read_buffer) < length:
-            # the number is just the maximum amount
+    def _recv_into(self, view, length):
+        # Receives at least `length` bytes into `view`, and returns the number
+        # of bytes received.
+        if length > 8192:
+            received = self.socket.recv_into(view, length, socket.MSG_WAITALL)
+        else:
+            # the view is just the maximum amount
             # when there is not much data, it would return earlier
-            diff = length - len(self.read_buffer)
-            flag = 0
-            if diff > 8192:
-                flag |= socket.MSG_WAITALL
-            new_buffer = self.socket.recv(8192, flag)
-            if not new_buffer:
-                raise ConnectionResetError("Core device connection closed unexpectedly")
-            self.read_buffer += new_buffer
-        result = self.read_buffer[:length]
-        self.read_buffer = self.read_buffer[length:]
+            received = self.socket.recv_into(view)
+        if not received:
+            raise ConnectionResetError("Core device connection closed unexpectedly")
+        return received
+
+    def _consume(self, length):
+        # Returns the offset in read_buffer of the next `length` bytes, which
+        # must fit in the buffer, receiving them first if necessary.
+        available = self.read_end - self.read_start
+        if available < length:
+            if self.read_start + length > len(self.read_buffer):
+                # Move the unread data to the front of the buffer.
+                self.read_buffer[:available] = bytes(self.read_view[self.read_start:self.read_end])
+                self.read_start, self.read_end = 0, available
+            while self.read_end - self.read_start < length:
+                self.read_end += self._recv_into(
+                    self.read_view[self.read_end:],
+                    length - (self.read_end - self.read_start))
+        start = self.read_start
+        self.read_start += length
+        return start
+
+    def _read(self, length):
+        # Returns a view that is only valid until the next read.
+        if length > len(self.read_buffer):
+            return self._read_owned(length)
+        start = self._consume(length)
+        return self.read_view[start:start + length]
+
+    def _read_owned(self, length):
+        # Returns a new bytearray. Large reads are received directly into it.
+        if length <= len(self.read_buffer):
+            return bytearray(self._read(length))
+        result = bytearray(length)
+        view = memoryview(result)
+        position = min(length, self.read_end - self.read_start)
+        view[:position] = self.read_view[self.read_start:self.read_start + position]
+        self.read_start += position
+        while position < length:
+            position += self._recv_into(view[position:], length - position)
         return result
 
     def _read_header(self):
@@ -250,14 +513,14 @@ class CommKernel:
         # Wait for a synchronization sequence, 5a 5a 5a 5a.
         sync_count = 0
         while sync_count < 4:
-            sync_byte = self._read(1)[0]
+            sync_byte = self._read_int8()
             if sync_byte == 0x5a:
                 sync_count += 1
             else:
                 sync_count = 0
 
         # Read message header.
-        raw_type = self._read(1)[0]
+        raw_type = self._read_int8()
         self._read_type = Reply(raw_type)
 
         logger.debug("receiving message: type=%r",
@@ -273,28 +536,28 @@ class CommKernel:
         self._read_expect(ty)
 
     def _read_int8(self):
-        return self._read(1)[0]
+        return self.read_buffer[self._consume(1)]
 
     def _read_int32(self):
-        (value, ) = self.unpack_int32(self._read(4))
+        (value, ) = self.unpack_int32(self.read_buffer, self._consume(4))
         return value
 
     def _read_int64(self):
-        (value, ) = self.unpack_int64(self._read(8))
+        (value, ) = self.unpack_int64(self.read_buffer, self._consume(8))
         return value
 
     def _read_float64(self):
-        (value, ) = self.unpack_float64(self._read(8))
+        (value, ) = self.unpack_float64(self.read_buffer, self._consume(8))
         return value
 
     def _read_bool(self):
         return True if self._read_int8() else False
 
     def _read_bytes(self):
-        return self._read(self._read_int32())
+        return self._read_owned(self._read_int32())
 
     def _read_string(self):
-        return self._read_bytes().decode("utf-8")
+        return str(self._read(self._read_int32()), "utf-8")
 
     #
     # Writer interface
@@ -357,7 +620,7 @@ class CommKernel:
 
         self._read_header()
         self._read_expect(Reply.SystemInfo)
-        runtime_id = self._read(4)
+        runtime_id = bytes(self._read(4))
         if runtime_id == b"AROR":
             gateware_version = self._read_string().split(";")[0]
             if not self.warned_of_mismatch and incompatible_versions(gateware_version, software_version):
@@ -425,147 +688,53 @@ class CommKernel:
             else:
                 args.append(value)
 
-    def _skip_rpc_value(self, tags):
-        tag = chr(tags.pop(0))
-        if tag == "t":
-            length = tags.pop(0)
-            for _ in range(length):
-                self._skip_rpc_value(tags)
-        elif tag == "l":
-            self._skip_rpc_value(tags)
-        elif tag == "r":
-            self._skip_rpc_value(tags)
-        elif tag == "a":
-            _ndims = tags.pop(0)
-            self._skip_rpc_value(tags)
-        else:
-            pass
-
     def _send_rpc_value(self, tags, value, root, function):
-        def check(cond, expected):
-            if not cond:
-                raise RPCReturnValueError(
-                    "type mismatch: cannot serialize {value} as {type}"
-                    " ({function} has returned {root})".format(
-                        value=repr(value), type=expected(),
-                        function=function, root=root))
-
-        tag = chr(tags.pop(0))
-        if tag == "t":
-            length = tags.pop(0)
-            check(isinstance(value, tuple) and length == len(value),
-                  lambda: "tuple of {}".format(length))
-            for elt in value:
-                self._send_rpc_value(tags, elt, root, function)
-        elif tag == "n":
-            check(value is None,
-                  lambda: "None")
-        elif tag == "b":
-            check(isinstance(value, bool),
-                  lambda: "bool")
-            self._write_bool(value)
-        elif tag == "i":
-            check(isinstance(value, (int, numpy.int32)) and
-                  (-2**31 <= value <= 2**31-1),
-                  lambda: "32-bit int")
-            self._write_int32(value)
-        elif tag == "I":
-            check(isinstance(value, (int, numpy.int32, numpy.int64)) and
-                  (-2**63 <= value <= 2**63-1),
-                  lambda: "64-bit int")
-            self._write_int64(value)
-        elif tag == "f":
-            check(isinstance(value, float),
-                  lambda: "float")
-            self._write_float64(value)
-        elif tag == "F":
-            check(isinstance(value, Fraction) and
-                  (-2**63 <= value.numerator <= 2**63-1) and
-                  (-2**63 <= value.denominator <= 2**63-1),
-                  lambda: "64-bit Fraction")
-            self._write_int64(value.numerator)
-            self._write_int64(value.denominator)
-        elif tag == "s":
-            check(isinstance(value, str) and "\x00" not in value,
-                  lambda: "str")
-            self._write_string(value)
-        elif tag == "B":
-            check(isinstance(value, bytes),
-                  lambda: "bytes")
-            self._write_bytes(value)
-        elif tag == "A":
-            check(isinstance(value, bytearray),
-                  lambda: "bytearray")
-            self._write_bytes(value)
-        elif tag == "l":
-            check(isinstance(value, list),
-                  lambda: "list")
-            self._write_int32(len(value))
-            tag_element = chr(tags[0])
-            if tag_element == "b":
-                self._write(bytes(value))
-            elif tag_element == "i":
-                try:
-                    self._write(struct.pack(self.endian + "%sl" % len(value), *value))
-                except struct.error:
-                    raise RPCReturnValueError(
-                        "type mismatch: cannot serialize {value} as {type}".format(
-                            value=repr(value), type="32-bit integer list"))
-            elif tag_element == "I":
-                try:
-                    self._write(struct.pack(self.endian + "%sq" % len(value), *value))
-                except struct.error:
-                    raise RPCReturnValueError(
-                        "type mismatch: cannot serialize {value} as {type}".format(
-                            value=repr(value), type="64-bit integer list"))
-            elif tag_element == "f":
-                self._write(struct.pack(self.endian + "%sd" %
-                                        len(value), *value))
-            else:
-                for elt in value:
-                    tags_copy = bytearray(tags)
-                    self._send_rpc_value(tags_copy, elt, root, function)
-            self._skip_rpc_value(tags)
-        elif tag == "a":
-            check(isinstance(value, numpy.ndarray),
-                  lambda: "numpy.ndarray")
-            num_dims = tags.pop(0)
-            check(num_dims == len(value.shape),
-                  lambda: "{}-dimensional numpy.ndarray".format(num_dims))
-            for s in value.shape:
-                self._write_int32(s)
-            tag_element = chr(tags[0])
-            if tag_element == "b":
-                self._write(value.reshape((-1,), order="C").tobytes())
-            elif tag_element == "i":
-                array = value.reshape(
-                    (-1,), order="C").astype(self.endian + 'i4')
-                self._write(array.tobytes())
-            elif tag_element == "I":
-                array = value.reshape(
-                    (-1,), order="C").astype(self.endian + 'i8')
-                self._write(array.tobytes())
-            elif tag_element == "f":
-                array = value.reshape(
-                    (-1,), order="C").astype(self.endian + 'd')
-                self._write(array.tobytes())
-            else:
-                for elt in value.reshape((-1,), order="C"):
-                    tags_copy = bytearray(tags)
-                    self._send_rpc_value(tags_copy, elt, root, function)
-            self._skip_rpc_value(tags)
-        elif tag == "r":
-            check(isinstance(value, range),
-                  lambda: "range")
-            tags_copy = bytearray(tags)
-            self._send_rpc_value(tags_copy, value.start, root, function)
-            tags_copy = bytearray(tags)
-            self._send_rpc_value(tags_copy, value.stop, root, function)
-            tags_copy = bytearray(tags)
-            self._send_rpc_value(tags_copy, value.step, root, function)
-            tags = tags_copy
-        else:
-            raise IOError("Unknown RPC value tag: {}".format(repr(tag)))
+        _get_encoder(tags, self.endian)(self.write_buffer, value, root, function)
+
+    def _submit_async_rpc(self, service_id, call):
+        if self._async_rpc_executor is None:
+            self._async_rpc_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.async_rpc_workers, thread_name_prefix="async_rpc")
+        key = service_id if self.async_rpc_workers > 1 else None
+        with self._async_rpc_lock:
+            queue = self._async_rpc_queues.get(key)
+            if queue is not None:
+                # A task is already executing the calls of this key.
+                queue.append(call)
+                return
+            self._async_rpc_queues[key] = deque([call])
+            # Only the running task of each key is kept.
+            self._async_rpc_tasks[key] = self._async_rpc_executor.submit(
+                self._execute_async_rpcs, key)
+
+    def _execute_async_rpcs(self, key):
+        while True:
+            with self._async_rpc_lock:
+                queue = self._async_rpc_queues[key]
+                if not queue:
+                    del self._async_rpc_queues[key]
+                    del self._async_rpc_tasks[key]
+                    return
+                call = queue.popleft()
+            try:
+                call()
+            except Exception as exn:
+                with self._async_rpc_lock:
+                    self._async_rpc_exceptions.append(exn)
+
+    def _wait_async_rpcs(self):
+        with self._async_rpc_lock:
+            tasks = list(self._async_rpc_tasks.values())
+        concurrent.futures.wait(tasks)
+
+    def _join_async_rpcs(self):
+        # Waits for the submitted async RPCs, and returns the exceptions
+        # they raised.
+        self._wait_async_rpcs()
+        with self._async_rpc_lock:
+            exceptions = self._async_rpc_exceptions
+            self._async_rpc_exceptions = []
+        return exceptions
 
     def _truncate_message(self, msg, limit=4096):
         if len(msg) > limit:
@@ -587,9 +756,16 @@ class CommKernel:
                      (" (async)" if is_async else ""), args, kwargs, return_tags)
 
         if is_async:
-            service(*args, **kwargs)
+            if self.async_rpc_workers:
+                self._submit_async_rpc(service_id, lambda: service(*args, **kwargs))
+            else:
+                service(*args, **kwargs)
             return
 
+        if self._async_rpc_tasks:
+            # Synchronous RPCs observe the effects of earlier async RPCs.
+            self._wait_async_rpcs()
+
         try:
             result = service(*args, **kwargs)
         except RPCReturnValueError as exn:
@@ -648,7 +824,7 @@ class CommKernel:
                          service_id, args, kwargs, result)
             self._write_header(Request.RPCReply)
             self._write_bytes(return_tags)
-            self._send_rpc_value(bytearray(return_tags),
+            self._send_rpc_value(return_tags,
                                  result, result, service)
             self._flush()
 
@@ -662,7 +838,7 @@ class CommKernel:
             if length == -1:
                 return embedding_map.retrieve_str(self._read_int32())
             else:
-                return self._read(length).decode("utf-8")
+                return str(self._read(length), "utf-8")
 
         for _ in range(exception_count):
             name = embedding_map.retrieve_str(self._read_int32())
@@ -731,6 +907,19 @@ class CommKernel:
                            f"reported during kernel execution")
 
     def serve(self, embedding_map, symbolizer, demangler):
+        try:
+            self._serve(embedding_map, symbolizer, demangler)
+        except:
+            for exn in self._join_async_rpcs():
+                logger.error("async RPC failed", exc_info=exn)
+            raise
+        exceptions = self._join_async_rpcs()
+        if exceptions:
+            for exn in exceptions[1:]:
+                logger.error("async RPC failed", exc_info=exn)
+            raise exceptions[0]
+
+    def _serve(self, embedding_map, symbolizer, demangler):
         while True:
             self._read_header()
             if self._read_type == Reply.RPCRequest:
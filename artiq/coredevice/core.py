@@ -1,7 +1,11 @@
 import os, sys
+import logging
+import multiprocessing
+import concurrent.futures
 import numpy
 from inspect import getfullargspec
 from functools import wraps
+from contextlib import contextmanager
 
 from pythonparser import diagnostic
 
@@ -14,12 +18,18 @@ from artiq.language.units import *
 from artiq.compiler.module import Module
 from artiq.compiler.embedding import Stitcher
 from artiq.compiler.targets import RV32IMATarget, RV32GTarget, CortexA9Target
+from artiq.compiler.compile_cache import CompileCache
+from artiq.compiler.profiler import CompileProfiler
+from artiq.compiler import profiler
 
 from artiq.coredevice.comm_kernel import CommKernel, CommKernelDummy
 # Import for side effects (creating the exception classes).
 from artiq.coredevice import exceptions
 
 
+logger = logging.getLogger(__name__)
+
+
 def _render_diagnostic(diagnostic, colored):
     def shorten_path(path):
         return path.replace(artiq_dir, "<artiq>")
@@ -57,6 +67,66 @@ def rtio_get_counter() -> TInt64:
 def test_exception_id_sync(id: TInt32) -> TNone:
     raise NotImplementedError("syscall not simulated")
 
+# Environment variables requesting dumps of the compilation stages that
+# are skipped for cached kernels.
+_DUMP_VARIABLES = ["ARTIQ_DUMP_UNOPT_LLVM", "ARTIQ_DUMP_LLVM",
+                   "ARTIQ_DUMP_ASM", "ARTIQ_DUMP_OBJ", "ARTIQ_DUMP_ELF"]
+
+
+def _compile_llvm_ir(target, llir):
+    library = target.link([target.assemble(target.compile_llvm_ir(llir))])
+    return library, target.strip(library)
+
+
+def _compile_llvm_ir_in_worker(target_cls, subkernel_id, optimization, llir):
+    # Runs in a worker process of Core.compile_executor.
+    target = target_cls(subkernel_id=subkernel_id, optimization=optimization)
+    return _compile_llvm_ir(target, llir)
+
+
+def _copy_value(value):
+    if isinstance(value, numpy.ndarray):
+        return value.copy()
+    elif isinstance(value, list):
+        return [_copy_value(elt) for elt in value]
+    elif type(value) is tuple:
+        return tuple(_copy_value(elt) for elt in value)
+    else:
+        return value
+
+
+def _same_value(a, b):
+    if isinstance(a, numpy.ndarray) or isinstance(b, numpy.ndarray):
+        return (isinstance(a, numpy.ndarray) and isinstance(b, numpy.ndarray) and
+                a.dtype == b.dtype and numpy.array_equal(a, b))
+    elif isinstance(a, (list, tuple)):
+        return (type(a) is type(b) and len(a) == len(b) and
+                all(_same_value(x, y) for x, y in zip(a, b)))
+    else:
+        return type(a) is type(b) and (a is b or bool(a == b))
+
+
+def _snapshot_attributes(embedding_map):
+    # Records the values of the host object attributes embedded in a kernel.
+    snapshot = []
+    for _, obj_ref, obj_typ in embedding_map.iter_objects():
+        for attr in obj_typ.attributes:
+            if attr == "__objectid__":
+                continue
+            value = getattr(obj_ref, attr)
+            if callable(value):
+                continue
+            snapshot.append((obj_ref, attr, _copy_value(value)))
+    return snapshot
+
+
+def _changed_attributes(snapshot):
+    return ["{}.{}".format(obj_ref.__name__ if isinstance(obj_ref, type)
+                           else type(obj_ref).__name__, attr)
+            for obj_ref, attr, value in snapshot
+            if not _same_value(getattr(obj_ref, attr), value)]
+
+
 def get_target_cls(target):
     if target == "rv32g":
         return RV32GTarget
@@ -87,6 +157,35 @@ class Core:
         proxy after the Experiment's run stage finishes.
     :param report_invariants: report variables which are not changed inside
         kernels and are thus candidates for inclusion in kernel_invariants
+    :param compile_cache_dir: directory in which to cache compiled kernels
+        across experiments (and worker processes). By default, kernels are
+        only cached in memory, for the duration of the experiment.
+    :param compile_cache_size: maximum size in bytes of the kernel cache
+        directory. Least recently used kernels are removed first.
+    :param compile_workers: number of worker processes used to optimize, link
+        and strip subkernels concurrently, overlapping with their upload.
+        By default (0), subkernels are compiled one after the other.
+    :param optimization: optimization profile of kernels: ``"fast"`` for
+        the shortest compile time, ``"default"`` or ``"aggressive"`` for the
+        fastest code. Kernels can override it with the ``optimize-fast`` and
+        ``optimize-aggressive`` flags.
+    :param profile_compile: record the time spent in each stage of kernel
+        compilation, log it and make it available in :attr:`compile_profile`.
+        If set to ``"memory"``, the peak memory allocated by each stage is
+        recorded as well. Profiling can also be enabled with the
+        ``ARTIQ_PROFILE_COMPILE`` environment variable (``1`` or ``memory``),
+        which prints the report on standard error. Stages executed by
+        compile workers are not recorded.
+    :param async_rpc_workers: number of threads executing async RPCs while
+        the kernel keeps running (see
+        :class:`artiq.coredevice.comm_kernel.CommKernel`). By default (0),
+        async RPCs are executed by the thread serving the kernel. With
+        a non-zero value, async RPC functions must be safe to call from
+        another thread.
+
+    :var compile_profile: reports of the profiled kernel compilations
+        (see :meth:`artiq.compiler.profiler.CompileProfiler.report`), keyed
+        by the qualified name of the kernel; subkernels get their own entry.
     """
 
     kernel_invariants = {
@@ -98,7 +197,10 @@ class Core:
                  analyzer_proxy=None, analyze_at_run_end=False,
                  ref_multiplier=8,
                  target="rv32g", satellite_cpu_targets={},
-                 report_invariants=False):
+                 report_invariants=False,
+                 compile_cache_dir=None, compile_cache_size=256*1024*1024,
+                 compile_workers=0, optimization="default", profile_compile=False,
+                 async_rpc_workers=0):
         self.ref_period = ref_period
         self.ref_multiplier = ref_multiplier
         self.satellite_cpu_targets = satellite_cpu_targets
@@ -107,10 +209,19 @@ class Core:
         if host is None:
             self.comm = CommKernelDummy()
         else:
-            self.comm = CommKernel(host)
+            self.comm = CommKernel(host, async_rpc_workers=async_rpc_workers)
         self.analyzer_proxy_name = analyzer_proxy
         self.analyze_at_run_end = analyze_at_run_end
         self.report_invariants = report_invariants
+        self.compile_cache = CompileCache(compile_cache_dir,
+                                          max_disk_size=compile_cache_size)
+        self.compile_workers = compile_workers
+        self._compile_executor = None
+        if optimization not in self.target_cls.optimizations:
+            raise ValueError("Unknown optimization profile: {}".format(optimization))
+        self.optimization = optimization
+        self.profile_compile = profile_compile
+        self.compile_profile = {}
 
         self.first_run = True
         self.dmgr = dmgr
@@ -125,37 +236,127 @@ class Core:
     def close(self):
         """Disconnect core device and close sockets. 
         """
+        if self._compile_executor is not None:
+            self._compile_executor.shutdown()
+            self._compile_executor = None
         self.comm.close()
 
+    def compile_executor(self):
+        """Returns the process pool in which kernels are compiled concurrently,
+        or ``None`` if ``compile_workers`` is 0."""
+        if self.compile_workers and self._compile_executor is None:
+            # Workers are spawned rather than forked, since the parent may
+            # have threads (e.g. the dataset archiver).
+            self._compile_executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.compile_workers,
+                mp_context=multiprocessing.get_context("spawn"))
+        return self._compile_executor
+
     def compile(self, function, args, kwargs, set_result=None,
                 attribute_writeback=True, print_as_rpc=True,
                 target=None, destination=0, subkernel_arg_types=[],
-                old_embedding_map=None):
-        try:
-            engine = _DiagnosticEngine(all_errors_are_fatal=True)
-
-            stitcher = Stitcher(engine=engine, core=self, dmgr=self.dmgr,
-                                print_as_rpc=print_as_rpc,
-                                destination=destination, subkernel_arg_types=subkernel_arg_types,
-                                old_embedding_map=old_embedding_map)
-            stitcher.stitch_call(function, args, kwargs, set_result)
-            stitcher.finalize()
-
-            module = Module(stitcher,
-                ref_period=self.ref_period,
-                attribute_writeback=attribute_writeback,
-                remarks=self.report_invariants)
-            target = target if target is not None else self.target_cls()
-
-            library = target.compile_and_link([module])
-            stripped_library = target.strip(library)
-
-            return stitcher.embedding_map, stripped_library, \
-                   lambda addresses: target.symbolize(library, addresses), \
-                   lambda symbols: target.demangle(symbols), \
-                   module.subkernel_arg_types
-        except diagnostic.Error as error:
-            raise CompileError(error.diagnostic) from error
+                old_embedding_map=None, executor=None):
+        # If ``executor`` is given, the LLVM IR is compiled by it, and the
+        # returned library is a future of the ``(library, stripped_library)``
+        # pair instead of the stripped library.
+        with self._profiling(function):
+            try:
+                engine = _DiagnosticEngine(all_errors_are_fatal=True)
+
+                with profiler.stage("stitching"):
+                    stitcher = Stitcher(engine=engine, core=self, dmgr=self.dmgr,
+                                        print_as_rpc=print_as_rpc,
+                                        destination=destination, subkernel_arg_types=subkernel_arg_types,
+                                        old_embedding_map=old_embedding_map)
+                    stitcher.stitch_call(function, args, kwargs, set_result)
+                stitcher.finalize()
+
+                module = Module(stitcher,
+                    ref_period=self.ref_period,
+                    attribute_writeback=attribute_writeback,
+                    remarks=self.report_invariants)
+                if target is None:
+                    target = self.target_cls(optimization=self._optimization(function))
+
+                if executor is None:
+                    library, stripped_library = self._compile_module(target, module)
+                    get_library = lambda: library
+                else:
+                    stripped_library = self._compile_module(target, module, executor)
+                    get_library = lambda: stripped_library.result()[0]
+
+                return stitcher.embedding_map, stripped_library, \
+                       lambda addresses: target.symbolize(get_library(), addresses), \
+                       lambda symbols: target.demangle(symbols), \
+                       module.subkernel_arg_types
+            except diagnostic.Error as error:
+                raise CompileError(error.diagnostic) from error
+
+    def _optimization(self, function):
+        flags = function.artiq_embedded.flags
+        for optimization in self.target_cls.optimizations:
+            if "optimize-" + optimization in flags:
+                return optimization
+        return self.optimization
+
+    @contextmanager
+    def _profiling(self, function):
+        profile_env = os.getenv("ARTIQ_PROFILE_COMPILE")
+        if not (self.profile_compile or profile_env):
+            yield
+            return
+
+        trace_memory = "memory" in (profile_env, self.profile_compile)
+        compile_profiler = CompileProfiler(trace_memory=trace_memory)
+        with compile_profiler.activate():
+            yield
+        kernel = getattr(function, "__qualname__", repr(function))
+        report = compile_profiler.report()
+        report["kernel"] = kernel
+        self.compile_profile[kernel] = report
+        if profile_env:
+            print("====== COMPILATION PROFILE ({}) ======".format(kernel),
+                  file=sys.stderr)
+            print(compile_profiler.format(), file=sys.stderr)
+        else:
+            logger.info("compilation profile of %s:\n%s",
+                        kernel, compile_profiler.format())
+
+    def _compile_module(self, target, module, executor=None):
+        # Only the textual form of the module is needed from here on; the
+        # llvmlite objects (and their cached strings) are released right away,
+        # before LLVM parses, optimizes and emits the kernel.
+        llmod = target.generate_llvm_ir(module)
+        with profiler.stage("LLVM IR serialization"):
+            llir = str(llmod)
+        del llmod
+        if any(os.getenv(var) for var in _DUMP_VARIABLES):
+            # Cached kernels would skip the requested dumps.
+            key = None
+        else:
+            key = self.compile_cache.key(target, llir)
+            entry = self.compile_cache.get(key)
+            if entry is not None:
+                if executor is None:
+                    return entry
+                future = concurrent.futures.Future()
+                future.set_result(entry)
+                return future
+
+        if executor is None:
+            library, stripped_library = _compile_llvm_ir(target, llir)
+            if key is not None:
+                self.compile_cache.put(key, library, stripped_library)
+            return library, stripped_library
+
+        future = executor.submit(_compile_llvm_ir_in_worker,
+                                 type(target), target.subkernel_id, target.optimization, llir)
+        if key is not None:
+            def put(future):
+                if future.exception() is None:
+                    self.compile_cache.put(key, *future.result())
+            future.add_done_callback(put)
+        return future
 
     def _run_compiled(self, kernel_library, embedding_map, symbolizer, demangler):
         if self.first_run:
@@ -177,7 +378,8 @@ class Core:
         self._run_compiled(kernel_library, embedding_map, symbolizer, demangler)
         return result
 
-    def compile_subkernel(self, sid, subkernel_fn, embedding_map, args, subkernel_arg_types, subkernels):
+    def compile_subkernel(self, sid, subkernel_fn, embedding_map, args, subkernel_arg_types, subkernels,
+                          executor=None):
         # pass self to subkernels (if applicable)
         # assuming the first argument is self
         subkernel_args = getfullargspec(subkernel_fn.artiq_embedded.function)
@@ -187,33 +389,82 @@ class Core:
                 self_arg = args[:1]
         destination = subkernel_fn.artiq_embedded.destination
         destination_tgt = self.satellite_cpu_targets[destination]
-        target = get_target_cls(destination_tgt)(subkernel_id=sid)
+        target = get_target_cls(destination_tgt)(subkernel_id=sid,
+                                                 optimization=self._optimization(subkernel_fn))
         object_map, kernel_library, _, _, _ = \
             self.compile(subkernel_fn, self_arg, {}, attribute_writeback=False,
                         print_as_rpc=False, target=target, destination=destination, 
                         subkernel_arg_types=subkernel_arg_types.get(sid, []),
-                        old_embedding_map=embedding_map)
+                        old_embedding_map=embedding_map, executor=executor)
         if object_map.has_rpc():
             raise ValueError("Subkernel must not use RPC")
         return destination, kernel_library, object_map
 
-    def compile_and_upload_subkernels(self, embedding_map, args, subkernel_arg_types):
+    def compile_subkernels(self, embedding_map, args, subkernel_arg_types, upload=None):
+        """Compiles the subkernels of ``embedding_map`` and of the subkernels
+        it references, and returns the ``embedding_map`` of the last one and
+        a dictionary mapping their IDs to ``(destination, library)`` pairs.
+
+        The subkernels are stitched one after the other, since each one
+        extends the embedding map of the previous one. If ``compile_workers``
+        is set, their LLVM IR is then compiled concurrently, and ``upload``
+        is called with ``(library, sid, destination)`` as soon as each one
+        is ready."""
+        executor = self.compile_executor()
         subkernels = embedding_map.subkernels()
-        subkernels_compiled = []
-        while True:
-            new_subkernels = {}
-            for sid, subkernel_fn in subkernels.items():
-                if sid in subkernels_compiled:
-                    continue
-                destination, kernel_library, embedding_map = \
-                    self.compile_subkernel(sid, subkernel_fn, embedding_map,
-                                        args, subkernel_arg_types, subkernels)
-                self.comm.upload_subkernel(kernel_library, sid, destination)
-                new_subkernels.update(embedding_map.subkernels())
-                subkernels_compiled.append(sid)
-            if new_subkernels == subkernels:
-                break
-            subkernels.update(new_subkernels)
+        subkernels_compiled = {}
+        pending = {}
+        order = []
+
+        def collect(wait):
+            futures = {future: sid for sid, (_, future) in pending.items()}
+            if wait:
+                done = concurrent.futures.as_completed(futures)
+            else:
+                done = [future for future in futures if future.done()]
+            for future in done:
+                sid = futures[future]
+                destination, _ = pending.pop(sid)
+                _, kernel_library = future.result()
+                if upload is not None:
+                    upload(kernel_library, sid, destination)
+                subkernels_compiled[sid] = (destination, kernel_library)
+
+        try:
+            while True:
+                new_subkernels = {}
+                for sid, subkernel_fn in subkernels.items():
+                    if sid in subkernels_compiled or sid in pending:
+                        continue
+                    destination, kernel_library, embedding_map = \
+                        self.compile_subkernel(sid, subkernel_fn, embedding_map,
+                                            args, subkernel_arg_types, subkernels,
+                                            executor=executor)
+                    order.append(sid)
+                    if executor is None:
+                        if upload is not None:
+                            upload(kernel_library, sid, destination)
+                        subkernels_compiled[sid] = (destination, kernel_library)
+                    else:
+                        pending[sid] = (destination, kernel_library)
+                        collect(wait=False)
+                    new_subkernels.update(embedding_map.subkernels())
+                if new_subkernels == subkernels:
+                    break
+                subkernels.update(new_subkernels)
+            collect(wait=True)
+        finally:
+            for _, future in pending.values():
+                future.cancel()
+        return embedding_map, {sid: subkernels_compiled[sid] for sid in order}
+
+    def compile_and_upload_subkernels(self, embedding_map, args, subkernel_arg_types, upload=True):
+        # Returns the compiled subkernels; if ``upload`` is false, they must be
+        # uploaded with :meth:`upload_subkernels` before the kernel is run.
+        # The upload method is looked up lazily, as CommKernelDummy lacks it.
+        embedding_map, compiled = self.compile_subkernels(
+            embedding_map, args, subkernel_arg_types,
+            upload=(lambda *upload_args: self.comm.upload_subkernel(*upload_args)) if upload else None)
         # check for messages without a send/recv pair
         unpaired_messages = embedding_map.subkernel_messages_unpaired()
         if unpaired_messages:
@@ -233,7 +484,38 @@ class Core:
                         unpaired_message.send_loc)
                 engine.process(diag)
             raise ValueError("Found subkernel message(s) without a full send/recv pair")
+        return compiled
 
+    def upload_subkernels(self, subkernels):
+        for sid, (destination, kernel_library) in subkernels.items():
+            self.comm.upload_subkernel(kernel_library, sid, destination)
+
+    def _precompile(self, function, args, kwargs, attribute_writeback, upload):
+        if not hasattr(function, "artiq_embedded"):
+            raise ValueError("Argument is not a kernel")
+
+        result = None
+        @rpc(flags={"async"})
+        def set_result(new_result):
+            nonlocal result
+            result = new_result
+
+        embedding_map, kernel_library, symbolizer, demangler, subkernel_arg_types = \
+            self.compile(function, args, kwargs, set_result,
+                         attribute_writeback=attribute_writeback)
+        subkernels = self.compile_and_upload_subkernels(embedding_map, args, subkernel_arg_types,
+                                                        upload=upload)
+
+        @wraps(function)
+        def run_precompiled():
+            nonlocal result, subkernels
+            if not upload and subkernels:
+                self.upload_subkernels(subkernels)
+                subkernels = {}
+            self._run_compiled(kernel_library, embedding_map, symbolizer, demangler)
+            return result
+
+        return run_precompiled, embedding_map
 
     def precompile(self, function, *args, **kwargs):
         """Precompile a kernel and return a callable that executes it on the core device
@@ -259,26 +541,57 @@ class Core:
 
         The callable may be called several times.
         """
-        if not hasattr(function, "artiq_embedded"):
-            raise ValueError("Argument is not a kernel")
+        run_precompiled, _ = self._precompile(function, args, kwargs,
+                                              attribute_writeback=False, upload=True)
+        return run_precompiled
 
-        result = None
-        @rpc(flags={"async"})
-        def set_result(new_result):
-            nonlocal result
-            result = new_result
+    def precompile_ahead(self, function, policy="recompile"):
+        """Compile a kernel that takes no arguments, and its subkernels, without
+        communicating with the core device, and return a callable that uploads
+        the subkernels and executes the kernel at a later time.
+
+        This is used by the worker to compile the kernels listed in
+        :attr:`~artiq.language.environment.Experiment.precompile_kernels` during
+        the prepare stage, while the core device may still be in use by the
+        previous experiment.
+
+        Unlike with :meth:`precompile`, modified attributes are written back.
+        The values of the host object attributes embedded in the kernel are
+        recorded at compilation time, and ``policy`` determines what happens
+        if they have changed when the callable is called:
+
+        * ``"recompile"``: the kernel is compiled again and executed as usual;
+        * ``"error"``: :exc:`ValueError` is raised;
+        * ``"ignore"``: the precompiled kernel is executed with the recorded values.
+
+        Only the attributes embedded in the kernel itself, not in its subkernels,
+        are checked. The values written back by an execution of the precompiled
+        kernel are recorded again and are not considered as changes, although the
+        next execution starts from the values recorded at compilation time.
+        """
+        if policy not in ("recompile", "error", "ignore"):
+            raise ValueError("Unknown precompilation policy: {}".format(policy))
 
-        embedding_map, kernel_library, symbolizer, demangler, subkernel_arg_types = \
-            self.compile(function, args, kwargs, set_result, attribute_writeback=False)
-        self.compile_and_upload_subkernels(embedding_map, args, subkernel_arg_types)
+        run_precompiled, embedding_map = self._precompile(function, (), {},
+                                                          attribute_writeback=True, upload=False)
+        snapshot = _snapshot_attributes(embedding_map)
 
         @wraps(function)
-        def run_precompiled():
-            nonlocal result
-            self._run_compiled(kernel_library, embedding_map, symbolizer, demangler)
-            return result
-
-        return run_precompiled
+        def run():
+            changed = _changed_attributes(snapshot)
+            if changed and policy == "recompile":
+                logger.info("attributes of %s changed since precompilation (%s), "
+                            "recompiling", function.__qualname__, ", ".join(changed))
+                return function()
+            elif changed and policy == "error":
+                raise ValueError("Attributes changed since precompilation: {}"
+                                 .format(", ".join(changed)))
+            try:
+                return run_precompiled()
+            finally:
+                snapshot[:] = _snapshot_attributes(embedding_map)
+
+        return run
 
     @portable
     def seconds_to_mu(self, seconds):
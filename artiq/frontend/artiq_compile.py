@@ -32,6 +32,15 @@ def get_argparser():
 
     parser.add_argument("-o", "--output", default=None,
                         help="output file")
+    parser.add_argument("-j", "--compile-workers", default=None, type=int,
+                        help="number of processes compiling the kernel and "
+                             "subkernels concurrently (default: the "
+                             "compile_workers setting of the core device)")
+    parser.add_argument("-O", "--optimization", default=None,
+                        choices=["fast", "default", "aggressive"],
+                        help="optimization profile of the kernels without "
+                             "an optimize-* flag (default: the optimization "
+                             "setting of the core device)")
     parser.add_argument("file", metavar="FILE",
                         help="file containing the experiment to compile")
     parser.add_argument("arguments", metavar="ARGUMENTS",
@@ -63,25 +72,21 @@ def main():
             core_name = exp.run.artiq_embedded.core_name
             core = getattr(exp_inst, core_name)
 
+            if args.compile_workers is not None:
+                core.compile_workers = args.compile_workers
+            if args.optimization is not None:
+                core.optimization = args.optimization
+            executor = core.compile_executor()
+
             object_map, main_kernel_library, _, _, subkernel_arg_types = \
                 core.compile(exp.run, [exp_inst], {},
-                             attribute_writeback=False, print_as_rpc=False)
-
-            subkernels = object_map.subkernels()
-            compiled_subkernels = {}
-            while True:
-                new_subkernels = {}
-                for sid, subkernel_fn in subkernels.items():
-                    if sid in compiled_subkernels.keys():
-                        continue
-                    destination, subkernel_library, embedding_map = core.compile_subkernel(
-                        sid, subkernel_fn, object_map, 
-                        [exp_inst], subkernel_arg_types, subkernels)
-                    compiled_subkernels[sid] = (destination, subkernel_library)
-                    new_subkernels.update(embedding_map.subkernels())
-                if new_subkernels == subkernels:
-                    break
-                subkernels.update(new_subkernels)
+                             attribute_writeback=False, print_as_rpc=False,
+                             executor=executor)
+
+            _, compiled_subkernels = core.compile_subkernels(
+                object_map, [exp_inst], subkernel_arg_types)
+            if executor is not None:
+                _, main_kernel_library = main_kernel_library.result()
         except CompileError as error:
             return
         finally:
@@ -94,7 +99,7 @@ def main():
 
     output = args.output
 
-    if not subkernels:
+    if not compiled_subkernels:
         # just write the ELF file
         if output is None:
             basename, ext = os.path.splitext(args.file)
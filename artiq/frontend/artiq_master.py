@@ -7,7 +7,6 @@ import logging
 from types import SimpleNamespace
 
 from sipyco.pc_rpc import Server as RPCServer
-from sipyco.sync_struct import Publisher
 from sipyco.logging_tools import Server as LoggingServer
 from sipyco.broadcast import Broadcaster
 from sipyco import common_args
@@ -17,6 +16,7 @@ from artiq import __version__ as artiq_version
 from artiq.master.log import log_args, init_log
 from artiq.master.databases import (DeviceDB, DatasetDB,
                                     InteractiveArgDB)
+from artiq.master.publisher import Publisher
 from artiq.master.scheduler import Scheduler
 from artiq.master.rid_counter import RIDCounter
 from artiq.master.experiments import (FilesystemBackend, GitBackend,
@@ -55,6 +55,36 @@ def get_argparser():
         "--experiment-subdir", default="",
         help=("path to the experiment folder from the repository root "
               "(default: %(default)s)"))
+    group.add_argument(
+        "--scan-workers", default=1, type=int,
+        help=("number of worker processes examining experiment files "
+              "concurrently during repository scans (default: %(default)s)"))
+    group.add_argument(
+        "--scan-cache", nargs="?", const=True, default=False,
+        metavar="FILE",
+        help=("reuse the descriptions of experiment files whose source "
+              "and imported repository modules are unchanged, instead of "
+              "examining all files at every repository scan; if FILE is "
+              "given, the cache is persisted to it across master restarts"))
+
+    group = parser.add_argument_group("notifications")
+    group.add_argument(
+        "--notify-coalesce-window", default=0.0, type=float,
+        metavar="SECONDS",
+        help=("time over which modifications of the schedule, datasets and "
+              "experiment list are batched, and superseded ones dropped, "
+              "before being sent to clients; 0 to disable "
+              "(default: %(default)s)"))
+
+    group = parser.add_argument_group("worker pool")
+    group.add_argument(
+        "--worker-pool-size", default=0, type=int,
+        help=("number of idle worker processes to keep started ahead of "
+              "experiment runs, 0 to disable (default: %(default)s)"))
+    group.add_argument(
+        "--worker-preload", default=[], action="append", metavar="MODULE",
+        help=("additional module to import in idle worker processes "
+              "(can be specified multiple times)"))
     log_args(parser)
 
     parser.add_argument("--name",
@@ -104,11 +134,14 @@ def main():
     else:
         repo_backend = FilesystemBackend(args.repository)
     experiment_db = ExperimentDB(
-        repo_backend, worker_handlers, args.experiment_subdir)
+        repo_backend, worker_handlers, args.experiment_subdir,
+        scan_workers=args.scan_workers,
+        scan_cache=args.scan_cache)
     atexit.register(experiment_db.close)
 
     scheduler = Scheduler(RIDCounter(), worker_handlers, experiment_db,
-                          args.log_submissions)
+                          args.log_submissions, args.worker_pool_size,
+                          args.worker_preload)
     scheduler.start(loop=loop)
     atexit_register_coroutine(scheduler.stop, loop=loop)
 
@@ -158,7 +191,8 @@ def main():
         "interactive_args": interactive_arg_db.pending,
         "explist": experiment_db.explist,
         "explist_status": experiment_db.status,
-    })
+    }, coalesce=["schedule", "datasets", "explist"],
+       coalesce_window=args.notify_coalesce_window)
     loop.run_until_complete(server_notify.start(
         bind, args.port_notify))
     atexit_register_coroutine(server_notify.stop, loop=loop)
@@ -391,7 +391,8 @@ class HasEnvironment:
     @rpc(flags={"async"})
     def set_dataset(self, key, value, *,
                     unit=None, scale=None, precision=None,
-                    broadcast=False, persist=False, archive=True):
+                    broadcast=False, persist=False, archive=True,
+                    hdf5_options=None):
         """Sets the contents and handling modes of a dataset.
 
         Datasets must be scalars (``bool``, ``int``, ``float`` or NumPy scalar)
@@ -410,6 +411,10 @@ class HasEnvironment:
             broadcast.
         :param archive: the data is saved into the local storage of the current
             run (archived as a HDF5 file).
+        :param hdf5_options: dictionary of keyword arguments passed to h5py's
+            ``create_dataset`` when the dataset is archived, to select chunking
+            and compression (e.g. ``{"compression": "gzip", "shuffle": True}``).
+            Ignored for scalars.
         """
         metadata = {}
         if unit is not None:
@@ -418,6 +423,8 @@ class HasEnvironment:
             metadata["scale"] = scale
         if precision is not None:
             metadata["precision"] = precision
+        if hdf5_options is not None:
+            metadata["hdf5_options"] = hdf5_options
         self.__dataset_mgr.set(key, value, metadata, broadcast, persist, archive)
 
     @rpc(flags={"async"})
@@ -490,6 +497,16 @@ class HasEnvironment:
             else:
                 return default
 
+    def checkpoint_datasets(self):
+        """Writes the archived datasets to the HDF5 results file of the run
+        without waiting for the end of the experiment.
+
+        The data is copied and then written in the background. Lists that
+        have only been appended to since the previous checkpoint are extended
+        in place in the file. This has no effect outside of the master
+        (e.g. with ``artiq_run``)."""
+        self.__dataset_mgr.checkpoint()
+
     def setattr_dataset(self, key, default=NoDefault, archive=True):
         """Sets the contents of a dataset as attribute. The names of the
         dataset and of the attribute are the same."""
@@ -516,7 +533,19 @@ class Experiment:
 
     Deriving from this class enables automatic experiment discovery in
     Python modules.
+
+    :var precompile_kernels: names of kernel methods, taking no arguments,
+        that the worker compiles at the end of the prepare stage (see
+        :meth:`~artiq.coredevice.core.Core.precompile_ahead`), so that
+        :meth:`run` does not wait for their compilation. ``run`` itself may
+        be listed if it is a kernel.
+    :var precompile_policy: what to do if the host attributes embedded in
+        a precompiled kernel change before it is called: ``"recompile"``
+        (default), ``"error"`` or ``"ignore"``.
     """
+    precompile_kernels = set()
+    precompile_policy = "recompile"
+
     def prepare(self):
         """Entry point for pre-computing data necessary for running the
         experiment.
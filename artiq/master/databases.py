@@ -1,6 +1,10 @@
 import asyncio
+import copy
+import struct
+from concurrent.futures import ThreadPoolExecutor
 
 import lmdb
+import numpy
 
 from sipyco.sync_struct import (Notifier, process_mod, ModAction,
                                 update_from_dict)
@@ -8,6 +12,7 @@ from sipyco import pyon
 from sipyco.tools import TaskObject
 
 from artiq.tools import file_import
+from artiq.master import worker_ipc
 
 
 def device_db_from_file(filename):
@@ -41,41 +46,150 @@ class DeviceDB:
         return self.data.raw_view["satellite_cpu_targets"][destination]
 
 
+# Binary encoding of persisted datasets (little-endian):
+#
+#     _VALUE_MAGIC
+#     u32 header length
+#     header: PYON encoding of ((value, metadata), [(dtype, shape), ...]),
+#             with NumPy arrays replaced by placeholders
+#     array contents, each starting at a multiple of _VALUE_ALIGNMENT
+#
+# Values not starting with _VALUE_MAGIC are PYON strings (older databases).
+_VALUE_MAGIC = b"\x00ARTIQDS1"
+_VALUE_ALIGNMENT = 16
+_value_header = struct.Struct("<I")
+
+
+def _aligned(n):
+    return -(-n // _VALUE_ALIGNMENT)*_VALUE_ALIGNMENT
+
+
+def encode_dataset_value(value_and_metadata):
+    obj, buffers = worker_ipc.extract_buffers(value_and_metadata)
+    if not buffers:
+        return pyon.encode(value_and_metadata).encode()
+    descs = [(b.dtype.str, b.shape) for b in buffers]
+    header = pyon.encode((obj, descs)).encode()
+    parts = [_VALUE_MAGIC, _value_header.pack(len(header)), header]
+    offset = len(_VALUE_MAGIC) + _value_header.size + len(header)
+    for b in buffers:
+        padding = _aligned(offset) - offset
+        parts.append(bytes(padding))
+        parts.append(memoryview(b.reshape(-1).view(numpy.uint8)))
+        offset += padding + b.nbytes
+    return b"".join(parts)
+
+
+def decode_dataset_value(data):
+    """Decodes a persisted value from a buffer (e.g. a memoryview of the
+    LMDB memory map), which is not referenced after returning."""
+    if data[:len(_VALUE_MAGIC)] != _VALUE_MAGIC:
+        return pyon.decode(bytes(data).decode())
+    # The contents of a read transaction are only valid until it ends:
+    # copy them once into a writable buffer that the arrays share.
+    data = bytearray(data)
+    offset = len(_VALUE_MAGIC)
+    header_length, = _value_header.unpack_from(data, offset)
+    offset += _value_header.size
+    obj, descs = pyon.decode(data[offset:offset+header_length].decode())
+    offset += header_length
+    arrays = []
+    for dtype, shape in descs:
+        dtype = numpy.dtype(dtype)
+        count = 1
+        for dim in shape:
+            count *= dim
+        offset = _aligned(offset)
+        arrays.append(numpy.frombuffer(data, dtype, count, offset)
+                      .reshape(shape))
+        offset += count*dtype.itemsize
+    return worker_ipc.restore_buffers(obj, arrays)
+
+
 class DatasetDB(TaskObject):
+    """Broadcast datasets, with the persistent ones stored in a LMDB
+    database.
+
+    Persisted values are encoded in binary, with NumPy arrays stored as raw
+    buffers. Autosaves encode and write the modified datasets in a
+    background thread, from a snapshot taken on the event loop."""
     def __init__(self, persist_file, autosave_period=30):
         self.persist_file = persist_file
         self.autosave_period = autosave_period
 
         self.lmdb = lmdb.open(persist_file, subdir=False, map_size=2**30)
         data = dict()
-        with self.lmdb.begin() as txn:
+        with self.lmdb.begin(buffers=True) as txn:
             for key, value_and_metadata in txn.cursor():
-                value, metadata = pyon.decode(value_and_metadata.decode())
-                data[key.decode()] = (True, value, metadata)
+                value, metadata = decode_dataset_value(value_and_metadata)
+                data[bytes(key).decode()] = (True, value, metadata)
         self.data = Notifier(data)
         self.pending_keys = set()
+        self._executor = None
+        self._pending_write = None
 
     def close_db(self):
+        self._wait_pending_write()
+        if self._executor is not None:
+            self._executor.shutdown()
         self.lmdb.close()
 
-    def save(self):
+    def _snapshot(self):
+        # Values can be mutated in place after this returns (e.g. by
+        # mutate_dataset), so the background write gets copies.
+        updates = []
+        for key in self.pending_keys:
+            if (key not in self.data.raw_view
+                    or not self.data.raw_view[key][0]):
+                updates.append((key, None))
+            else:
+                value_and_metadata = (self.data.raw_view[key][1],
+                                      self.data.raw_view[key][2])
+                updates.append((key, copy.deepcopy(value_and_metadata)))
+        self.pending_keys.clear()
+        return updates
+
+    def _write(self, updates):
+        encoded = [(key.encode(),
+                    None if v is None else encode_dataset_value(v))
+                   for key, v in updates]
         with self.lmdb.begin(write=True) as txn:
-            for key in self.pending_keys:
-                if (key not in self.data.raw_view
-                        or not self.data.raw_view[key][0]):
-                    txn.delete(key.encode())
+            for key, data in encoded:
+                if data is None:
+                    txn.delete(key)
                 else:
-                    value_and_metadata = (self.data.raw_view[key][1],
-                                          self.data.raw_view[key][2])
-                    txn.put(key.encode(),
-                            pyon.encode(value_and_metadata).encode())
-        self.pending_keys.clear()
+                    txn.put(key, data)
+
+    def _wait_pending_write(self):
+        if self._pending_write is not None:
+            try:
+                self._pending_write.result()
+            finally:
+                self._pending_write = None
+
+    def save(self):
+        """Writes the modified persistent datasets, blocking until done."""
+        self._wait_pending_write()
+        self._write(self._snapshot())
+
+    async def save_async(self):
+        """Writes the modified persistent datasets in a background thread.
+        Writes are performed in the order of the calls."""
+        if not self.pending_keys:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="dataset_db")
+        self._pending_write = self._executor.submit(
+            self._write, self._snapshot())
+        await asyncio.wrap_future(self._pending_write)
+        self._pending_write = None
 
     async def _do(self):
         try:
             while True:
                 await asyncio.sleep(self.autosave_period)
-                self.save()
+                await self.save_async()
         finally:
             self.save()
 
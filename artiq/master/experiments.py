@@ -4,9 +4,13 @@ import tempfile
 import shutil
 import time
 import logging
+import hashlib
+import collections
 
 from sipyco.sync_struct import Notifier, update_from_dict
+from sipyco import pyon
 
+from artiq import __version__ as artiq_version
 from artiq.master.worker import (Worker, WorkerInternalException,
                                  log_worker_exception)
 from artiq.tools import get_windows_drives, exc_to_warning
@@ -15,19 +19,125 @@ from artiq.tools import get_windows_drives, exc_to_warning
 logger = logging.getLogger(__name__)
 
 
+def _file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class _ScanCache:
+    """Experiment descriptions from previous repository scans.
+
+    An entry is reused as long as its file and the source files in the
+    repository that it imported are unchanged. Entries for files whose
+    examination read datasets or the device database are not stored.
+    The cache is optionally persisted to a PYON file.
+
+    Modules imported from outside the repository, other files read by the
+    experiments and environment variables are not tracked."""
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.entries = dict()
+        if filename is not None:
+            try:
+                data = pyon.load_file(filename)
+            except FileNotFoundError:
+                pass
+            except:
+                logger.warning("failed to load repository scan cache",
+                               exc_info=True)
+            else:
+                if data.get("artiq_version") == artiq_version:
+                    self.entries = data["entries"]
+
+    def save(self):
+        if self.filename is None:
+            return
+        try:
+            pyon.store_file(self.filename, {
+                "artiq_version": artiq_version,
+                "entries": self.entries
+            })
+        except:
+            logger.warning("failed to save repository scan cache",
+                           exc_info=True)
+
+    def get(self, root, filename, hashes):
+        """Returns the cached description of ``filename`` (relative to
+        ``root``), or ``None``. ``hashes`` memoizes file hashes during
+        a scan."""
+        entry = self.entries.get(filename)
+        if entry is None:
+            return None
+        for dependency, h in entry["hashes"].items():
+            path = os.path.join(root, dependency)
+            if path not in hashes:
+                try:
+                    hashes[path] = _file_hash(path)
+                except OSError:
+                    hashes[path] = None
+            if hashes[path] != h:
+                return None
+        return entry["description"]
+
+    def set(self, root, filename, description, dependencies, hashes):
+        if not dependencies.get("cacheable", False):
+            self.entries.pop(filename, None)
+            return
+        files = {filename}
+        for path in dependencies["files"]:
+            relpath = os.path.relpath(path, root)
+            if not relpath.startswith(os.pardir):
+                files.add(relpath)
+        entry_hashes = dict()
+        for dependency in files:
+            path = os.path.join(root, dependency)
+            if path not in hashes:
+                try:
+                    hashes[path] = _file_hash(path)
+                except OSError:
+                    hashes[path] = None
+            if hashes[path] is None:
+                # e.g. deleted during the scan
+                self.entries.pop(filename, None)
+                return
+            entry_hashes[dependency] = hashes[path]
+        self.entries[filename] = {
+            "hashes": entry_hashes,
+            "description": description
+        }
+
+    def prune(self, filenames):
+        """Removes the entries for files other than ``filenames``."""
+        for filename in set(self.entries.keys()) - set(filenames):
+            del self.entries[filename]
+
+
 class _RepoScanner:
-    def __init__(self, worker_handlers):
+    def __init__(self, worker_handlers, cache=None, workers=1):
         self.worker_handlers = worker_handlers
-        self.worker = None
-
-    async def process_file(self, entry_dict, root, filename):
+        self.cache = cache
+        self.workers = workers
+
+    async def _examine(self, worker, root, filename, hashes):
+        if self.cache is not None:
+            description = self.cache.get(root, filename, hashes)
+            if description is not None:
+                logger.debug("using cached description of %s", filename)
+                return description
         logger.debug("processing file %s %s", root, filename)
+        dependencies = dict()
         try:
-            description = await self.worker.examine(
-                "scan", os.path.join(root, filename))
+            description = await worker.examine(
+                "scan", os.path.join(root, filename),
+                dependencies=dependencies)
         except:
             log_worker_exception()
             raise
+        if self.cache is not None:
+            self.cache.set(root, filename, description, dependencies, hashes)
+        return description
+
+    def _add_entries(self, entry_dict, filename, description):
         for class_name, class_desc in description.items():
             name = class_desc["name"]
             if "/" in name:
@@ -52,42 +162,93 @@ class _RepoScanner:
             }
             entry_dict[name] = entry
 
-    async def _scan(self, root, subdir=""):
-        entry_dict = dict()
+    def _walk(self, root, subdir, filenames):
+        # Returns the directory tree as a list of file names and
+        # (directory name, subtree) pairs, and collects the file names.
+        tree = []
         for de in os.scandir(os.path.join(root, subdir)):
             if de.name.startswith("."):
                 continue
             if de.is_file() and de.name.endswith(".py"):
                 filename = os.path.join(subdir, de.name)
-                try:
-                    await self.process_file(entry_dict, root, filename)
-                except Exception as exc:
-                    logger.warning("Skipping file '%s'", filename,
-                        exc_info=not isinstance(exc, WorkerInternalException))
-                    # restart worker
-                    await self.worker.close()
-                    self.worker = Worker(self.worker_handlers)
+                filenames.append(filename)
+                tree.append(filename)
             if de.is_dir():
-                subentries = await self._scan(
-                    root, os.path.join(subdir, de.name))
-                entries = {de.name + "/" + k: v for k, v in subentries.items()}
+                tree.append((de.name, self._walk(
+                    root, os.path.join(subdir, de.name), filenames)))
+        return tree
+
+    def _build(self, tree, descriptions):
+        entry_dict = dict()
+        for item in tree:
+            if isinstance(item, tuple):
+                name, subtree = item
+                subentries = self._build(subtree, descriptions)
+                entries = {name + "/" + k: v for k, v in subentries.items()}
                 entry_dict.update(entries)
+            elif item in descriptions:
+                self._add_entries(entry_dict, item, descriptions[item])
         return entry_dict
 
+    async def _examine_files(self, root, filenames):
+        descriptions = dict()
+        hashes = dict()
+        pending = collections.deque(filenames)
+
+        async def examine_pending():
+            worker = Worker(self.worker_handlers)
+            try:
+                while pending:
+                    filename = pending.popleft()
+                    try:
+                        descriptions[filename] = await self._examine(
+                            worker, root, filename, hashes)
+                    except Exception as exc:
+                        logger.warning("Skipping file '%s'", filename,
+                            exc_info=not isinstance(exc, WorkerInternalException))
+                        # restart worker
+                        await worker.close()
+                        worker = Worker(self.worker_handlers)
+            finally:
+                await worker.close()
+
+        n = max(1, min(self.workers, len(filenames)))
+        await asyncio.gather(*[examine_pending() for _ in range(n)])
+        return descriptions
+
     async def scan(self, root, subdir=""):
-        self.worker = Worker(self.worker_handlers)
-        try:
-            r = await self._scan(root, subdir)
-        finally:
-            await self.worker.close()
-        return r
+        filenames = []
+        tree = self._walk(root, subdir, filenames)
+        descriptions = await self._examine_files(root, filenames)
+        if self.cache is not None:
+            self.cache.prune(filenames)
+            self.cache.save()
+        return self._build(tree, descriptions)
 
 
 class ExperimentDB:
-    def __init__(self, repo_backend, worker_handlers, experiment_subdir=""):
+    """Experiment list of the repository.
+
+    :param scan_workers: Number of worker processes examining files
+        concurrently during repository scans.
+    :param scan_cache: Whether to reuse the results of previous scans for
+        unchanged files. If a file name is given, the cache is also
+        persisted to it. Only the experiment files and the modules they
+        import from the repository are checked for changes: descriptions
+        that depend on modules outside the repository, on other files or
+        on environment variables are not updated when those change.
+    """
+    def __init__(self, repo_backend, worker_handlers, experiment_subdir="",
+                 scan_workers=1, scan_cache=False):
         self.repo_backend = repo_backend
         self.worker_handlers = worker_handlers
         self.experiment_subdir = experiment_subdir
+        self.scan_workers = scan_workers
+        if scan_cache:
+            self.scan_cache = _ScanCache(
+                None if scan_cache is True else scan_cache)
+        else:
+            self.scan_cache = None
 
         self.cur_rev = self.repo_backend.get_head_rev()
         self.repo_backend.request_rev(self.cur_rev)
@@ -116,8 +277,9 @@ class ExperimentDB:
             self.cur_rev = new_cur_rev
             self.status["cur_rev"] = new_cur_rev
             t1 = time.monotonic()
-            new_explist = await _RepoScanner(self.worker_handlers).scan(
-                wd, self.experiment_subdir)
+            new_explist = await _RepoScanner(
+                self.worker_handlers, self.scan_cache, self.scan_workers
+            ).scan(wd, self.experiment_subdir)
             logger.info("repository scan took %d seconds", time.monotonic()-t1)
             update_from_dict(self.explist, new_explist)
         finally:
@@ -0,0 +1,265 @@
+"""Publisher of the master's synchronized structures, with optional
+coalescing of modifications and filtered subscriptions.
+
+Modifications of coalesced notifiers are buffered over a short window and
+sent to each subscriber in a single write. Buffered modifications that are
+superseded by a later ``setitem`` (at the same location or at an ancestor)
+are dropped. Subscribers receive the same protocol as from the sipyco
+publisher, only fewer modifications.
+
+Subscribers can also restrict a subscription to some of the top-level keys
+of a structure (e.g. dataset names), by subscribing to the name returned by
+:func:`filtered_notifier_name` with a standard sipyco ``Subscriber``. They
+then receive only the matching part of the initial structure and the
+modifications of matching keys.
+"""
+
+import asyncio
+import logging
+from collections import defaultdict
+from itertools import chain
+
+from sipyco import sync_struct, pyon
+from sipyco.sync_struct import ModAction, _protocol_banner
+
+
+logger = logging.getLogger(__name__)
+
+
+_filter_separator = "?"
+
+
+def filtered_notifier_name(notifier_name, keys=(), prefixes=()):
+    """Returns the name to subscribe to in order to receive only the
+    top-level keys of ``notifier_name`` that are in ``keys`` or start with
+    one of ``prefixes``."""
+    return notifier_name + _filter_separator + pyon.encode({
+        "keys": sorted(keys),
+        "prefixes": sorted(prefixes)
+    })
+
+
+class _KeyFilter:
+    def __init__(self, keys=(), prefixes=()):
+        self.keys = set(keys)
+        self.prefixes = tuple(prefixes)
+
+    def matches_key(self, key):
+        return key in self.keys or (
+            isinstance(key, str) and key.startswith(self.prefixes))
+
+    def matches(self, mod):
+        if mod["path"]:
+            return self.matches_key(mod["path"][0])
+        elif mod["action"] in {ModAction.setitem.value,
+                               ModAction.delitem.value}:
+            return self.matches_key(mod["key"])
+        else:
+            return False
+
+
+class _Node:
+    __slots__ = ("indices", "children")
+
+    def __init__(self):
+        self.indices = []
+        self.children = dict()
+
+    def get(self, location):
+        node = self
+        for k in location:
+            try:
+                node = node.children[k]
+            except KeyError:
+                child = _Node()
+                node.children[k] = child
+                node = child
+        return node
+
+    def find(self, location):
+        node = self
+        for k in location:
+            try:
+                node = node.children[k]
+            except KeyError:
+                return None
+        return node
+
+    def drop(self, limit, entries):
+        # Drops the entries in the subtree more recent than limit.
+        kept = []
+        for index in self.indices:
+            if index > limit:
+                entries[index][0] = None
+            else:
+                kept.append(index)
+        self.indices = kept
+        for k, child in list(self.children.items()):
+            if child.drop(limit, entries):
+                del self.children[k]
+        return not self.indices and not self.children
+
+
+def _resolve(struct, path):
+    for k in path:
+        struct = struct[k]
+    return struct
+
+
+class ModCoalescer:
+    """Buffer of the encoded modifications of one structure.
+
+    Buffered modifications are indexed by location in a tree, so that a
+    ``setitem`` can drop the earlier modifications of the location it
+    replaces. Modifications that shift list indices (``insert``, ``pop``
+    and list ``delitem``) are barriers: earlier modifications inside the
+    list are not dropped by later ones, as they may refer to other
+    elements."""
+    def __init__(self):
+        self.entries = []  # [encoded line or None if dropped, recipients]
+        self._root = _Node()
+        # container path -> index of the last modification shifting it
+        self._barriers = dict()
+
+    def add(self, mod, line, recipients, struct):
+        """Buffers an encoded modification. ``struct`` is the structure
+        after the modification was applied."""
+        index = len(self.entries)
+        action = mod["action"]
+        if action == ModAction.init.value:
+            for entry in self.entries:
+                entry[0] = None
+            self._root = _Node()
+            self._barriers.clear()
+            location = ()
+        else:
+            path = tuple(mod["path"])
+            if action == ModAction.setitem.value:
+                location = path + (mod["key"],)
+                limit = max(self._barriers.get(location[:i], -1)
+                            for i in range(len(location)))
+                node = self._root.find(location)
+                if node is not None:
+                    node.drop(limit, self.entries)
+            elif action == ModAction.delitem.value:
+                location = path + (mod["key"],)
+                if isinstance(_resolve(struct, path), list):
+                    self._barriers[path] = index
+            else:
+                location = path
+                if action != ModAction.append.value:
+                    self._barriers[path] = index
+        self.entries.append([line, recipients])
+        self._root.get(location).indices.append(index)
+
+    def lines_by_recipient(self):
+        r = defaultdict(list)
+        for line, recipients in self.entries:
+            if line is not None:
+                for recipient in recipients:
+                    r[recipient].append(line)
+        return r
+
+
+class Publisher(sync_struct.Publisher):
+    """sipyco Publisher that supports filtered subscriptions, and coalesces
+    the modifications of the notifiers named in ``coalesce`` over
+    ``coalesce_window`` seconds. Coalescing is disabled if
+    ``coalesce_window`` is 0."""
+    def __init__(self, notifiers, coalesce=(), coalesce_window=0.05):
+        sync_struct.Publisher.__init__(self, notifiers)
+        if coalesce_window > 0:
+            self._coalesced = set(coalesce)
+        else:
+            self._coalesced = set()
+        self.coalesce_window = coalesce_window
+        self._coalescers = dict()
+        # notifier name -> {queue: _KeyFilter}
+        self._filtered_recipients = {k: dict() for k in notifiers.keys()}
+
+    async def _handle_connection_cr(self, reader, writer):
+        try:
+            line = await reader.readline()
+            if line != _protocol_banner:
+                return
+
+            line = await reader.readline()
+            if not line:
+                return
+            notifier_name, _, filter_desc = line.decode()[:-1].partition(
+                _filter_separator)
+
+            try:
+                notifier = self.notifiers[notifier_name]
+            except KeyError:
+                return
+
+            if filter_desc:
+                try:
+                    key_filter = _KeyFilter(**pyon.decode(filter_desc))
+                except:
+                    logger.warning("invalid subscription filter for %s",
+                                   notifier_name, exc_info=True)
+                    return
+                struct = {k: v for k, v in notifier.raw_view.items()
+                          if key_filter.matches_key(k)}
+            else:
+                key_filter = None
+                struct = notifier.raw_view
+
+            obj = {"action": ModAction.init.value, "struct": struct}
+            line = pyon.encode(obj) + "\n"
+            writer.write(line.encode())
+
+            queue = asyncio.Queue()
+            if key_filter is None:
+                self._recipients[notifier_name].add(queue)
+            else:
+                self._filtered_recipients[notifier_name][queue] = key_filter
+            try:
+                while True:
+                    line = await queue.get()
+                    writer.write(line)
+                    # raise exception on connection error
+                    await writer.drain()
+            finally:
+                if key_filter is None:
+                    self._recipients[notifier_name].remove(queue)
+                else:
+                    del self._filtered_recipients[notifier_name][queue]
+        except (ConnectionResetError, ConnectionAbortedError, BrokenPipeError):
+            # subscribers disconnecting are a normal occurrence
+            pass
+        finally:
+            writer.close()
+
+    def publish(self, notifier, mod):
+        notifier_name = self._notifier_names[id(notifier)]
+        recipients = self._recipients[notifier_name]
+        filtered_recipients = self._filtered_recipients[notifier_name]
+        if filtered_recipients:
+            filtered_recipients = [
+                queue for queue, key_filter in filtered_recipients.items()
+                if key_filter.matches(mod)]
+        if not recipients and not filtered_recipients:
+            return
+        # Encode now, as the values may be mutated by later modifications.
+        line = (pyon.encode(mod) + "\n").encode()
+        if notifier_name not in self._coalesced:
+            for recipient in chain(recipients, filtered_recipients):
+                recipient.put_nowait(line)
+            return
+        coalescer = self._coalescers.get(notifier_name)
+        if coalescer is None:
+            coalescer = ModCoalescer()
+            self._coalescers[notifier_name] = coalescer
+            asyncio.get_event_loop().call_later(
+                self.coalesce_window, self._flush, notifier_name)
+        coalescer.add(mod, line,
+                      frozenset(chain(recipients, filtered_recipients)),
+                      notifier.raw_view)
+
+    def _flush(self, notifier_name):
+        coalescer = self._coalescers.pop(notifier_name)
+        for recipient, lines in coalescer.lines_by_recipient().items():
+            recipient.put_nowait(b"".join(lines))
@@ -2,13 +2,14 @@ import asyncio
 import logging
 import csv
 import os.path
+import heapq
 from enum import Enum
 from time import time
 
 from sipyco.sync_struct import Notifier
 from sipyco.tools import TaskObject, Condition
 
-from artiq.master.worker import Worker, log_worker_exception
+from artiq.master.worker import Worker, WorkerPool, log_worker_exception
 from artiq.tools import asyncio_wait_or_cancel
 
 
@@ -60,7 +61,7 @@ class Run:
         self.due_date = due_date
         self.flush = flush
 
-        self.worker = Worker(pool.worker_handlers)
+        self.worker = Worker(pool.worker_handlers, pool=pool.worker_pool)
         self.termination_requested = False
 
         self._status = RunStatus.pending
@@ -77,6 +78,7 @@ class Run:
         self._notifier = pool.notifier
         self._notifier[self.rid] = notification
         self._state_changed = pool.state_changed
+        self._pool = pool
 
     @property
     def status(self):
@@ -87,6 +89,7 @@ class Run:
         self._status = value
         if not self.worker.closed.is_set():
             self._notifier[self.rid]["status"] = self._status.name
+        self._pool.index(self)
         self._state_changed.notify()
 
     def priority_key(self):
@@ -115,16 +118,84 @@ class Run:
 
 
 class RunPool:
-    def __init__(self, ridc, worker_handlers, notifier, experiment_db, log_submissions):
+    def __init__(self, ridc, worker_handlers, notifier, experiment_db, log_submissions,
+                 worker_pool=None):
         self.runs = dict()
         self.state_changed = Condition()
 
+        # Priority queues of runs, as heaps of (-priority_key, run) entries.
+        # Entries are pushed when runs change status and discarded lazily
+        # when found stale, i.e. when the run was deleted or is no longer
+        # in the status of the queue. Pending runs are first queued by
+        # due date and moved to the priority queue once it has elapsed.
+        self._due_queue = []
+        self._queues = {status: [] for status in self._indexed_statuses}
+
         self.ridc = ridc
         self.worker_handlers = worker_handlers
+        self.worker_pool = worker_pool
         self.notifier = notifier
         self.experiment_db = experiment_db
         self.log_submissions = log_submissions
 
+    _indexed_statuses = (RunStatus.pending, RunStatus.prepare_done,
+                         RunStatus.run_done)
+
+    def index(self, run):
+        """Queues a run according to its current status. Called when the
+        status of the run changes."""
+        status = run.status
+        if status == RunStatus.pending:
+            heapq.heappush(self._due_queue,
+                           (run.due_date or 0, run.rid, run))
+        elif status in self._queues:
+            self._push(status, run)
+
+    def _push(self, status, run):
+        key = tuple(-k for k in run.priority_key())
+        heapq.heappush(self._queues[status], (key, run))
+
+    def _is_stale(self, run, status):
+        return run.status != status or self.runs.get(run.rid) is not run
+
+    def _update_due(self, now):
+        queue = self._due_queue
+        while queue:
+            due_date, _, run = queue[0]
+            if self._is_stale(run, RunStatus.pending):
+                heapq.heappop(queue)
+            elif due_date < now:
+                heapq.heappop(queue)
+                self._push(RunStatus.pending, run)
+            else:
+                break
+
+    def get_highest_priority(self, status, now=None):
+        """Returns the run with the highest priority (as given by
+        :meth:`Run.priority_key`) among those in the given status, or
+        ``None``.
+
+        For pending runs, only those the due date of which is earlier than
+        ``now`` are considered."""
+        if status == RunStatus.pending:
+            self._update_due(time() if now is None else now)
+        queue = self._queues[status]
+        while queue:
+            run = queue[0][1]
+            if self._is_stale(run, status):
+                heapq.heappop(queue)
+            else:
+                return run
+        return None
+
+    def get_next_due_date(self, now=None):
+        """Returns the earliest due date of the pending runs not considered
+        by :meth:`get_highest_priority`, or ``None``."""
+        self._update_due(time() if now is None else now)
+        if self._due_queue:
+            return self._due_queue[0][0]
+        return None
+
     def log_submission(self, rid, expid):
         start_time = time()
         with open(self.log_submissions, 'a', newline='') as f:
@@ -159,6 +230,7 @@ class RunPool:
         if self.log_submissions is not None:
             self.log_submission(rid, expid)
         self.runs[rid] = run
+        self.index(run)
         self.state_changed.notify()
         return rid
 
@@ -187,29 +259,20 @@ class PrepareStage(TaskObject):
         of them are going to become next-in-line before further pool state
         changes (which will also cause a re-evaluation).
         """
-        pending_runs = list(
-            filter(lambda r: r.status == RunStatus.pending,
-                   self.pool.runs.values()))
-
         now = time()
-        def is_runnable(r):
-            return (r.due_date or 0) < now
-
-        prepared_max = max((r.priority_key() for r in self.pool.runs.values()
-                            if r.status == RunStatus.prepare_done),
-                           default=None)
-        def takes_precedence(r):
-            return prepared_max is None or r.priority_key() > prepared_max
-
-        candidate = max(filter(is_runnable, pending_runs),
-                        key=lambda r: r.priority_key(),
-                        default=None)
-        if candidate is not None and takes_precedence(candidate):
+        prepared = self.pool.get_highest_priority(RunStatus.prepare_done)
+        candidate = self.pool.get_highest_priority(RunStatus.pending, now)
+        if candidate is not None and (
+                prepared is None
+                or candidate.priority_key() > prepared.priority_key()):
             return candidate
 
-        return min((r.due_date - now for r in pending_runs
-                    if (not is_runnable(r) and takes_precedence(r))),
-                   default=None)
+        # The earliest due date may belong to a run that will not take
+        # precedence over the prepared one; checking early is harmless.
+        due_date = self.pool.get_next_due_date(now)
+        if due_date is None:
+            return None
+        return due_date - now
 
     async def _do(self):
         while True:
@@ -254,14 +317,7 @@ class RunStage(TaskObject):
         self.delete_cb = delete_cb
 
     def _get_run(self):
-        prepared_runs = filter(lambda r: r.status == RunStatus.prepare_done,
-                               self.pool.runs.values())
-        try:
-            r = max(prepared_runs, key=lambda r: r.priority_key())
-        except ValueError:
-            # prepared_runs is an empty sequence
-            r = None
-        return r
+        return self.pool.get_highest_priority(RunStatus.prepare_done)
 
     async def _do(self):
         stack = []
@@ -308,14 +364,7 @@ class AnalyzeStage(TaskObject):
         self.delete_cb = delete_cb
 
     def _get_run(self):
-        run_runs = filter(lambda r: r.status == RunStatus.run_done,
-                          self.pool.runs.values())
-        try:
-            r = max(run_runs, key=lambda r: r.priority_key())
-        except ValueError:
-            # run_runs is an empty sequence
-            r = None
-        return r
+        return self.pool.get_highest_priority(RunStatus.run_done)
 
     async def _do(self):
         while True:
@@ -334,8 +383,10 @@ class AnalyzeStage(TaskObject):
 
 
 class Pipeline:
-    def __init__(self, ridc, deleter, worker_handlers, notifier, experiment_db, log_submissions):
-        self.pool = RunPool(ridc, worker_handlers, notifier, experiment_db, log_submissions)
+    def __init__(self, ridc, deleter, worker_handlers, notifier, experiment_db, log_submissions,
+                 worker_pool=None):
+        self.pool = RunPool(ridc, worker_handlers, notifier, experiment_db, log_submissions,
+                            worker_pool)
         self._prepare = PrepareStage(self.pool, deleter.delete)
         self._run = RunStage(self.pool, deleter.delete)
         self._analyze = AnalyzeStage(self.pool, deleter.delete)
@@ -406,11 +457,16 @@ class Deleter(TaskObject):
 
 
 class Scheduler:
-    def __init__(self, ridc, worker_handlers, experiment_db, log_submissions):
+    def __init__(self, ridc, worker_handlers, experiment_db, log_submissions,
+                 worker_pool_size=0, worker_preload=()):
         self.notifier = Notifier(dict())
 
         self._pipelines = dict()
         self._worker_handlers = worker_handlers
+        # Shared by all pipelines, as they are garbage-collected
+        # (and would lose their idle workers) whenever they become empty.
+        self._worker_pool = WorkerPool(worker_handlers, worker_pool_size,
+                                       worker_preload)
         self._experiment_db = experiment_db
         self._terminated = False
 
@@ -421,6 +477,7 @@ class Scheduler:
     def start(self, *, loop=None):
         self._loop = loop
         self._deleter.start(loop=self._loop)
+        self._worker_pool.start(loop=self._loop)
 
     async def stop(self):
         # NB: restart of a stopped scheduler is not supported
@@ -430,6 +487,7 @@ class Scheduler:
                 self._deleter.delete(rid)
         await self._deleter.join()
         await self._deleter.stop()
+        await self._worker_pool.close()
         if self._pipelines:
             logger.warning("some pipelines were not garbage-collected")
 
@@ -449,7 +507,8 @@ class Scheduler:
             logger.debug("creating pipeline '%s'", pipeline_name)
             pipeline = Pipeline(self._ridc, self._deleter,
                                 self._worker_handlers, self.notifier,
-                                self._experiment_db, self._log_submissions)
+                                self._experiment_db, self._log_submissions,
+                                self._worker_pool)
             self._pipelines[pipeline_name] = pipeline
             pipeline.start(loop=self._loop)
         return pipeline.pool.submit(expid, priority, due_date, flush, pipeline_name)
@@ -496,12 +555,9 @@ class Scheduler:
                 if run.termination_requested:
                     return True
 
-                prepared_runs = filter(lambda r: r.status == RunStatus.prepare_done,
-                                       pipeline.pool.runs.values())
-                try:
-                    r = max(prepared_runs, key=lambda r: r.priority_key())
-                except ValueError:
-                    # prepared_runs is an empty sequence
+                r = pipeline.pool.get_highest_priority(
+                    RunStatus.prepare_done)
+                if r is None:
                     return False
                 return r.priority_key() > run.priority_key()
         raise KeyError("RID not found")
@@ -5,11 +5,12 @@ import logging
 import subprocess
 import time
 
-from sipyco import pipe_ipc, pyon
+from sipyco import pipe_ipc
 from sipyco.logging_tools import LogParser
 from sipyco.packed_exceptions import current_exc_packed
 
 from artiq.tools import asyncio_wait_or_cancel
+from artiq.master import worker_ipc
 
 
 logger = logging.getLogger(__name__)
@@ -42,9 +43,10 @@ def log_worker_exception():
 
 
 class Worker:
-    def __init__(self, handlers=dict(), send_timeout=10.0):
+    def __init__(self, handlers=dict(), send_timeout=10.0, pool=None):
         self.handlers = handlers
         self.send_timeout = send_timeout
+        self.pool = pool
 
         self.rid = None
         self.filename = None
@@ -76,19 +78,28 @@ class Worker:
     def _get_log_source(self):
         return "worker({},{})".format(self.rid, self.filename if self.filename is not None else "<none>")
 
-    async def _create_process(self, log_level):
+    async def _create_process(self, log_level, preload=()):
         if self.ipc is not None:
             return  # process already exists, recycle
         await self.io_lock.acquire()
         try:
             if self.closed.is_set():
                 raise WorkerError("Attempting to create process after close")
+            if self.pool is not None:
+                spare = self.pool.get()
+                if spare is not None:
+                    # Log messages of the spare process are attributed
+                    # through its own _get_log_source.
+                    spare.rid = self.rid
+                    spare.filename = self.filename
+                    self.ipc = spare.ipc
+                    return
             self.ipc = pipe_ipc.AsyncioParentComm()
             env = os.environ.copy()
             env["PYTHONUNBUFFERED"] = "1"
             await self.ipc.create_subprocess(
                 sys.executable, "-m", "artiq.master.worker_impl",
-                self.ipc.get_address(), str(log_level),
+                self.ipc.get_address(), str(log_level), *preload,
                 stdout=subprocess.PIPE, stderr=subprocess.PIPE,
                 env=env, start_new_session=True)
             asyncio.ensure_future(
@@ -157,8 +168,7 @@ class Worker:
 
     async def _send(self, obj, cancellable=True):
         assert self.io_lock.locked()
-        line = pyon.encode(obj)
-        self.ipc.write((line + "\n").encode())
+        self.ipc.write(worker_ipc.encode(obj))
         ifs = [self.ipc.drain()]
         if cancellable:
             ifs.append(self.closed.wait())
@@ -176,10 +186,21 @@ class Worker:
                 "Data transmission to worker cancelled (RID {})".format(
                     self.rid))
 
+    async def _read_object(self):
+        try:
+            return await worker_ipc.async_read_object(self.ipc)
+        except EOFError:
+            raise WorkerError(
+                "Worker ended while attempting to receive data (RID {})".
+                format(self.rid))
+        except Exception:
+            raise WorkerError("Worker sent invalid PYON data (RID {})".format(
+                self.rid))
+
     async def _recv(self, timeout):
         assert self.io_lock.locked()
         fs = await asyncio_wait_or_cancel(
-            [self.ipc.readline(), self.closed.wait()],
+            [self._read_object(), self.closed.wait()],
             timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
         if all(f.cancelled() for f in fs):
             raise WorkerTimeout(
@@ -188,17 +209,37 @@ class Worker:
             raise WorkerError(
                 "Receiving data from worker cancelled (RID {})".format(
                     self.rid))
-        line = fs[0].result()
-        if not line:
-            raise WorkerError(
-                "Worker ended while attempting to receive data (RID {})".
-                format(self.rid))
+        return fs[0].result()
+
+    async def _process_request(self, obj, log_failure=False):
+        action = obj["action"]
+        if action == "create_watchdog":
+            func = self.create_watchdog
+        elif action == "delete_watchdog":
+            func = self.delete_watchdog
+        elif action == "register_experiment":
+            func = self.register_experiment
+        elif action == "register_dependencies":
+            func = self.register_dependencies
+        else:
+            func = self.handlers[action]
         try:
-            obj = pyon.decode(line.decode())
-        except:
-            raise WorkerError("Worker sent invalid PYON data (RID {})".format(
-                self.rid))
-        return obj
+            if getattr(func, "_worker_pass_rid", False):
+                args = [self.rid] + list(obj["args"])
+            else:
+                args = obj["args"]
+            data = func(*args, **obj["kwargs"])
+            if asyncio.iscoroutine(data):
+                data = await data
+            return {"status": "ok", "data": data}
+        except Exception:
+            if log_failure:
+                logger.warning("worker request '%s' failed (RID %s)",
+                               action, self.rid, exc_info=True)
+            return {
+                "status": "failed",
+                "exception": current_exc_packed()
+            }
 
     async def _handle_worker_requests(self):
         while True:
@@ -217,28 +258,12 @@ class Worker:
                 return False
             elif action == "exception":
                 raise WorkerInternalException
-            elif action == "create_watchdog":
-                func = self.create_watchdog
-            elif action == "delete_watchdog":
-                func = self.delete_watchdog
-            elif action == "register_experiment":
-                func = self.register_experiment
-            else:
-                func = self.handlers[action]
-            try:
-                if getattr(func, "_worker_pass_rid", False):
-                    args = [self.rid] + list(obj["args"])
-                else:
-                    args = obj["args"]
-                data = func(*args, **obj["kwargs"])
-                if asyncio.iscoroutine(data):
-                    data = await data
-                reply = {"status": "ok", "data": data}
-            except Exception:
-                reply = {
-                    "status": "failed",
-                    "exception": current_exc_packed()
-                }
+            elif action == "batch":
+                # Requests that the worker does not wait for a reply to.
+                for request in obj["requests"]:
+                    await self._process_request(request, log_failure=True)
+                continue
+            reply = await self._process_request(obj)
             await self.io_lock.acquire()
             try:
                 await self._send(reply)
@@ -300,7 +325,14 @@ class Worker:
     async def analyze(self):
         await self._worker_action({"action": "analyze"})
 
-    async def examine(self, rid, file, timeout=20.0):
+    async def examine(self, rid, file, timeout=20.0, dependencies=None):
+        """Returns the descriptions of the experiments in ``file``.
+
+        If ``dependencies`` is a dictionary, its ``files`` item is set to the
+        list of the source files (absolute paths) that were imported during
+        the examination, and its ``cacheable`` item to whether the result
+        depends only on those files (i.e. not on datasets or the device
+        database)."""
         self.rid = rid
         self.filename = os.path.basename(file)
 
@@ -315,8 +347,94 @@ class Worker:
                 "argument_ui": argument_ui,
                 "scheduler_defaults": scheduler_defaults
             }
+
+        def register_dependencies(files, cacheable):
+            if dependencies is not None:
+                dependencies["files"] = files
+                dependencies["cacheable"] = cacheable
         self.register_experiment = register
+        self.register_dependencies = register_dependencies
         await self._worker_action({"action": "examine", "file": file},
                                   timeout)
         del self.register_experiment
+        del self.register_dependencies
         return r
+
+
+class WorkerPool:
+    """Keeps a number of idle worker processes started ahead of time.
+
+    Spawning a worker process and importing ARTIQ, NumPy, h5py and the
+    compiler takes a significant amount of time. Workers created with
+    ``pool`` set take over one of the idle processes when they start
+    (falling back to spawning a new one if none is available), and the pool
+    immediately begins starting a replacement. Processes are never reused
+    between runs.
+
+    :param size: Number of idle processes to maintain. Zero disables the pool.
+    :param preload: Names of additional modules to import in idle processes.
+    """
+    def __init__(self, handlers=dict(), size=0, preload=()):
+        self.handlers = handlers
+        self.size = size
+        self.preload = list(preload)
+
+        self._idle = []
+        self._starting = set()
+        self._closed = False
+
+    def start(self, *, loop=None):
+        self._loop = loop
+        self._replenish()
+
+    def _replenish(self):
+        while (not self._closed
+               and len(self._idle) + len(self._starting) < self.size):
+            self._starting.add(asyncio.ensure_future(self._start_worker(),
+                                                     loop=self._loop))
+
+    async def _start_worker(self):
+        task = asyncio.current_task()
+        worker = Worker(self.handlers)
+        worker.rid = "pool"
+        try:
+            await worker._create_process(logging.WARNING, self.preload)
+        except asyncio.CancelledError:
+            await worker.close()
+            raise
+        except Exception:
+            logger.warning("failed to start pooled worker process",
+                           exc_info=True)
+            await worker.close()
+            return
+        finally:
+            self._starting.discard(task)
+        if self._closed:
+            await worker.close()
+        else:
+            self._idle.append(worker)
+
+    def get(self):
+        """Removes and returns an idle started worker, or returns ``None`` if
+        there is none."""
+        r = None
+        while self._idle and r is None:
+            worker = self._idle.pop(0)
+            if worker.ipc.process.returncode is None:
+                r = worker
+            else:
+                logger.warning("pooled worker process ended with status %d",
+                               worker.ipc.process.returncode)
+        self._replenish()
+        return r
+
+    async def close(self):
+        self._closed = True
+        starting = list(self._starting)
+        for task in starting:
+            task.cancel()
+        await asyncio.gather(*starting, return_exceptions=True)
+        idle = self._idle
+        self._idle = []
+        for worker in idle:
+            await worker.close()
@@ -7,6 +7,10 @@ standalone command line tools).
 from operator import setitem
 import importlib
 import logging
+import threading
+import copy
+
+import numpy
 
 from sipyco.sync_struct import Notifier
 from sipyco.pc_rpc import AutoTarget, Client, BestEffortClient
@@ -54,6 +58,18 @@ class DeviceError(Exception):
     pass
 
 
+def _freeze(obj):
+    # Returns a hashable value that compares like the given device
+    # description.
+    if isinstance(obj, dict):
+        return frozenset((k, _freeze(v)) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        return type(obj), tuple(_freeze(e) for e in obj)
+    else:
+        hash(obj)
+        return obj
+
+
 class DeviceManager:
     """Handles creation and destruction of local device drivers and controller
     RPC clients."""
@@ -61,6 +77,8 @@ class DeviceManager:
         self.ddb = ddb
         self.virtual_devices = virtual_devices
         self.active_devices = []
+        # frozen description -> device, for the hashable descriptions
+        self._active_index = dict()
         self.devarg_override = {}
 
     def get_device_db(self):
@@ -82,9 +100,18 @@ class DeviceManager:
             raise DeviceError("Failed to get description of device '{}'"
                               .format(name)) from e
 
-        for existing_desc, existing_dev in self.active_devices:
-            if desc == existing_desc:
-                return existing_dev
+        try:
+            key = _freeze(desc)
+        except TypeError:
+            key = None
+            for existing_desc, existing_dev in self.active_devices:
+                if desc == existing_desc:
+                    return existing_dev
+        else:
+            try:
+                return self._active_index[key]
+            except KeyError:
+                pass
 
         try:
             dev = _create_device(desc, self, self.devarg_override.get(name, {}))
@@ -92,6 +119,8 @@ class DeviceManager:
             raise DeviceError("Failed to create device '{}'"
                               .format(name)) from e
         self.active_devices.append((desc, dev))
+        if key is not None:
+            self._active_index[key] = dev
         return dev
 
     def notify_run_end(self):
@@ -114,17 +143,192 @@ class DeviceManager:
                 logger.warning("Exception raised when closing device %r:",
                                dev, exc_info=True)
         self.active_devices.clear()
+        self._active_index.clear()
+
+
+_immutable_types = {int, float, bool, str, bytes, complex, type(None)}
+
+
+def _snapshot(value):
+    if type(value) in _immutable_types:
+        return value
+    return copy.deepcopy(value)
+
+
+def _is_end_insert(mod, target_length):
+    # setitem of a list over an empty slice at the end of the target,
+    # i.e. the result of merging appends.
+    key = mod["key"]
+    return (type(key) is slice and key.step is None
+            and key.start == key.stop
+            and type(mod["value"]) is list
+            and key.start + len(mod["value"]) == target_length)
+
+
+def _is_flat_sequence(target):
+    # Targets for which assigning a list to a slice replaces the elements
+    # at consecutive integer indices.
+    return (isinstance(target, list)
+            or (isinstance(target, numpy.ndarray) and target.ndim == 1))
+
+
+def _is_int_range(mod):
+    key = mod["key"]
+    if type(key) is int:
+        return key >= 0
+    return (type(key) is slice and key.step is None
+            and type(key.start) is int and type(key.stop) is int
+            and key.start >= 0
+            and type(mod["value"]) is list
+            and key.stop - key.start == len(mod["value"]))
+
+
+class DatasetModBatcher:
+    """Queues mods of broadcast datasets and publishes them in batches.
+
+    Mods that replace or delete a whole dataset are published immediately
+    (together with any mods queued before them), so that the value is
+    captured when the dataset is set. Other mods (from
+    :meth:`DatasetManager.mutate` and :meth:`DatasetManager.append_to`)
+    are queued and published when ``max_mods`` are pending, when the oldest
+    pending mod has been queued for ``period`` seconds (by a timer thread,
+    so that mods are not delayed further if no other mods follow), or when
+    :meth:`flush` is called.
+
+    Consecutive appends to the same dataset are merged into a single
+    slice assignment, as are consecutive assignments to contiguous
+    integer indices of a list or one-dimensional array. Assignments to indices already covered by the
+    previous mod replace the corresponding value.
+
+    :param publish_batch: Called with a list of mods to publish.
+    :param struct: Structure the mods apply to (after they have been applied
+        locally), used to resolve the positions of appended elements.
+    """
+    def __init__(self, publish_batch, struct, max_mods=1000, period=0.1):
+        self.publish_batch = publish_batch
+        self.struct = struct
+        self.max_mods = max_mods
+        self.period = period
+
+        self._pending = []
+        self._timer = None
+        self._lock = threading.RLock()
+
+    def _target(self, path):
+        target = self.struct
+        for p in path:
+            target = target[p]
+        return target
+
+    def _merge(self, mod):
+        if not self._pending:
+            return False
+        last = self._pending[-1]
+        if last["path"] != mod["path"]:
+            return False
+        if mod["action"] == "append":
+            length = len(self._target(mod["path"]))
+            if last["action"] == "append":
+                start = length - 2
+                self._pending[-1] = {
+                    "action": "setitem", "path": mod["path"],
+                    "key": slice(start, start),
+                    "value": [last["x"], mod["x"]]
+                }
+                return True
+            if last["action"] == "setitem" and _is_end_insert(last, length - 1):
+                last["value"].append(mod["x"])
+                return True
+        elif (mod["action"] == "setitem" and type(mod["key"]) is int
+                and mod["key"] >= 0
+                and last["action"] == "setitem" and _is_int_range(last)):
+            key = mod["key"]
+            if last["key"] == key:
+                last["value"] = mod["value"]
+                return True
+            if type(last["key"]) is int:
+                if (key == last["key"] + 1
+                        and _is_flat_sequence(self._target(mod["path"]))):
+                    last["key"] = slice(last["key"], key + 1)
+                    last["value"] = [last["value"], mod["value"]]
+                    return True
+            elif last["key"].start <= key < last["key"].stop:
+                last["value"][key - last["key"].start] = mod["value"]
+                return True
+            elif key == last["key"].stop:
+                last["key"] = slice(last["key"].start, key + 1)
+                last["value"].append(mod["value"])
+                return True
+        return False
+
+    def publish(self, mod):
+        with self._lock:
+            if not mod["path"]:
+                self._pending.append(mod)
+                self.flush()
+                return
+            mod = dict(mod)
+            if mod["action"] == "append":
+                mod["x"] = _snapshot(mod["x"])
+            elif "value" in mod:
+                mod["value"] = _snapshot(mod["value"])
+            if not self._merge(mod):
+                self._pending.append(mod)
+            if len(self._pending) >= self.max_mods:
+                self.flush()
+            elif self._timer is None and self.period != float("inf"):
+                self._timer = threading.Timer(self.period, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Publishes all pending mods."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+            mods = self._pending
+            self._pending = []
+            self.publish_batch(mods)
 
 
 class DatasetManager:
-    def __init__(self, ddb):
+    """Manages the datasets of an experiment.
+
+    If ``batch`` is set, mods of broadcast datasets are published through a
+    :class:`DatasetModBatcher` using the ``update_batch`` method of ``ddb``
+    (which takes a list of mods) instead of ``update``.
+    """
+    def __init__(self, ddb, batch=False):
         self._broadcaster = Notifier(dict())
         self.local = dict()
         self.archive = dict()
         self.metadata = dict()
 
+        # State of the incremental HDF5 writes (see hdf5_write_ops)
+        self._hdf5_started = False
+        self._hdf5_dirty = set()
+        self._hdf5_appended = dict()  # key -> number of values appended
+        self._hdf5_rows = dict()  # key -> (dtype, row shape) of resizable datasets
+        self._hdf5_archive_dirty = set()
+        # Set by the worker to enable checkpoint()
+        self.checkpoint_handler = None
+
         self.ddb = ddb
-        self._broadcaster.publish = ddb.update
+        if batch:
+            self.batcher = DatasetModBatcher(ddb.update_batch,
+                                             self._broadcaster.raw_view)
+            self._broadcaster.publish = self.batcher.publish
+        else:
+            self.batcher = None
+            self._broadcaster.publish = ddb.update
+
+    def flush(self):
+        """Publishes broadcast dataset mods queued by the batcher, if any."""
+        if self.batcher is not None:
+            self.batcher.flush()
 
     def set(self, key, value, metadata, broadcast, persist, archive):
         if persist:
@@ -140,8 +344,11 @@ class DatasetManager:
 
         if archive:
             self.local[key] = value
+            self._hdf5_dirty.add(key)
         elif key in self.local:
             del self.local[key]
+            self._hdf5_dirty.add(key)
+        self._hdf5_appended.pop(key, None)
         
         self.metadata[key] = metadata
 
@@ -163,9 +370,13 @@ class DatasetManager:
             else:
                 index = slice(*index)
         setitem(target, index, value)
+        if key in self.local:
+            self._hdf5_dirty.add(key)
 
     def append_to(self, key, value):
         self._get_mutation_target(key).append(value)
+        if key in self.local and key not in self._hdf5_dirty:
+            self._hdf5_appended[key] = self._hdf5_appended.get(key, 0) + 1
 
     def get(self, key, archive=False):
         if key in self.local:
@@ -177,6 +388,7 @@ class DatasetManager:
                 logger.warning("Dataset '%s' is already in archive, "
                                "overwriting", key, stack_info=True)
             self.archive[key] = data
+            self._hdf5_archive_dirty.add(key)
         return data
 
     def get_metadata(self, key):
@@ -184,6 +396,13 @@ class DatasetManager:
             return self.metadata[key]
         return self.ddb.get_metadata(key)
 
+    def checkpoint(self):
+        """Requests the archived datasets to be written to the results file
+        before the end of the experiment. Has no effect if the dataset manager
+        does not write a results file."""
+        if self.checkpoint_handler is not None:
+            self.checkpoint_handler()
+
     def write_hdf5(self, f):
         datasets_group = f.create_group("datasets")
         for k, v in self.local.items():
@@ -195,14 +414,150 @@ class DatasetManager:
             m = self.metadata.get(k, {})
             _write(archive_group, k, v, m)
 
-
-def _write(group, k, v, m):
+    def _hdf5_write_op(self, k, resizable):
+        v = self.local[k]
+        m = self.metadata.get(k, {})
+        self._hdf5_rows.pop(k, None)
+        if type(v) is list and resizable:
+            array = numpy.array(v)
+            if array.ndim > 0 and array.dtype.kind in "biufc":
+                self._hdf5_rows[k] = (array.dtype, array.shape[1:])
+                return ("write", "datasets", k, array, m, True)
+            v = copy.deepcopy(v)
+        elif isinstance(v, numpy.ndarray):
+            v = v.copy()
+        else:
+            v = copy.deepcopy(v)
+        return ("write", "datasets", k, v, m, False)
+
+    def hdf5_write_ops(self, checkpoint=False):
+        """Returns the operations that bring the results file up to date with
+        the archived datasets, to be applied with :func:`write_hdf5_ops`.
+
+        The operations hold copies of the data, and can be applied from
+        another thread. The first call produces a complete file (to be opened
+        in ``w`` mode); later calls only produce operations for the datasets
+        that have been changed since (and the file should be opened in ``a``
+        mode). With ``checkpoint``, lists of numbers are stored as resizable
+        datasets that are extended in place by later calls if values have only
+        been appended to them; other datasets are stored as by
+        :meth:`write_hdf5`.
+
+        Changed datasets are overwritten in place if their shape and type
+        are unchanged. Otherwise, they are deleted and written again, and
+        HDF5 does not reuse the space of the deleted data: the file then
+        grows by the size of the dataset with each call.
+        """
+        ops = []
+        if not self._hdf5_started:
+            self._hdf5_started = True
+            self._hdf5_rows.clear()
+            dirty = set(self.local.keys())
+            archive_dirty = set(self.archive.keys())
+            appended = dict()
+        else:
+            dirty = self._hdf5_dirty
+            archive_dirty = self._hdf5_archive_dirty
+            appended = self._hdf5_appended
+        self._hdf5_dirty = set()
+        self._hdf5_archive_dirty = set()
+        self._hdf5_appended = dict()
+
+        for k in sorted(dirty):
+            if k in self.local:
+                ops.append(self._hdf5_write_op(k, checkpoint))
+            else:
+                self._hdf5_rows.pop(k, None)
+                ops.append(("delete", "datasets", k))
+        for k, n in appended.items():
+            if k in dirty or k not in self.local:
+                continue
+            rows = self._hdf5_rows.get(k)
+            new = numpy.array(self.local[k][-n:])
+            if (rows is not None and new.dtype == rows[0]
+                    and new.shape[1:] == rows[1]):
+                ops.append(("append", "datasets", k, new))
+            else:
+                ops.append(self._hdf5_write_op(k, checkpoint))
+        for k in sorted(archive_dirty):
+            v = self.archive[k]
+            if isinstance(v, numpy.ndarray):
+                v = v.copy()
+            else:
+                v = copy.deepcopy(v)
+            ops.append(("write", "archive", k, v,
+                        self.metadata.get(k, {}), False))
+        return ops
+
+
+def write_hdf5_ops(f, ops):
+    """Applies operations returned by :meth:`DatasetManager.hdf5_write_ops`
+    to an HDF5 file."""
+    for group_name in "datasets", "archive":
+        f.require_group(group_name)
+    for op in ops:
+        action, group_name, k = op[:3]
+        group = f[group_name]
+        if action == "write":
+            v, m, resizable = op[3:]
+            if k in group:
+                if _overwrite(group[k], v, m, resizable):
+                    continue
+                del group[k]
+            _write(group, k, v, m, resizable)
+        elif action == "append":
+            rows = op[3]
+            dataset = group[k]
+            n = dataset.shape[0]
+            dataset.resize(n + rows.shape[0], axis=0)
+            dataset[n:] = rows
+        elif action == "delete":
+            if k in group:
+                del group[k]
+        else:
+            raise ValueError("Unknown HDF5 write operation: " + action)
+
+
+def _overwrite(dataset, v, m, resizable):
+    # Writes v into an existing dataset if it has the same shape and type
+    # (and storage options), as deleting a dataset does not free its space.
+    if not hasattr(dataset, "dtype"):
+        return False
+    if resizable and dataset.maxshape[:1] != (None,):
+        return False
+    options = m.get("hdf5_options", {})
+    if any(getattr(dataset, key, None) != val for key, val in options.items()):
+        return False
+    try:
+        array = numpy.asarray(v)
+    except ValueError:
+        return False
+    if array.shape != dataset.shape or array.dtype != dataset.dtype:
+        return False
+    dataset[...] = array
+    dataset.attrs.clear()
+    for key, val in m.items():
+        if key != "hdf5_options":
+            dataset.attrs[key] = val
+    return True
+
+
+def _write(group, k, v, m, resizable=False):
     # Add context to exception message when the user writes a dataset that is
     # not representable in HDF5.
     try:
-        group[k] = v
+        options = m.get("hdf5_options", {})
+        if resizable:
+            kwargs = {"maxshape": (None,) + v.shape[1:], "chunks": True}
+            kwargs.update(options)
+            group.create_dataset(k, data=v, **kwargs)
+        elif options and numpy.ndim(v) > 0:
+            group.create_dataset(k, data=v, **options)
+        else:
+            group[k] = v
         for key, val in m.items():
-            group[k].attrs[key] = val
+            if key != "hdf5_options":
+                group[k].attrs[key] = val
     except TypeError as e:
         raise TypeError("Error writing dataset '{}' of type '{}': {}".format(
             k, type(v), e))
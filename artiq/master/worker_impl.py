@@ -9,6 +9,7 @@ process via IPC.
 import sys
 import time
 import os
+import copy
 import inspect
 import logging
 import traceback
@@ -16,6 +17,7 @@ from collections import OrderedDict
 import importlib.util
 import linecache
 import threading
+import queue
 
 import h5py
 
@@ -25,7 +27,9 @@ from sipyco.logging_tools import multiline_log_config
 
 import artiq
 from artiq import tools
-from artiq.master.worker_db import DeviceManager, DatasetManager, DummyDevice
+from artiq.master import worker_ipc
+from artiq.master.worker_db import (DeviceManager, DatasetManager, DummyDevice,
+                                    write_hdf5_ops)
 from artiq.language.environment import (
     is_public_experiment, TraceArgumentManager, ProcessArgumentManager
 )
@@ -38,19 +42,21 @@ from artiq import __version__ as artiq_version
 
 ipc = None
 ipc_lock = threading.Lock()
+# Publishes dataset mods queued in the worker. Called before any request to
+# the parent, so that the parent processes requests and mods in order.
+flush_dataset_mods = None
 
 
 def get_object():
     ipc_lock.acquire()
     try:
-        line = ipc.readline()
+        return worker_ipc.read_object(ipc)
     finally:
         ipc_lock.release()
-    return pyon.decode(line.decode())
 
 
 def put_object(obj):
-    ds = (pyon.encode(obj) + "\n").encode()
+    ds = worker_ipc.encode(obj)
     ipc_lock.acquire()
     try:
         ipc.write(ds)
@@ -59,18 +65,19 @@ def put_object(obj):
 
 
 def put_and_get_object(obj):
-    ds = (pyon.encode(obj) + "\n").encode()
+    ds = worker_ipc.encode(obj)
     ipc_lock.acquire()
     try:
         ipc.write(ds)
-        line = ipc.readline()
+        return worker_ipc.read_object(ipc)
     finally:
         ipc_lock.release()
-    return pyon.decode(line.decode())
 
 
 def make_parent_action(action):
     def parent_action(*args, **kwargs):
+        if flush_dataset_mods is not None:
+            flush_dataset_mods()
         request = {"action": action, "args": args, "kwargs": kwargs}
         reply = put_and_get_object(request)
         if "action" in reply:
@@ -85,14 +92,58 @@ def make_parent_action(action):
     return parent_action
 
 
+def make_parent_batch_action(action):
+    """Returns a function that takes a list of argument tuples and sends the
+    corresponding requests to the parent in one message, without waiting
+    for replies. Failures are logged by the parent."""
+    def parent_batch_action(args_list):
+        requests = [{"action": action, "args": args, "kwargs": {}}
+                    for args in args_list]
+        put_object({"action": "batch", "requests": requests})
+    return parent_batch_action
+
+
 class ParentDeviceDB:
-    get_device_db = make_parent_action("get_device_db")
-    get = make_parent_action("get_device")
+    """Device database of the master, fetched once and cached, with aliases
+    resolved locally. The cache is invalidated at the beginning of each
+    action from the master, so that rescans of the device database take
+    effect at the next stage at the latest. Callers receive copies, which
+    they may modify without affecting the cache."""
+    _get_device_db = make_parent_action("get_device_db")
+    _cache = None
+
+    @staticmethod
+    def invalidate():
+        ParentDeviceDB._cache = None
+
+    @staticmethod
+    def _get_cached():
+        if ParentDeviceDB._cache is None:
+            ParentDeviceDB._cache = ParentDeviceDB._get_device_db()
+        return ParentDeviceDB._cache
+
+    @staticmethod
+    def get_device_db():
+        return copy.deepcopy(ParentDeviceDB._get_cached())
+
+    @staticmethod
+    def get(key, resolve_alias=False):
+        device_db = ParentDeviceDB._get_cached()
+        desc = device_db[key]
+        if resolve_alias:
+            while isinstance(desc, str):
+                desc = device_db[desc]
+        return copy.deepcopy(desc)
 
 
 class ParentDatasetDB:
     get = make_parent_action("get_dataset")
     update = make_parent_action("update_dataset")
+    _update_batch = staticmethod(make_parent_batch_action("update_dataset"))
+
+    @staticmethod
+    def update_batch(mods):
+        ParentDatasetDB._update_batch([(mod,) for mod in mods])
     get_metadata = make_parent_action("get_dataset_metadata")
 
 
@@ -192,10 +243,17 @@ def get_experiment_from_content(content, class_name):
 
 
 register_experiment = make_parent_action("register_experiment")
+register_dependencies = make_parent_action("register_dependencies")
 
 
 class ExamineDeviceMgr:
-    get_device_db = make_parent_action("get_device_db")
+    # Whether the result of the examination depends on the device database
+    used_db = False
+
+    @staticmethod
+    def get_device_db():
+        ExamineDeviceMgr.used_db = True
+        return ParentDeviceDB.get_device_db()
 
     @staticmethod
     def get(name):
@@ -203,17 +261,24 @@ class ExamineDeviceMgr:
 
 
 class ExamineDatasetMgr:
+    # Whether the result of the examination depends on datasets
+    used_db = False
+
     @staticmethod
     def get(key, archive=False):
+        ExamineDatasetMgr.used_db = True
         return ParentDatasetDB.get(key)
 
     @staticmethod
     def get_metadata(key):
+        ExamineDatasetMgr.used_db = True
         return ParentDatasetDB.get_metadata(key)
 
 
 def examine(device_mgr, dataset_mgr, file):
     previous_keys = set(sys.modules.keys())
+    device_mgr.used_db = False
+    dataset_mgr.used_db = False
     try:
         module = tools.file_import(file)
         for class_name, exp_class in inspect.getmembers(module, is_public_experiment):
@@ -234,6 +299,15 @@ def examine(device_mgr, dataset_mgr, file):
             if hasattr(exp_class, "argument_ui"):
                 argument_ui = exp_class.argument_ui
             register_experiment(class_name, name, arginfo, argument_ui, scheduler_defaults)
+        # Report the source files the examination depended on, for the
+        # master to decide whether the result can be reused.
+        files = set()
+        for key in set(sys.modules.keys()) - previous_keys:
+            module_file = getattr(sys.modules[key], "__file__", None)
+            if module_file is not None:
+                files.add(os.path.abspath(module_file))
+        register_dependencies(sorted(files),
+                              not (device_mgr.used_db or dataset_mgr.used_db))
     finally:
         new_keys = set(sys.modules.keys())
         for key in new_keys - previous_keys:
@@ -279,11 +353,61 @@ def setup_diagnostics(experiment_file, repository_path):
         render_diagnostic
 
 
+class ResultsWriter:
+    """Writes the HDF5 results file from a background thread.
+
+    Jobs are queued (with a bounded queue, blocking when full) and applied
+    in order. An exception raised by a job is re-raised by :meth:`join`, and
+    further jobs are discarded until then."""
+    def __init__(self, max_pending=2):
+        self._queue = queue.Queue(max_pending)
+        self._thread = None
+        self._exception = None
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if self._exception is None:
+                    filename, mode, ops, fields = job
+                    with h5py.File(filename, mode) as f:
+                        write_hdf5_ops(f, ops)
+                        for k, v in fields.items():
+                            if k in f:
+                                del f[k]
+                            f[k] = v
+            except Exception as e:
+                self._exception = e
+            finally:
+                self._queue.task_done()
+
+    def submit(self, filename, mode, ops, fields):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        self._queue.put((filename, mode, ops, fields))
+
+    def join(self):
+        self._queue.join()
+        if self._exception is not None:
+            exception = self._exception
+            self._exception = None
+            raise exception
+
+
 def put_completed():
+    if flush_dataset_mods is not None:
+        flush_dataset_mods()
     put_object({"action": "completed"})
 
 
 def put_exception_report():
+    if flush_dataset_mods is not None:
+        try:
+            flush_dataset_mods()
+        except:
+            logging.warning("failed to publish pending dataset changes",
+                            exc_info=True)
     _, exc, _ = sys.exc_info()
     # When we get CompileError, a more suitable diagnostic has already
     # been printed.
@@ -303,12 +427,33 @@ def put_exception_report():
     put_object({"action": "exception"})
 
 
+def precompile_kernels(exp_inst):
+    # Replaces the kernels declared by the experiment with callables that
+    # execute their precompiled versions.
+    for name in exp_inst.precompile_kernels:
+        function = getattr(exp_inst, name)
+        if not hasattr(function, "artiq_embedded") or function.artiq_embedded.core_name is None:
+            raise ValueError("{} is not a kernel".format(name))
+        core = getattr(exp_inst, function.artiq_embedded.core_name)
+        setattr(exp_inst, name,
+                core.precompile_ahead(function, exp_inst.precompile_policy))
+
+
 def main():
-    global ipc
+    global ipc, flush_dataset_mods
 
     multiline_log_config(level=int(sys.argv[2]))
     ipc = pipe_ipc.ChildComm(sys.argv[1])
 
+    # Additional modules requested by the master's worker pool, imported
+    # before any experiment is received.
+    for module_name in sys.argv[3:]:
+        try:
+            importlib.import_module(module_name)
+        except:
+            logging.warning("failed to preload module '%s'", module_name,
+                            exc_info=True)
+
     start_time = None
     run_time = None
     rid = None
@@ -317,20 +462,36 @@ def main():
     exp_inst = None
     repository_path = None
 
-    def write_results():
+    results_writer = ResultsWriter()
+    results_file_created = False
+
+    def write_results(wait=True, checkpoint=False):
+        # Writes the datasets changed since the last call, in the background
+        # unless wait is set.
+        nonlocal results_file_created
         filename = "{:09}-{}.h5".format(rid, exp.__name__)
-        with h5py.File(filename, "w") as f:
-            dataset_mgr.write_hdf5(f)
-            f["artiq_version"] = artiq_version
-            f["rid"] = rid
-            f["start_time"] = start_time
-            f["run_time"] = run_time
-            f["expid"] = pyon.encode(expid)
+        mode = "a" if results_file_created else "w"
+        results_file_created = True
+        fields = {
+            "artiq_version": artiq_version,
+            "rid": rid,
+            "start_time": start_time,
+            "expid": pyon.encode(expid)
+        }
+        if run_time is not None:
+            fields["run_time"] = run_time
+        results_writer.submit(filename, mode,
+                              dataset_mgr.hdf5_write_ops(checkpoint), fields)
+        if wait:
+            results_writer.join()
 
     device_mgr = DeviceManager(ParentDeviceDB,
                                virtual_devices={"scheduler": Scheduler(),
                                                 "ccb": CCB()})
-    dataset_mgr = DatasetManager(ParentDatasetDB)
+    dataset_mgr = DatasetManager(ParentDatasetDB, batch=True)
+    dataset_mgr.checkpoint_handler = lambda: write_results(
+        wait=False, checkpoint=True)
+    flush_dataset_mods = dataset_mgr.flush
 
     import_cache.install_hook()
 
@@ -338,10 +499,14 @@ def main():
         while True:
             obj = get_object()
             action = obj["action"]
+            ParentDeviceDB.invalidate()
             if action == "build":
                 start_time = time.time()
                 rid = obj["rid"]
                 expid = obj["expid"]
+                # The process may have been started ahead of time by the
+                # worker pool with a different log level.
+                logging.getLogger().setLevel(expid["log_level"])
                 if "devarg_override" in expid:
                     device_mgr.devarg_override = expid["devarg_override"]
                 if "file" in expid:
@@ -371,6 +536,7 @@ def main():
                 put_completed()
             elif action == "prepare":
                 exp_inst.prepare()
+                precompile_kernels(exp_inst)
                 put_completed()
             elif action == "run":
                 run_time = time.time()
@@ -389,6 +555,10 @@ def main():
                         # callbacks produce an exception
                         write_results()
                         raise
+                # Start writing the results of run() in the background while
+                # analyze() executes; the datasets it changes are written at
+                # the end of the analyze stage.
+                write_results(wait=False)
                 put_completed()
             elif action == "analyze":
                 try:
@@ -409,6 +579,11 @@ def main():
         put_exception_report()
     finally:
         device_mgr.close_devices()
+        try:
+            # complete checkpoints of runs that did not reach a results write
+            results_writer.join()
+        except:
+            logging.error("failed to write results", exc_info=True)
         ipc.close()
 
 
@@ -0,0 +1,193 @@
+"""Message framing for the pipe IPC between the master and worker processes.
+
+Messages are normally sent as PYON text lines. Messages that contain large
+NumPy arrays are sent as length-prefixed binary frames instead: the arrays
+are replaced by placeholders in a PYON header and transferred afterwards as
+raw buffers, avoiding the text encoding and decoding of their contents.
+Receivers accept both forms of messages.
+
+Binary frame layout (little-endian)::
+
+    FRAME_MARKER
+    u32 header length, u32 buffer count
+    header: PYON encoding of (object, [(dtype, shape), ...])
+    for each buffer: u64 length, raw contents
+"""
+
+import struct
+
+import numpy
+
+from sipyco import pyon
+
+
+# NumPy arrays of at least this many bytes are sent as raw buffers.
+# Set to None to always send PYON text lines.
+buffer_threshold = 4096
+
+FRAME_MARKER = b"\x00"
+
+_frame_header = struct.Struct("<II")
+_buffer_length = struct.Struct("<Q")
+
+_placeholder = "__artiq_ipc_buffer__"
+# Lists starting with one of those are assumed not to contain arrays.
+# This only affects whether arrays are sent as raw buffers, not correctness,
+# as long as encoder and decoder make the same assumption.
+_scalar_types = {int, float, bool, str, bytes, complex, type(None)}
+
+
+def _extract(obj, buffers, threshold):
+    ty = type(obj)
+    if ty is numpy.ndarray:
+        if (obj.nbytes >= threshold
+                and not obj.dtype.hasobject and obj.dtype.fields is None):
+            if not obj.flags.c_contiguous:
+                obj = numpy.ascontiguousarray(obj)
+            buffers.append(obj)
+            return (_placeholder, len(buffers) - 1)
+        return obj
+    elif ty is tuple:
+        r = tuple(_extract(e, buffers, threshold) for e in obj)
+        if r and type(r[0]) is str and r[0] == _placeholder:
+            # escape user tuples that look like placeholders
+            r = (_placeholder, None, r)
+        return r
+    elif ty is list:
+        if not obj or type(obj[0]) in _scalar_types:
+            return obj
+        return [_extract(e, buffers, threshold) for e in obj]
+    elif isinstance(obj, dict):
+        return ty((k, _extract(v, buffers, threshold))
+                  for k, v in obj.items())
+    else:
+        return obj
+
+
+def _restore(obj, buffers):
+    ty = type(obj)
+    if ty is tuple:
+        if obj and type(obj[0]) is str and obj[0] == _placeholder:
+            if obj[1] is None:
+                return tuple(_restore(e, buffers) for e in obj[2])
+            return buffers[obj[1]]
+        return tuple(_restore(e, buffers) for e in obj)
+    elif ty is list:
+        if obj and type(obj[0]) not in _scalar_types:
+            for i, e in enumerate(obj):
+                obj[i] = _restore(e, buffers)
+        return obj
+    elif isinstance(obj, dict):
+        for k, v in obj.items():
+            obj[k] = _restore(v, buffers)
+        return obj
+    else:
+        return obj
+
+
+def extract_buffers(obj, threshold=0):
+    """Replaces the NumPy arrays of at least ``threshold`` bytes in ``obj``
+    with placeholders.
+
+    Returns the PYON-serializable object with placeholders and the list of
+    C-contiguous arrays. The input object is not modified."""
+    buffers = []
+    obj = _extract(obj, buffers, threshold)
+    return obj, buffers
+
+
+def restore_buffers(obj, arrays):
+    """Substitutes the placeholders in ``obj`` (as returned by
+    :func:`extract_buffers` and decoded) with ``arrays``, in place where
+    possible."""
+    return _restore(obj, arrays)
+
+
+def encode(obj):
+    """Encodes a message, returning a PYON line or a binary frame."""
+    buffers = []
+    if buffer_threshold is not None:
+        obj, buffers = extract_buffers(obj, buffer_threshold)
+    if not buffers:
+        return (pyon.encode(obj) + "\n").encode()
+    descs = [(b.dtype.str, b.shape) for b in buffers]
+    header = pyon.encode((obj, descs)).encode()
+    parts = [FRAME_MARKER, _frame_header.pack(len(header), len(buffers)),
+             header]
+    for b in buffers:
+        parts.append(_buffer_length.pack(b.nbytes))
+        parts.append(memoryview(b.reshape(-1).view(numpy.uint8)))
+    return b"".join(parts)
+
+
+def decode_line(line):
+    return pyon.decode(line.decode())
+
+
+def decode_frame(header, buffers):
+    """Decodes a binary frame from its header and list of raw buffers.
+
+    Buffers should be writable (e.g. ``bytearray``) so that the arrays
+    reconstructed from them are."""
+    obj, descs = pyon.decode(header.decode())
+    arrays = [numpy.frombuffer(buf, dtype=dtype).reshape(shape)
+              for buf, (dtype, shape) in zip(buffers, descs)]
+    return restore_buffers(obj, arrays)
+
+
+def _read_exactly(read, n):
+    data = bytearray()
+    while len(data) < n:
+        chunk = read(n - len(data))
+        if not chunk:
+            raise EOFError
+        data += chunk
+    return data
+
+
+def read_object(ipc):
+    """Reads and decodes one message from a synchronous IPC channel
+    (worker side)."""
+    first = ipc.read(1)
+    if not first:
+        raise EOFError
+    if first != FRAME_MARKER:
+        return decode_line(first + ipc.readline())
+    header_length, buffer_count = _frame_header.unpack(
+        _read_exactly(ipc.read, _frame_header.size))
+    header = _read_exactly(ipc.read, header_length)
+    buffers = []
+    for _ in range(buffer_count):
+        length, = _buffer_length.unpack(
+            _read_exactly(ipc.read, _buffer_length.size))
+        buffers.append(_read_exactly(ipc.read, length))
+    return decode_frame(header, buffers)
+
+
+async def _async_read_exactly(read, n):
+    data = bytearray()
+    while len(data) < n:
+        chunk = await read(n - len(data))
+        if not chunk:
+            raise EOFError
+        data += chunk
+    return data
+
+
+async def async_read_object(ipc):
+    """Reads and decodes one message from an asyncio IPC channel
+    (master side)."""
+    first = await ipc.read(1)
+    if not first:
+        raise EOFError
+    if first != FRAME_MARKER:
+        return decode_line(first + await ipc.readline())
+    header_length, buffer_count = _frame_header.unpack(
+        await _async_read_exactly(ipc.read, _frame_header.size))
+    header = await _async_read_exactly(ipc.read, header_length)
+    buffers = []
+    for _ in range(buffer_count):
+        length, = _buffer_length.unpack(
+            await _async_read_exactly(ipc.read, _buffer_length.size))
+        buffers.append(await _async_read_exactly(ipc.read, length))
+    return decode_frame(header, buffers)
@@ -0,0 +1,414 @@
+"""
+Local stand-in for the session protocol of the core device, so that the
+host side of :class:`artiq.coredevice.comm_kernel.CommKernel` (kernel
+loading, RPCs, exceptions) can be tested and benchmarked without hardware.
+
+The stand-in listens on a local socket and, when the host runs a kernel,
+replays a script of steps (:class:`RPC` and :class:`RaiseException`)
+instead of executing the kernel, then reports that the kernel finished.
+"""
+
+import time
+import struct
+import socket
+import threading
+
+import numpy
+
+from artiq.coredevice.comm_kernel import Request, Reply
+from artiq import __version__ as software_version
+
+
+_packed_widths = {"b": 1, "i": 4, "I": 8, "f": 8}
+
+
+def _tag(value):
+    # Tag of a value sent by the device, following compiler/ir.py:rpc_tag.
+    if value is None:
+        return b"n"
+    elif isinstance(value, (bool, numpy.bool_)):
+        return b"b"
+    elif isinstance(value, numpy.int32):
+        return b"i"
+    elif isinstance(value, (int, numpy.int64)):
+        return b"i" if -2**31 <= value < 2**31 else b"I"
+    elif isinstance(value, float):
+        return b"f"
+    elif isinstance(value, str):
+        return b"s"
+    elif isinstance(value, bytes):
+        return b"B"
+    elif isinstance(value, bytearray):
+        return b"A"
+    elif isinstance(value, tuple):
+        return b"t"
+    elif isinstance(value, list):
+        return b"l"
+    elif isinstance(value, numpy.ndarray):
+        return b"a"
+    else:
+        raise TypeError("cannot encode {!r} as an RPC argument".format(value))
+
+
+def _encode_data(tag, value, endian):
+    if tag == b"n":
+        return b""
+    elif tag == b"b":
+        return b"\x01" if value else b"\x00"
+    elif tag == b"i":
+        return struct.pack(endian + "l", value)
+    elif tag == b"I":
+        return struct.pack(endian + "q", value)
+    elif tag == b"f":
+        return struct.pack(endian + "d", value)
+    elif tag in (b"s", b"B", b"A"):
+        data = value.encode("utf-8") if tag == b"s" else bytes(value)
+        return struct.pack(endian + "l", len(data)) + data
+    elif tag == b"t":
+        return bytes([len(value)]) + b"".join(encode_value(elt, endian) for elt in value)
+    elif tag == b"l":
+        element_tag = _tag(value[0]) if value else b"i"
+        if element_tag in (b"I", b"i") and any(_tag(elt) == b"I" for elt in value):
+            element_tag = b"I"
+        data = struct.pack(endian + "l", len(value)) + element_tag
+        if element_tag.decode() in _packed_widths:
+            # Lists of numbers are sent packed, other elements are tagged.
+            return data + b"".join(_encode_data(element_tag, elt, endian) for elt in value)
+        return data + b"".join(element_tag + _encode_data(element_tag, elt, endian)
+                               for elt in value)
+    elif tag == b"a":
+        element_tag = {"b": b"b", "i": b"i" if value.itemsize == 4 else b"I",
+                       "u": b"I", "f": b"f"}[value.dtype.kind]
+        dtype = {b"b": "?", b"i": "i4", b"I": "i8", b"f": "f8"}[element_tag]
+        return (bytes([value.ndim]) +
+                b"".join(struct.pack(endian + "l", dim) for dim in value.shape) +
+                element_tag + value.astype(endian + dtype if dtype != "?" else dtype).tobytes())
+
+
+def encode_value(value, endian="<"):
+    """Encodes ``value`` as the core device sends RPC arguments."""
+    tag = _tag(value)
+    return tag + _encode_data(tag, value, endian)
+
+
+def encode_args(args=(), kwargs={}, endian="<"):
+    """Encodes the arguments of an RPC, including the final sentinel."""
+    data = b"".join(encode_value(arg, endian) for arg in args)
+    for name, value in kwargs.items():
+        name = name.encode("utf-8")
+        data += b"k" + struct.pack(endian + "l", len(name)) + name + encode_value(value, endian)
+    return data + b"\x00"
+
+
+class RPC:
+    """Step calling the service ``service_id`` of the embedding map of the
+    kernel ``count`` times.
+
+    :param args: positional arguments, encoded with :func:`encode_args`.
+    :param kwargs: keyword arguments.
+    :param is_async: whether the stand-in waits for the result.
+    :param return_tags: type tags of the result (see
+        ``compiler/ir.py:rpc_tag``), which are checked against the reply.
+    :param rate: number of calls per second, or ``None`` to send them as fast
+        as possible.
+    """
+    def __init__(self, service_id, args=(), kwargs={}, is_async=False,
+                 return_tags=b"n", count=1, rate=None):
+        self.service_id = service_id
+        self.args = args
+        self.kwargs = kwargs
+        self.is_async = is_async
+        self.return_tags = return_tags
+        self.count = count
+        self.rate = rate
+
+
+class RaiseException:
+    """Step raising an exception in the kernel, which ends it.
+
+    :param name_id: ID of the string ``"<id>:<exception name>"`` in the
+        embedding map of the kernel (with ID 0 for the builtin exceptions).
+    """
+    def __init__(self, name_id, message, params=(0, 0, 0),
+                 filename="<stand-in>", line=0, column=-1, function="run"):
+        self.name_id = name_id
+        self.message = message
+        self.params = params
+        self.filename = filename
+        self.line = line
+        self.column = column
+        self.function = function
+
+
+class CoreDeviceStandin:
+    """Core device stand-in, serving one connection at a time.
+
+    :param kernel: list of steps replayed whenever a kernel is run.
+    :param load_error: if not ``None``, loading kernels fails with this
+        message.
+
+    :var loaded: sizes of the kernel libraries loaded so far.
+    :var replies: raw result of each synchronous RPC (without type tags),
+        or the string IDs of the exception raised by it.
+    :var latencies: time between sending each synchronous RPC and receiving
+        its reply, in seconds.
+    :var error: exception raised by the last connection, if the host did not
+        follow the protocol.
+    """
+    def __init__(self, kernel=(), load_error=None, endian="<"):
+        self.kernel = list(kernel)
+        self.load_error = load_error
+        self.endian = endian
+        self.loaded = []
+        self.replies = []
+        self.latencies = []
+        self.recorded = None
+        self.error = None
+
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.host, self.port = self.listener.getsockname()
+        self.connection = None
+        self.thread = threading.Thread(target=self._accept, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        # Shutting the sockets down interrupts the blocking calls of the thread.
+        for sock in self.listener, self.connection:
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        self.listener.close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def _accept(self):
+        while True:
+            try:
+                self.connection, _ = self.listener.accept()
+            except OSError:
+                return
+            with self.connection:
+                self.reader = self.connection.makefile("rb")
+                try:
+                    self._serve()
+                except (ConnectionError, EOFError):
+                    pass
+                except Exception as exn:
+                    self.error = exn
+                finally:
+                    self.reader.close()
+
+    #
+    # Reader interface
+    #
+
+    def _read(self, length):
+        data = self.reader.read(length)
+        if len(data) < length:
+            raise EOFError
+        if self.recorded is not None:
+            self.recorded += data
+        return data
+
+    def _read_int8(self):
+        return self._read(1)[0]
+
+    def _read_int32(self):
+        return struct.unpack(self.endian + "l", self._read(4))[0]
+
+    def _read_bytes(self):
+        return self._read(self._read_int32())
+
+    def _read_header(self):
+        sync_count = 0
+        while sync_count < 4:
+            if self._read_int8() == 0x5a:
+                sync_count += 1
+            else:
+                sync_count = 0
+        return Request(self._read_int8())
+
+    def _skip_value(self, tags, index):
+        # Reads a result encoded by CommKernel._send_rpc_value, and returns
+        # the index of the tags that follow.
+        tag = chr(tags[index])
+        index += 1
+        if tag in _packed_widths:
+            self._read(_packed_widths[tag])
+        elif tag == "F":
+            self._read(16)
+        elif tag in "sBA":
+            self._read_bytes()
+        elif tag == "t":
+            length = tags[index]
+            index += 1
+            for _ in range(length):
+                index = self._skip_value(tags, index)
+        elif tag == "l":
+            length = self._read_int32()
+            element_index = index
+            index = self._skip_value_tags(tags, index)
+            for _ in range(length):
+                self._skip_value(tags, element_index)
+        elif tag == "a":
+            num_dims = tags[index]
+            length = 1
+            for _ in range(num_dims):
+                length *= self._read_int32()
+            element_index = index + 1
+            index = self._skip_value_tags(tags, element_index)
+            for _ in range(length):
+                self._skip_value(tags, element_index)
+        elif tag == "r":
+            for _ in range(3):
+                end = self._skip_value(tags, index)
+            index = end
+        elif tag != "n":
+            raise IOError("Unknown RPC value tag: {}".format(repr(tag)))
+        return index
+
+    def _skip_value_tags(self, tags, index):
+        tag = chr(tags[index])
+        index += 1
+        if tag == "t":
+            length = tags[index]
+            index += 1
+            for _ in range(length):
+                index = self._skip_value_tags(tags, index)
+        elif tag == "l":
+            index = self._skip_value_tags(tags, index)
+        elif tag == "a":
+            index = self._skip_value_tags(tags, index + 1)
+        elif tag == "r":
+            index = self._skip_value_tags(tags, index)
+        return index
+
+    #
+    # Writer interface
+    #
+
+    def _header(self, ty):
+        return b"\x5a\x5a\x5a\x5a" + bytes([ty.value])
+
+    def _write(self, ty, data=b""):
+        # Messages are sent with a single write, which avoids delays due to
+        # the interaction of Nagle's algorithm and delayed acknowledgements.
+        self.connection.sendall(self._header(ty) + data)
+
+    def _pack_int32(self, value):
+        return struct.pack(self.endian + "l", value)
+
+    def _pack_string(self, value):
+        value = value.encode("utf-8")
+        return self._pack_int32(len(value)) + value
+
+    #
+    # Session
+    #
+
+    def _serve(self):
+        if self._read(14) != b"ARTIQ coredev\n":
+            raise IOError("Incorrect session greeting")
+        self.connection.sendall(b"e" if self.endian == "<" else b"E")
+        while True:
+            request = self._read_header()
+            if request == Request.SystemInfo:
+                self._write(Reply.SystemInfo,
+                            b"AROR" + self._pack_string(software_version) + b"\x01")
+            elif request in (Request.LoadKernel, Request.SubkernelUpload):
+                if request == Request.SubkernelUpload:
+                    self._read(5)
+                self.loaded.append(len(self._read_bytes()))
+                if self.load_error is None:
+                    self._write(Reply.LoadCompleted)
+                else:
+                    self._write(Reply.LoadFailed, self._pack_string(self.load_error))
+            elif request == Request.RunKernel:
+                self._run_kernel()
+            else:
+                raise IOError("Unexpected request: {}".format(request))
+
+    def _run_kernel(self):
+        for step in self.kernel:
+            if isinstance(step, RPC):
+                exception = self._call(step)
+                if exception is not None:
+                    # The kernel does not catch the exception raised by the RPC.
+                    self._raise(*exception)
+                    return
+            else:
+                self._raise(step.name_id, self._pack_string(step.message), step.params,
+                            self._pack_string(step.filename), step.line, step.column,
+                            self._pack_string(step.function))
+                return
+        # No async errors.
+        self._write(Reply.KernelFinished, b"\x00")
+
+    def _call(self, step):
+        message = (self._header(Reply.RPCRequest) +
+                   (b"\x01" if step.is_async else b"\x00") +
+                   self._pack_int32(step.service_id) +
+                   encode_args(step.args, step.kwargs, self.endian) +
+                   self._pack_int32(len(step.return_tags)) + step.return_tags)
+        if step.is_async and step.rate is None:
+            # Coalesce the calls into large writes, like the device does.
+            batch = max(1, 65536 // len(message))
+            for i in range(0, step.count, batch):
+                self.connection.sendall(message * min(batch, step.count - i))
+            return
+
+        start = time.monotonic()
+        for i in range(step.count):
+            if step.rate is not None:
+                delay = start + i / step.rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            sent = time.monotonic()
+            self.connection.sendall(message)
+            if step.is_async:
+                continue
+
+            reply = self._read_header()
+            if reply == Request.RPCReply:
+                tags = self._read_bytes()
+                if tags != step.return_tags:
+                    raise IOError("Incorrect return tags: {!r}".format(tags))
+                self.recorded = bytearray()
+                try:
+                    self._skip_value(tags, 0)
+                    self.replies.append(bytes(self.recorded))
+                finally:
+                    self.recorded = None
+                self.latencies.append(time.monotonic() - sent)
+            elif reply == Request.RPCException:
+                name_id, message_id = self._read_int32(), self._read_int32()
+                params = struct.unpack(self.endian + "3q", self._read(24))
+                filename_id, line, column, function_id = struct.unpack(
+                    self.endian + "4l", self._read(16))
+                self.replies.append((name_id, message_id))
+                self.latencies.append(time.monotonic() - sent)
+                # Strings of the host are referred to by ID.
+                return (name_id, self._pack_int32(-1) + self._pack_int32(message_id), params,
+                        self._pack_int32(-1) + self._pack_int32(filename_id), line, column,
+                        self._pack_int32(-1) + self._pack_int32(function_id))
+            else:
+                raise IOError("Unexpected reply to RPC: {}".format(reply))
+
+    def _raise(self, name_id, message, params, filename, line, column, function):
+        self._write(Reply.KernelException,
+                    self._pack_int32(1) +
+                    self._pack_int32(name_id) + message +
+                    struct.pack(self.endian + "3q", *params) +
+                    filename + struct.pack(self.endian + "2l", line, column) + function +
+                    # Stack pointer and backtrace indices of the exception, and
+                    # an empty backtrace.
+                    struct.pack(self.endian + "4l", 0, 0, 0, 0) +
+                    # No async errors.
+                    b"\x00")
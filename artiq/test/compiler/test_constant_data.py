@@ -0,0 +1,79 @@
+import unittest
+import numpy
+
+from pythonparser import source, diagnostic
+
+from artiq.compiler import types, builtins, asttyped
+from artiq.compiler.transforms import IntMonomorphizer, LLVMIRGenerator
+from artiq.compiler.embedding import EmbeddingMap, _constant_data_type
+from artiq.compiler.targets import RV32GTarget
+
+
+class BigEndianTarget(RV32GTarget):
+    data_layout = "E-m:e-p:32:32-i64:64-n32-S128"
+
+
+def quote_bytes(target, value, elt_type):
+    generator = LLVMIRGenerator(None, "test", target, EmbeddingMap())
+    generator._quote_numeric_to_llglobal(value, elt_type, "", "list")
+    llglobal = generator.llmodule.get_global("quoted.list")
+    return bytes(llglobal.initializer.constant), llglobal.align
+
+
+class ConstantDataTypeCase(unittest.TestCase):
+    def test_list(self):
+        typ = _constant_data_type([1.0] * 32)
+        self.assertTrue(builtins.is_float(typ["elt"]))
+        typ = _constant_data_type(list(range(32)))
+        self.assertTrue(builtins.is_list(typ))
+        self.assertTrue(builtins.is_int(typ["elt"]))
+        # Width is left to be inferred from the quoted value.
+        self.assertTrue(types.is_var(typ["elt"].find()["width"]))
+        typ = _constant_data_type([numpy.int64(0)] * 32)
+        self.assertEqual(builtins.get_int_width(typ["elt"]), 64)
+
+    def test_array(self):
+        typ = _constant_data_type(numpy.zeros((2, 3), dtype=numpy.int32))
+        self.assertTrue(builtins.is_array(typ))
+        self.assertEqual(builtins.get_int_width(typ["elt"]), 32)
+        self.assertEqual(typ.find()["num_dims"].find().value, 2)
+
+    def test_fallback(self):
+        self.assertIsNone(_constant_data_type(list(range(31))))
+        self.assertIsNone(_constant_data_type([0] * 31 + [0.0]))
+        self.assertIsNone(_constant_data_type([True] * 32))
+        self.assertIsNone(_constant_data_type(numpy.zeros(32, dtype=bool)))
+        self.assertIsNone(_constant_data_type(numpy.zeros(32, dtype=numpy.float32)))
+        self.assertIsNone(_constant_data_type(numpy.int32(0)))
+
+
+class QuoteWidthCase(unittest.TestCase):
+    def width_of(self, value):
+        loc = source.Range(source.Buffer("table", "<input>"), 0, 5)
+        node = asttyped.QuoteT(value=value, type=_constant_data_type(value), loc=loc)
+        IntMonomorphizer(diagnostic.Engine(all_errors_are_fatal=True)).visit(node)
+        return builtins.get_int_width(node.type["elt"])
+
+    def test_width(self):
+        self.assertEqual(self.width_of([-2**31] + [2**31-1] * 31), 32)
+        self.assertEqual(self.width_of([0] * 31 + [2**31]), 64)
+        self.assertEqual(self.width_of([-2**31-1] + [0] * 31), 64)
+
+    def test_out_of_range(self):
+        with self.assertRaises(diagnostic.Error):
+            self.width_of([0] * 31 + [2**63])
+
+
+class QuoteNumericCase(unittest.TestCase):
+    def test_little_endian(self):
+        data, align = quote_bytes(RV32GTarget(), [1, 2], builtins.TInt32())
+        self.assertEqual(data, b"\x01\x00\x00\x00\x02\x00\x00\x00")
+        self.assertEqual(align, 4)
+
+    def test_big_endian(self):
+        target = BigEndianTarget()
+        data, align = quote_bytes(target, [1, -2], builtins.TInt64())
+        self.assertEqual(data, numpy.array([1, -2], dtype=">i8").tobytes())
+        self.assertEqual(align, 8)
+        data, _ = quote_bytes(target, numpy.array([1.0]), builtins.TFloat())
+        self.assertEqual(data, b"?\xf0\x00\x00\x00\x00\x00\x00")
@@ -0,0 +1,40 @@
+import unittest
+
+from artiq.compiler import profiler
+from artiq.compiler.profiler import CompileProfiler
+
+
+class CompileProfilerCase(unittest.TestCase):
+    def test_inactive(self):
+        compile_profiler = CompileProfiler()
+        with profiler.stage("parsing"):
+            pass
+        self.assertEqual(compile_profiler.stages, [])
+
+    def test_stages(self):
+        compile_profiler = CompileProfiler()
+        with compile_profiler.activate():
+            with profiler.stage("parsing"):
+                pass
+            with self.assertRaises(ValueError):
+                with profiler.stage("linking"):
+                    raise ValueError
+        with profiler.stage("stripping"):
+            pass
+
+        report = compile_profiler.report()
+        self.assertEqual([stage["name"] for stage in report["stages"]],
+                         ["parsing", "linking"])
+        self.assertIsNone(report["stages"][0]["peak_memory"])
+        self.assertAlmostEqual(report["time"],
+                               sum(stage["time"] for stage in report["stages"]))
+        self.assertEqual(compile_profiler.format().split("\n")[-1].split()[0], "total")
+
+    def test_memory(self):
+        compile_profiler = CompileProfiler(trace_memory=True)
+        with compile_profiler.activate():
+            with profiler.stage("allocation"):
+                data = bytearray(1 << 20)
+            del data
+        (_, _, peak_memory), = compile_profiler.stages
+        self.assertGreaterEqual(peak_memory, 1 << 20)
@@ -0,0 +1,107 @@
+import unittest
+import shutil
+import struct
+
+from llvmlite import binding as llvm
+
+from artiq.compiler.targets import RV32GTarget, CortexA9Target
+
+
+llir = """
+target triple = "riscv32-unknown-linux"
+target datalayout = "e-m:e-p:32:32-i64:64-n32-S128"
+
+@table = private unnamed_addr constant [4 x i32] [i32 1, i32 2, i32 3, i32 4]
+
+define i32 @__modinit__(i32 %index) {
+  %ptr = getelementptr [4 x i32], [4 x i32]* @table, i32 0, i32 %index
+  %value = load i32, i32* %ptr
+  ret i32 %value
+}
+"""
+
+debug_llir = """
+define i32 @__modinit__(i32 %x) !dbg !4 {
+  ret i32 %x, !dbg !7
+}
+
+!llvm.dbg.cu = !{!0}
+!llvm.module.flags = !{!3}
+!0 = distinct !DICompileUnit(language: DW_LANG_Python, file: !1, producer: "ARTIQ", isOptimized: false, runtimeVersion: 0, emissionKind: LineTablesOnly)
+!1 = !DIFile(filename: "test.py", directory: "")
+!3 = !{i32 2, !"Debug Info Version", i32 3}
+!4 = distinct !DISubprogram(name: "f", scope: !1, file: !1, line: 1, type: !5, spFlags: DISPFlagDefinition, unit: !0)
+!5 = !DISubroutineType(types: !6)
+!6 = !{}
+!7 = !DILocation(line: 2, column: 1, scope: !4)
+"""
+
+
+def _loaded_segments(library):
+    # Contents of the PT_LOAD segments, after the ELF and program headers.
+    phoff, = struct.unpack_from("<I", library, 28)
+    phentsize, phnum = struct.unpack_from("<HH", library, 42)
+    headers_end = phoff + phentsize*phnum
+    segments = []
+    for i in range(phnum):
+        p_type, offset, vaddr, _, filesz, memsz, flags, _ = \
+            struct.unpack_from("<IIIIIIII", library, phoff + i*phentsize)
+        if p_type == 1:
+            start = max(offset, headers_end)
+            segments.append((vaddr, memsz, flags, library[start:offset + filesz]))
+    return segments
+
+
+@unittest.skipUnless(shutil.which(RV32GTarget.tool_ld) and
+                     shutil.which(RV32GTarget.tool_strip),
+                     "linker and strip tools not available")
+class StripCase(unittest.TestCase):
+    def test_in_process(self):
+        for target_cls in RV32GTarget, CortexA9Target:
+            target = target_cls()
+            module = llvm.parse_assembly(
+                'target triple = "{}"\n'.format(target.triple) + debug_llir)
+            library = target.link([target.assemble(module)])
+            self.assertIn(b".debug_line", library)
+
+            stripped = target.strip(library)
+            self.assertNotIn(b".debug", stripped)
+            target.in_process_strip = False
+            reference = target.strip(library)
+            self.assertEqual(_loaded_segments(stripped), _loaded_segments(reference))
+
+
+@unittest.skipUnless(shutil.which(RV32GTarget.tool_ld) and
+                     shutil.which(RV32GTarget.tool_strip),
+                     "linker and strip tools not available")
+@unittest.skipUnless(RV32GTarget.in_memory_tools, "in-memory tools not supported")
+class InMemoryToolsCase(unittest.TestCase):
+    def test_identical_output(self):
+        target = RV32GTarget()
+        target.in_process_strip = False
+        obj = target.assemble(llvm.parse_assembly(llir))
+
+        library = target.link([obj])
+        stripped = target.strip(library)
+
+        target.in_memory_tools = False
+        self.assertEqual(target.link([obj]), library)
+        self.assertEqual(target.strip(library), stripped)
+
+    def test_failure(self):
+        target = RV32GTarget()
+        with self.assertRaisesRegex(Exception, "invocation failed"):
+            target.link([b"not an object"])
+
+
+class OptimizationCase(unittest.TestCase):
+    def test_profiles(self):
+        for optimization in RV32GTarget.optimizations:
+            target = RV32GTarget(optimization=optimization)
+            llmodule = target.compile_llvm_ir(llir)
+            self.assertIn("@__modinit__", str(llmodule))
+            target.assemble(llmodule)
+
+    def test_unknown_profile(self):
+        with self.assertRaises(ValueError):
+            RV32GTarget(optimization="O2")
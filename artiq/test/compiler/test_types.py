@@ -0,0 +1,42 @@
+import unittest
+
+from artiq.compiler import types, builtins, ir
+
+
+class TVarCase(unittest.TestCase):
+    def test_path_compression(self):
+        tvars = [types.TVar() for _ in range(10)]
+        # Build a chain without going through unify(), which balances by rank.
+        for tvar, parent in zip(tvars, tvars[1:]):
+            tvar.parent = parent
+        typ = builtins.TInt32()
+        tvars[-1].parent = typ
+
+        self.assertIs(tvars[0].find(), typ)
+        for tvar in tvars:
+            self.assertIs(tvar.parent, typ)
+
+    def test_unbound(self):
+        a, b = types.TVar(), types.TVar()
+        a.unify(b)
+        self.assertIs(a.find(), b.find())
+        self.assertTrue(types.is_var(a.find()))
+
+    def test_slots(self):
+        for typ in [types.TVar(), builtins.TInt32(), builtins.TList(),
+                    types.TTuple([]), types.TValue(1)]:
+            self.assertFalse(hasattr(typ, "__dict__"), typ)
+
+
+class UsesCase(unittest.TestCase):
+    def test_lazy_uses(self):
+        value = ir.Constant(1, builtins.TInt32())
+        self.assertEqual(len(value.uses), 0)
+        self.assertNotIn("uses", vars(value))
+
+        insn = ir.Coerce(value, builtins.TInt64())
+        self.assertEqual(value.uses, {insn})
+        other = ir.Constant(2, builtins.TInt32())
+        insn.replace_uses_of(value, other)
+        self.assertEqual(len(value.uses), 0)
+        self.assertEqual(other.uses, {insn})
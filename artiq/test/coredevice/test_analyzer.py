@@ -1,6 +1,11 @@
+import struct
+import unittest
+
 from artiq.experiment import *
-from artiq.coredevice.comm_analyzer import (decode_dump, StoppedMessage,
+from artiq.coredevice.comm_analyzer import (decode_dump, decode_message, StoppedMessage,
                                             OutputMessage, InputMessage,
+                                            ExceptionMessage, ExceptionType, MessageArray,
+                                            get_message_time,
                                            _extract_log_chars, get_analyzer_dump)
 from artiq.test.hardware_testbench import ExperimentCase
 
@@ -77,3 +82,62 @@ class AnalyzerTest(ExperimentCase):
                         for msg in dump.messages
                         if isinstance(msg, OutputMessage) and msg.channel == dump.log_channel])
         self.assertEqual(log, "foo\x1E32\x1D")
+
+
+def _encode_message(message):
+    if isinstance(message, OutputMessage):
+        record = struct.pack(">QIQQ", message.data, message.address,
+                             message.rtio_counter, message.timestamp)
+        message_type = 0
+    elif isinstance(message, InputMessage):
+        record = struct.pack(">QIQQ", message.data, 0,
+                             message.rtio_counter, message.timestamp)
+        message_type = 1
+    elif isinstance(message, ExceptionMessage):
+        record = bytes(11) + struct.pack(">BQ", message.exception_type.value,
+                                         message.rtio_counter) + bytes(8)
+        message_type = 2
+    else:
+        record = bytes(12) + struct.pack(">Q", message.rtio_counter) + bytes(8)
+        return record + struct.pack(">I", 3)
+    return record + struct.pack(">I", (message.channel << 2) | message_type)
+
+
+def _encode_dump(messages, log_channel=5):
+    data = b"".join(_encode_message(message) for message in messages)
+    return b"e" + struct.pack("<IQbbb", len(data), len(data), 0, log_channel, 0) + data
+
+
+class DecodeCase(unittest.TestCase):
+    messages = [
+        OutputMessage(3, 200, 100, 1, 2**63 + 5),
+        InputMessage(4, 150, 120, 7),
+        ExceptionMessage(3, 130, ExceptionType.o_underflow),
+        OutputMessage(3, 150, 140, 0, 1),
+        StoppedMessage(300),
+    ]
+
+    def test_decode(self):
+        dump = decode_dump(_encode_dump(self.messages))
+        self.assertEqual(dump.log_channel, 5)
+        self.assertIsInstance(dump.messages, MessageArray)
+        self.assertEqual(len(dump.messages), len(self.messages))
+        self.assertEqual(list(dump.messages), self.messages)
+        self.assertEqual(dump.messages[-1], self.messages[-1])
+        self.assertEqual(list(dump.messages[1:3]), self.messages[1:3])
+        self.assertEqual([decode_message(_encode_message(message))
+                          for message in self.messages], self.messages)
+
+    def test_sort(self):
+        dump = decode_dump(_encode_dump(self.messages))
+        self.assertEqual(list(dump.messages.sort_by_time()),
+                         sorted(self.messages, key=get_message_time))
+
+    def test_empty(self):
+        self.assertEqual(len(decode_dump(_encode_dump([])).messages), 0)
+
+    def test_unknown_exception(self):
+        data = bytearray(_encode_dump(self.messages[2:3]))
+        data[16 + 11] = 0xff
+        with self.assertRaises(ValueError):
+            decode_dump(bytes(data))
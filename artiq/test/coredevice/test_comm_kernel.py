@@ -0,0 +1,392 @@
+import os
+import time
+import socket
+import struct
+import threading
+import unittest
+import numpy
+
+from artiq.coredevice.comm_kernel import CommKernel, RPCReturnValueError, LoadError
+from artiq.test.comm_kernel_standin import CoreDeviceStandin, RPC, RaiseException
+
+
+artiq_benchmark = os.getenv("ARTIQ_BENCHMARK")
+
+
+def _connect(**kwargs):
+    # Local stand-in for the core device: the test writes what the device
+    # would send to one end of a socket pair, CommKernel reads the other.
+    device, host = socket.socketpair()
+    comm = CommKernel(None, **kwargs)
+    comm.socket = host
+    comm._set_endian("<")
+    return comm, device
+
+
+def _send(device, data, chunk_size=None):
+    def send():
+        if chunk_size is None:
+            device.sendall(data)
+        else:
+            for i in range(0, len(data), chunk_size):
+                device.sendall(data[i:i + chunk_size])
+    thread = threading.Thread(target=send)
+    thread.start()
+    return thread
+
+
+def _encode_bytes(data):
+    return b"B" + struct.pack("<l", len(data)) + data
+
+
+def _encode_array(array):
+    return (b"a" + struct.pack("<B", array.ndim) +
+            b"".join(struct.pack("<l", dim) for dim in array.shape) +
+            b"f" + array.astype("<f8").tobytes())
+
+
+def _encode_list(values):
+    return b"l" + struct.pack("<l", len(values)) + b"i" + struct.pack("<%sl" % len(values), *values)
+
+
+def _encode_rpc(service_id, value, is_async=True):
+    return (b"\x5a\x5a\x5a\x5a\x0a" + struct.pack("<Bl", is_async, service_id) +
+            b"i" + struct.pack("<l", value) + b"\x00" + struct.pack("<l", 1) + b"n")
+
+
+_kernel_finished = b"\x5a\x5a\x5a\x5a\x07\x00"
+
+
+class _EmbeddingMap:
+    def __init__(self, services, strings=()):
+        self.services = services
+        self.strings = list(strings)
+        self.retrieved = []
+
+    def retrieve_object(self, service_id):
+        self.retrieved.append(service_id)
+        return self.services[service_id]
+
+    def store_str(self, value):
+        self.strings.append(value)
+        return len(self.strings) - 1
+
+    def retrieve_str(self, str_id):
+        return self.strings[str_id]
+
+
+class ReceiveCase(unittest.TestCase):
+    def setUp(self):
+        self.comm, self.device = _connect()
+
+    def tearDown(self):
+        self.comm.close()
+        self.device.close()
+
+    def check_values(self, chunk_size):
+        array = numpy.arange(200000, dtype=float).reshape(1000, 200)
+        data = bytes(range(256)) * 1000
+        values = list(range(-10, 10))
+        message = (b"b\x01" + b"s" + struct.pack("<l", 6) + "héllo".encode() +
+                   _encode_array(array) + _encode_bytes(data) + _encode_list(values) +
+                   b"f" + struct.pack("<d", 1.5) + b"a\x01" + struct.pack("<l", 0) + b"f")
+        thread = _send(self.device, message, chunk_size)
+
+        receive = lambda: self.comm._receive_rpc_value(None)
+        self.assertEqual(receive(), True)
+        self.assertEqual(receive(), "héllo")
+        received = receive()
+        numpy.testing.assert_array_equal(received, array)
+        self.assertEqual(receive(), data)
+        self.assertEqual(receive(), values)
+        # The array must not alias the receive buffer.
+        numpy.testing.assert_array_equal(received, array)
+        self.assertEqual(receive(), 1.5)
+        self.assertEqual(len(receive()), 0)
+        thread.join()
+
+    def test_values(self):
+        self.check_values(chunk_size=None)
+
+    def test_values_fragmented(self):
+        self.check_values(chunk_size=1000)
+
+    def test_connection_closed(self):
+        self.device.sendall(_encode_bytes(b"\x00" * 10)[:8])
+        self.device.close()
+        with self.assertRaises(ConnectionResetError):
+            self.comm._receive_rpc_value(None)
+
+
+class AsyncRPCCase(unittest.TestCase):
+    def serve(self, rpcs, services, **kwargs):
+        comm, device = _connect(**kwargs)
+        try:
+            if not isinstance(services, _EmbeddingMap):
+                services = _EmbeddingMap(services)
+            device.sendall(b"".join(_encode_rpc(*rpc) for rpc in rpcs) + _kernel_finished)
+            comm.serve(services, None, None)
+        finally:
+            comm.close()
+            device.close()
+
+    def test_ordered(self):
+        calls = []
+        def service(value):
+            if value == 0:
+                # The serve loop keeps reading messages during the call.
+                deadline = time.monotonic() + 5
+                while len(embedding_map.retrieved) < 3 and time.monotonic() < deadline:
+                    time.sleep(0.001)
+                calls.append(len(embedding_map.retrieved))
+            calls.append(value)
+        embedding_map = _EmbeddingMap({1: service, 2: service})
+        self.serve([(1, 0), (2, 1), (1, 2)], embedding_map, async_rpc_workers=1)
+        self.assertEqual(calls, [3, 0, 1, 2])
+
+    def test_per_service_ordering(self):
+        calls = {1: [], 2: []}
+        def service(service_id):
+            def call(value):
+                time.sleep(0.001)
+                calls[service_id].append(value)
+            return call
+        rpcs = [(1 + i % 2, i) for i in range(20)]
+        self.serve(rpcs, {1: service(1), 2: service(2)}, async_rpc_workers=4)
+        self.assertEqual(calls, {1: list(range(0, 20, 2)), 2: list(range(1, 20, 2))})
+
+    def test_synchronous_after_async(self):
+        calls = []
+        def slow(value):
+            time.sleep(0.05)
+            calls.append(value)
+        def check(value):
+            calls.append(value)
+        self.serve([(1, 0), (2, 1, False)], {1: slow, 2: check}, async_rpc_workers=1)
+        self.assertEqual(calls, [0, 1])
+
+    def test_exception(self):
+        calls = []
+        def service(value):
+            if value % 2:
+                raise ValueError(value)
+            calls.append(value)
+        with self.assertRaisesRegex(ValueError, "^1$"):
+            self.serve([(1, i) for i in range(4)], {1: service}, async_rpc_workers=1)
+        self.assertEqual(calls, [0, 2])
+
+    def test_finished_tasks_released(self):
+        comm = CommKernel("::1", async_rpc_workers=1)
+        try:
+            tasks = []
+            for i in range(100):
+                done = threading.Event()
+                comm._submit_async_rpc(1, done.set)
+                done.wait()
+                tasks.append(len(comm._async_rpc_tasks))
+            self.assertEqual(comm._join_async_rpcs(), [])
+            self.assertLessEqual(max(tasks), 1)
+            self.assertEqual(comm._async_rpc_tasks, {})
+        finally:
+            comm.close()
+
+
+class StandinCase(unittest.TestCase):
+    def setUp(self):
+        self.standin = CoreDeviceStandin()
+        self.comm = CommKernel(self.standin.host, self.standin.port)
+
+    def tearDown(self):
+        self.comm.close()
+        self.standin.close()
+
+    def run_kernel(self, kernel, embedding_map):
+        self.standin.kernel = kernel
+        self.comm.load(b"kernel")
+        self.comm.run()
+        self.comm.serve(embedding_map, lambda backtrace: [], lambda names: names)
+        self.assertIsNone(self.standin.error)
+
+    def test_load(self):
+        self.comm.check_system_info()
+        self.comm.load(b"\x00" * 100000)
+        self.assertEqual(self.standin.loaded, [100000])
+        self.standin.load_error = "no space"
+        with self.assertRaisesRegex(LoadError, "no space"):
+            self.comm.load(b"")
+
+    def test_rpc(self):
+        calls = []
+        def service(*args, **kwargs):
+            calls.append((args, kwargs))
+            return len(calls)
+        args = (1, "a", [1.0, 2.0], numpy.arange(3.0), (True, b"xy"))
+        self.run_kernel([RPC(1, args, {"x": 2**40}, return_tags=b"i"),
+                         RPC(1, (5,), is_async=True, count=3),
+                         RPC(2, return_tags=b"lf")],
+                        _EmbeddingMap({1: service, 2: lambda: [0.5] * 3}))
+        self.assertEqual(len(calls), 4)
+        self.assertEqual(calls[0][0][:3], (1, "a", [1.0, 2.0]))
+        numpy.testing.assert_array_equal(calls[0][0][3], numpy.arange(3.0))
+        self.assertEqual(calls[0][0][4], (True, b"xy"))
+        self.assertEqual(calls[0][1], {"x": 2**40})
+        self.assertEqual(calls[1:], [((5,), {})] * 3)
+        self.assertEqual(self.standin.replies,
+                         [struct.pack("<l", 1), struct.pack("<lddd", 3, 0.5, 0.5, 0.5)])
+
+    def test_rate(self):
+        start = time.monotonic()
+        self.run_kernel([RPC(1, is_async=True, count=5, rate=100)],
+                        _EmbeddingMap({1: lambda: None}))
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+
+    def test_rpc_exception(self):
+        def service():
+            raise ValueError("failed")
+        with self.assertRaisesRegex(ValueError, "failed"):
+            self.run_kernel([RPC(1), RPC(1)], _EmbeddingMap({1: service}))
+        self.assertEqual(len(self.standin.replies), 1)
+
+    def test_kernel_exception(self):
+        with self.assertRaisesRegex(ZeroDivisionError, "division by zero"):
+            self.run_kernel([RPC(1, is_async=True), RaiseException(0, "division by zero")],
+                            _EmbeddingMap({1: lambda: None}, ["0:ZeroDivisionError"]))
+        # The session remains usable.
+        self.run_kernel([], _EmbeddingMap({}))
+
+
+class SendCase(unittest.TestCase):
+    def setUp(self):
+        self.comm, self.device = _connect()
+
+    def tearDown(self):
+        self.comm.close()
+        self.device.close()
+
+    def encode(self, tags, value):
+        self.comm.write_buffer.clear()
+        self.comm._send_rpc_value(tags, value, value, "fn")
+        return bytes(self.comm.write_buffer)
+
+    def test_tuple_list(self):
+        self.assertEqual(self.encode(b"lt\x02if", [(1, 2.0), (numpy.int32(3), 4.0)]),
+                         struct.pack("<lldld", 2, 1, 2.0, 3, 4.0))
+        with self.assertRaisesRegex(RPCReturnValueError, "cannot serialize 2 as float"):
+            self.encode(b"lt\x02if", [(1, 2.0), (1, 2)])
+        with self.assertRaisesRegex(RPCReturnValueError, "cannot serialize 2147483648 as 32-bit int"):
+            self.encode(b"lt\x02if", [(2**31, 2.0)])
+        with self.assertRaisesRegex(RPCReturnValueError, "as tuple of 2"):
+            self.encode(b"lt\x02if", [(1, 2.0, 3)])
+
+    def test_nested(self):
+        self.assertEqual(self.encode(b"t\x02lsn", (["ab", "c"], None)),
+                         struct.pack("<ll", 2, 2) + b"ab" + struct.pack("<l", 1) + b"c")
+        # The tags following a range are not consumed by it.
+        self.assertEqual(self.encode(b"t\x02rii", (range(0, 4, 2), 5)),
+                         struct.pack("<llll", 0, 4, 2, 5))
+        self.assertEqual(self.encode(b"a\x02f", numpy.ones((1, 2))),
+                         struct.pack("<lldd", 1, 2, 1.0, 1.0))
+        with self.assertRaisesRegex(RPCReturnValueError, "as 1-dimensional numpy.ndarray"):
+            self.encode(b"a\x01f", numpy.ones((1, 2)))
+
+
+@unittest.skipUnless(artiq_benchmark, "ARTIQ_BENCHMARK not set")
+class SendBenchmark(unittest.TestCase):
+    def test_throughput(self):
+        comm, device = _connect()
+        for name, tags, value in [
+                ("list of (int32, float)", b"lt\x02if", [(i, float(i)) for i in range(100000)]),
+                ("list of str", b"ls", ["item{}".format(i) for i in range(100000)]),
+                ("list of (str, int64)", b"lt\x02sI", [("k{}".format(i), i) for i in range(100000)]),
+                ("list of list of int32", b"lli", [list(range(100))] * 1000)]:
+            start = time.monotonic()
+            for _ in range(10):
+                comm.write_buffer.clear()
+                comm._send_rpc_value(tags, value, value, "fn")
+            duration = (time.monotonic() - start) / 10
+            print("{}: {:.1f} ms".format(name, duration * 1e3))
+        comm.close()
+        device.close()
+
+
+@unittest.skipUnless(artiq_benchmark, "ARTIQ_BENCHMARK not set")
+class ReceiveBenchmark(unittest.TestCase):
+    def setUp(self):
+        self.comm, self.device = _connect()
+
+    def tearDown(self):
+        self.comm.close()
+        self.device.close()
+
+    def benchmark(self, name, message, count):
+        thread = _send(self.device, message * count)
+        start = time.monotonic()
+        for _ in range(count):
+            self.comm._receive_rpc_value(None)
+        duration = time.monotonic() - start
+        thread.join()
+        print("{}: {:.1f} MiB/s".format(name, len(message) * count / duration / 2**20))
+
+    def test_throughput(self):
+        self.benchmark("array (8 MiB)",
+                       _encode_array(numpy.zeros(1 << 20)), 32)
+        self.benchmark("bytes (8 MiB)",
+                       _encode_bytes(b"\x00" * (1 << 23)), 32)
+        self.benchmark("list (1 MiB)",
+                       _encode_list([123] * (1 << 18)), 32)
+        self.benchmark("bytes (1 KiB)",
+                       _encode_bytes(b"\x00" * (1 << 10)), 10000)
+
+
+@unittest.skipUnless(artiq_benchmark, "ARTIQ_BENCHMARK not set")
+class ServeBenchmark(unittest.TestCase):
+    def setUp(self):
+        self.standin = CoreDeviceStandin()
+        self.comm = CommKernel(self.standin.host, self.standin.port)
+        self.embedding_map = _EmbeddingMap({1: lambda *args: None},
+                                           ["0:ZeroDivisionError"])
+
+    def tearDown(self):
+        self.comm.close()
+        self.standin.close()
+
+    def serve(self, kernel):
+        self.standin.kernel = kernel
+        start = time.monotonic()
+        self.comm.run()
+        try:
+            self.comm.serve(self.embedding_map, lambda backtrace: [], lambda names: names)
+        except ZeroDivisionError:
+            pass
+        return time.monotonic() - start
+
+    def test_async_rpc(self):
+        for name, args in [("int32", (1,)),
+                           ("8 KiB array", (numpy.zeros(1024),)),
+                           ("list of 100 int32", (list(range(100)),))]:
+            count = 20000
+            duration = self.serve([RPC(1, args, is_async=True, count=count)])
+            print("async RPC, {}: {:.0f} RPC/s".format(name, count / duration))
+
+    def test_sync_rpc(self):
+        for name, args in [("int32", (1,)), ("8 KiB array", (numpy.zeros(1024),))]:
+            self.standin.latencies.clear()
+            self.serve([RPC(1, args, count=5000)])
+            latencies = numpy.array(self.standin.latencies) * 1e6
+            print("sync RPC, {}: median {:.1f} us, 99th percentile {:.1f} us".format(
+                name, numpy.median(latencies), numpy.percentile(latencies, 99)))
+
+    def test_load(self):
+        library = b"\x00" * (1 << 20)
+        start = time.monotonic()
+        for _ in range(20):
+            self.comm.load(library)
+        duration = (time.monotonic() - start) / 20
+        print("kernel load (1 MiB): {:.2f} ms".format(duration * 1e3))
+
+    def test_exception(self):
+        start = time.monotonic()
+        for _ in range(1000):
+            self.serve([RaiseException(0, "division by zero")])
+        duration = (time.monotonic() - start) / 1000
+        print("kernel exception: {:.1f} us".format(duration * 1e6))
@@ -0,0 +1,23 @@
+# RUN: env ARTIQ_DUMP_UNOPT_LLVM=%t %python -m artiq.compiler.testbench.embedding +compile %s
+# RUN: OutputCheck %s --file-to-check=%t_unopt.ll
+
+from artiq.language.core import *
+from artiq.language.types import *
+import numpy
+
+# Large homogeneous lists and numeric arrays are emitted as byte blobs.
+
+# CHECK-L: [256 x i8] c"\00\00\00\00\01\00\00\00\02\00\00\00
+table = list(range(64))
+# CHECK-L: [512 x i8] c"\00\00\00\00\00\01\00\00\01\00\00\00\00\00\00\00
+wide_table = [2**40] + list(range(1, 64))
+# CHECK-L: [48 x i8] c"\00\00\00\00\00\00\00\00\00\00\00\00\00\00\F0?
+waveform = numpy.arange(6.).reshape(3, 2)
+
+@kernel
+def entrypoint():
+    assert len(table) == 64
+    assert table[1] == 1
+    assert wide_table[0] == 2**40
+    assert waveform.shape == (3, 2)
+    assert waveform[0][1] == 1.0
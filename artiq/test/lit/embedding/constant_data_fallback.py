@@ -0,0 +1,20 @@
+# RUN: %python -m artiq.compiler.testbench.embedding %s
+
+from artiq.language.core import *
+from artiq.language.types import *
+import numpy
+
+# Data that cannot be emitted as a blob is still quoted element by element.
+short_table = [1, 2, 3]
+mixed_table = [1] * 40 + [1.0]
+flags = numpy.array([True, False] * 20)
+
+@kernel
+def entrypoint():
+    assert short_table[2] == 3
+    assert flags[0]
+    assert not flags[1]
+
+@kernel
+def mixed():
+    mixed_table[0]
@@ -0,0 +1,31 @@
+# RUN: %python -m artiq.compiler.testbench.embedding +diag %s 2>%t
+# RUN: OutputCheck %s --file-to-check=%t
+
+from artiq.language.core import *
+from artiq.language.types import *
+
+class c:
+    def __init__(self, y):
+        self.x = 1
+        if y:
+            self.y = 1
+
+a = c(y=True)
+b = c(y=False)
+
+@kernel
+def use_x():
+    # CHECK-L: <synthesized>:1: error: host object does not have an attribute 'y'
+    # CHECK-L: ${LINE:+2}: note: expanded from here
+    # b is quoted after the attributes of c accessed by use_y were checked.
+    b.x
+
+@kernel
+def use_y():
+    # CHECK-L: ${LINE:+1}: note: attribute accessed here
+    a.y
+
+@kernel
+def entrypoint():
+    use_y()
+    use_x()
@@ -0,0 +1,24 @@
+# RUN: %python -m artiq.compiler.testbench.embedding %s
+
+from artiq.language.core import *
+from artiq.language.types import *
+
+class c:
+    def __init__(self):
+        self.x = 1
+
+    @kernel
+    def get(self):
+        return self.x
+
+ci = c()
+
+@kernel
+def instance():
+    return ci
+
+@kernel
+def entrypoint():
+    # The type of instance() is only known once instance has been inferred,
+    # so c.get is quoted during a later round of inference.
+    assert instance().get() == 1
@@ -0,0 +1,21 @@
+# RUN: %python -m artiq.compiler.testbench.embedding %s
+
+from artiq.language.core import *
+from artiq.language.types import *
+
+@kernel
+def even(n):
+    if n == 0:
+        return True
+    return odd(n - 1)
+
+@kernel
+def odd(n):
+    if n == 0:
+        return False
+    return even(n - 1)
+
+@kernel
+def entrypoint():
+    assert even(4)
+    assert not odd(4)
@@ -0,0 +1,86 @@
+import unittest
+import os
+import tempfile
+from unittest import mock
+
+from artiq.compiler import compile_cache
+from artiq.compiler.compile_cache import CompileCache
+
+
+class _Target:
+    triple = "riscv32-unknown-linux"
+    data_layout = "e-m:e-p:32:32-i64:64-n32-S128"
+    features = ["+m", "+a"]
+    additional_linker_options = []
+    subkernel_id = None
+    optimization = "default"
+    tool_ld = "ld.lld"
+    tool_strip = "llvm-strip"
+    in_process_strip = True
+
+
+class CompileCacheCase(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_key(self):
+        target = _Target()
+        key = CompileCache.key(target, "define void @f()")
+        self.assertEqual(key, CompileCache.key(target, "define void @f()"))
+        self.assertNotEqual(key, CompileCache.key(target, "define void @g()"))
+        target.subkernel_id = 1
+        self.assertNotEqual(key, CompileCache.key(target, "define void @f()"))
+        target.subkernel_id = None
+        target.optimization = "fast"
+        self.assertNotEqual(key, CompileCache.key(target, "define void @f()"))
+        target.optimization = "default"
+        def key_with_version(versions):
+            with mock.patch.object(compile_cache, "_tool_version",
+                                   lambda tool: versions.get(tool, "")):
+                return CompileCache.key(target, "define void @f()")
+        self.assertNotEqual(key_with_version({}), key_with_version({"ld.lld": "0.0"}))
+        self.assertNotEqual(key_with_version({}), key_with_version({"llvm-strip": "0.0"}))
+        target.in_process_strip = False
+        self.assertNotEqual(key, CompileCache.key(target, "define void @f()"))
+        target.in_process_strip = True
+        with mock.patch.object(compile_cache.llvm, "llvm_version_info", (0, 0, 0)):
+            self.assertNotEqual(key, CompileCache.key(target, "define void @f()"))
+
+    def test_memory(self):
+        cache = CompileCache(max_memory_entries=2)
+        for key in "abc":
+            cache.put(key, key.encode(), key.upper().encode())
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("c"), (b"c", b"C"))
+        self.assertEqual(cache.stats,
+                         {"memory_hits": 1, "disk_hits": 0, "misses": 1})
+
+    def test_disk(self):
+        directory = self.tempdir.name
+        cache = CompileCache(directory)
+        cache.put("a", b"library", b"stripped")
+        cache = CompileCache(directory)
+        self.assertEqual(cache.get("a"), (b"library", b"stripped"))
+        self.assertEqual(cache.get("a"), (b"library", b"stripped"))
+        self.assertEqual(cache.stats,
+                         {"memory_hits": 1, "disk_hits": 1, "misses": 0})
+
+        cache.clear()
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(os.listdir(directory), [])
+
+    def test_disk_eviction(self):
+        directory = self.tempdir.name
+        cache = CompileCache(directory, max_memory_entries=0,
+                             max_disk_size=3000)
+        for i, key in enumerate("abc"):
+            cache.put(key, bytes(1000), b"")
+            path = os.path.join(directory, key + ".kcache")
+            os.utime(path, (i, i))
+        cache.put("d", bytes(1000), b"")
+        self.assertIsNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("d"), (bytes(1000), b""))
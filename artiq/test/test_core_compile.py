@@ -0,0 +1,387 @@
+import unittest
+import os
+import shutil
+import threading
+import concurrent.futures
+from unittest import mock
+import numpy
+
+from artiq.language.core import kernel, subkernel, delay
+from artiq.language.environment import EnvExperiment
+from artiq.compiler import profiler
+from artiq.compiler.targets import RV32GTarget
+from artiq.coredevice.core import Core, _compile_llvm_ir
+from artiq.coredevice.comm_kernel import CommKernelDummy
+from artiq.master.worker_impl import precompile_kernels
+
+
+class _EmbeddingMap:
+    def __init__(self, subkernels):
+        self._subkernels = subkernels
+
+    def subkernels(self):
+        return dict(self._subkernels)
+
+
+class _Core(Core):
+    # Subkernel 1 references subkernel 2, which is only discovered once
+    # subkernel 1 has been stitched.
+    references = {1: {2: "fn2"}, 2: {}, 3: {}}
+
+    def __init__(self, executor=None):
+        Core.__init__(self, dmgr={}, host=None, ref_period=1e-9)
+        self.executor = executor
+        self.stitched = []
+
+    def compile_executor(self):
+        return self.executor
+
+    def compile_subkernel(self, sid, subkernel_fn, embedding_map, args,
+                          subkernel_arg_types, subkernels, executor=None):
+        self.stitched.append(sid)
+        subkernels = embedding_map.subkernels()
+        subkernels.update(self.references[sid])
+        library = "lib{}".format(sid).encode()
+        if executor is not None:
+            library = executor.submit(lambda library=library: (b"", library))
+        return sid + 10, library, _EmbeddingMap(subkernels)
+
+
+class _SlowCore(_Core):
+    # Subkernel 1 only finishes compiling once the others are uploaded.
+    def __init__(self, executor):
+        _Core.__init__(self, executor)
+        self.uploaded = threading.Event()
+
+    def compile_subkernel(self, sid, subkernel_fn, embedding_map, args,
+                          subkernel_arg_types, subkernels, executor=None):
+        destination, library, embedding_map = _Core.compile_subkernel(
+            self, sid, subkernel_fn, embedding_map, args,
+            subkernel_arg_types, subkernels)
+        def compile():
+            if sid == 1:
+                self.uploaded.wait(5)
+            return b"", library
+        return destination, executor.submit(compile), embedding_map
+
+
+class CompileSubkernelsCase(unittest.TestCase):
+    def check(self, core):
+        uploaded = []
+        embedding_map, compiled = core.compile_subkernels(
+            _EmbeddingMap({1: "fn1", 3: "fn3"}), [], {},
+            upload=lambda *args: uploaded.append(args))
+        self.assertEqual(core.stitched, [1, 3, 2])
+        self.assertEqual(sorted(embedding_map.subkernels()), [1, 2, 3])
+        self.assertEqual(list(compiled.items()),
+                         [(1, (11, b"lib1")), (3, (13, b"lib3")), (2, (12, b"lib2"))])
+        self.assertEqual(sorted(uploaded),
+                         [(b"lib1", 1, 11), (b"lib2", 2, 12), (b"lib3", 3, 13)])
+
+    def test_sequential(self):
+        self.check(_Core())
+
+    def test_executor(self):
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            self.check(_Core(executor))
+
+    def test_upload_order(self):
+        uploaded = []
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            core = _SlowCore(executor)
+            def upload(library, sid, destination):
+                uploaded.append(sid)
+                if len(uploaded) == 2:
+                    core.uploaded.set()
+            core.compile_subkernels(_EmbeddingMap({1: "fn1", 3: "fn3"}), [], {},
+                                    upload=upload)
+        self.assertEqual(sorted(uploaded[:2]), [2, 3])
+        self.assertEqual(uploaded[2], 1)
+
+
+_llir = """
+target triple = "riscv32-unknown-linux"
+target datalayout = "e-m:e-p:32:32-i64:64-n32-S128"
+
+define i32 @__modinit__(i32 %x) {
+  ret i32 %x
+}
+"""
+
+
+class _TextTarget(RV32GTarget):
+    # Takes the LLVM IR itself as the module.
+    def generate_llvm_ir(self, module):
+        return module
+
+
+@unittest.skipUnless(shutil.which(RV32GTarget.tool_ld), "linker not available")
+class CompileExecutorCase(unittest.TestCase):
+    def test_process_pool(self):
+        core = Core(dmgr={}, host=None, ref_period=1e-9, compile_workers=1)
+        executor = core.compile_executor()
+        try:
+            self.assertIsInstance(executor, concurrent.futures.ProcessPoolExecutor)
+            future = core._compile_module(_TextTarget(subkernel_id=1), _llir, executor)
+            self.assertEqual(future.result(timeout=60),
+                             _compile_llvm_ir(_TextTarget(subkernel_id=1), _llir))
+        finally:
+            executor.shutdown()
+
+
+class OptimizationCase(unittest.TestCase):
+    def test_flags(self):
+        core = Core(dmgr={}, host=None, ref_period=1e-9, optimization="fast")
+
+        @kernel
+        def plain():
+            pass
+
+        @kernel(flags={"optimize-aggressive"})
+        def aggressive():
+            pass
+
+        self.assertEqual(core._optimization(plain), "fast")
+        self.assertEqual(core._optimization(aggressive), "aggressive")
+
+        with self.assertRaises(ValueError):
+            Core(dmgr={}, host=None, ref_period=1e-9, optimization="O2")
+
+
+class ProfilingCase(unittest.TestCase):
+    def profile(self, core, function):
+        with core._profiling(function):
+            with profiler.stage("stitching"):
+                data = bytearray(1 << 16)
+            del data
+
+    @mock.patch.dict(os.environ, {}, clear=True)
+    def test_reports_by_kernel(self):
+        core = Core(dmgr={}, host=None, ref_period=1e-9, profile_compile=True)
+
+        @kernel
+        def main():
+            pass
+
+        @subkernel(destination=1)
+        def sub():
+            pass
+
+        self.profile(core, main)
+        self.profile(core, sub)
+        self.assertEqual(sorted(core.compile_profile), sorted([
+            main.__qualname__, sub.__qualname__]))
+        report = core.compile_profile[main.__qualname__]
+        self.assertEqual(report["kernel"], main.__qualname__)
+        self.assertEqual(report["stages"][0]["name"], "stitching")
+        self.assertIsNone(report["stages"][0]["peak_memory"])
+
+    @mock.patch.dict(os.environ, {}, clear=True)
+    def test_memory(self):
+        core = Core(dmgr={}, host=None, ref_period=1e-9, profile_compile="memory")
+
+        @kernel
+        def main():
+            pass
+
+        self.profile(core, main)
+        stage, = core.compile_profile[main.__qualname__]["stages"]
+        self.assertGreaterEqual(stage["peak_memory"], 1 << 16)
+
+
+class _ObjectMap:
+    def __init__(self, obj):
+        self.obj = obj
+
+    def iter_objects(self):
+        attributes = {"__objectid__": None, "amplitude": None,
+                      "waveform": None, "run": None}
+        yield 1, self.obj, type("TInstance", (), {"attributes": attributes})
+
+
+class _Experiment:
+    def __init__(self):
+        self.amplitude = 1.0
+        self.waveform = numpy.zeros(4)
+
+    def run(self):
+        return "compiled"
+
+
+class _PrecompileCore(Core):
+    def __init__(self):
+        Core.__init__(self, dmgr={}, host=None, ref_period=1e-9)
+
+    def _precompile(self, function, args, kwargs, attribute_writeback, upload):
+        self.attribute_writeback, self.upload = attribute_writeback, upload
+        return (lambda: "precompiled"), _ObjectMap(function.__self__)
+
+
+class PrecompileAheadCase(unittest.TestCase):
+    def setUp(self):
+        self.core = _PrecompileCore()
+        self.exp = _Experiment()
+
+    def test_unchanged(self):
+        run = self.core.precompile_ahead(self.exp.run)
+        self.assertTrue(self.core.attribute_writeback)
+        self.assertFalse(self.core.upload)
+        self.assertEqual(run(), "precompiled")
+        self.assertEqual(run(), "precompiled")
+
+    def test_recompile(self):
+        run = self.core.precompile_ahead(self.exp.run)
+        self.exp.amplitude = 2.0
+        self.assertEqual(run(), "compiled")
+
+    def test_error(self):
+        run = self.core.precompile_ahead(self.exp.run, policy="error")
+        self.exp.waveform[1] = 1.0
+        with self.assertRaisesRegex(ValueError, "_Experiment.waveform"):
+            run()
+
+    def test_ignore(self):
+        run = self.core.precompile_ahead(self.exp.run, policy="ignore")
+        self.exp.amplitude = 2
+        self.assertEqual(run(), "precompiled")
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            self.core.precompile_ahead(self.exp.run, policy="never")
+
+
+class _RecordingComm(CommKernelDummy):
+    # Stands for a kernel that increments exp.count and writes it back.
+    def __init__(self, exp):
+        self.exp = exp
+        self.loaded = []
+
+    def load(self, kernel_library):
+        self.loaded.append(kernel_library)
+
+    def run(self):
+        self.exp.count += 1
+
+
+class _PrecompiledExperiment(EnvExperiment):
+    precompile_kernels = {"run"}
+
+    def build(self, core):
+        self.core = core
+        self.count = 0
+        self.amplitude = 1.0
+
+    @kernel
+    def run(self):
+        self.count += 1
+        delay(self.amplitude)
+
+
+class PrecompileKernelsCase(unittest.TestCase):
+    def setUp(self):
+        self.compiled = 0
+        dmgr = {}
+        self.core = dmgr["core"] = Core(dmgr=dmgr, host=None, ref_period=1e-9)
+        self.core._compile_module = self.compile_module
+        self.exp = _PrecompiledExperiment((None, None, None, None), self.core)
+        self.comm = self.core.comm = _RecordingComm(self.exp)
+
+    def compile_module(self, target, module, executor=None):
+        # Objects are added to the embedding map during LLVM IR generation.
+        target.generate_llvm_ir(module)
+        self.compiled += 1
+        return b"kernel", b"kernel"
+
+    def test_precompile_kernels(self):
+        precompile_kernels(self.exp)
+        self.assertEqual(self.compiled, 1)
+        self.assertEqual(self.comm.loaded, [])
+        for _ in range(3):
+            self.exp.run()
+        self.assertEqual(self.compiled, 1)
+        self.assertEqual(self.comm.loaded, [b"kernel"]*3)
+        self.assertEqual(self.exp.count, 3)
+
+        self.exp.amplitude = 2.0
+        self.exp.run()
+        self.assertEqual(self.compiled, 2)
+
+    def test_error_policy(self):
+        self.exp.precompile_policy = "error"
+        precompile_kernels(self.exp)
+        self.exp.run()
+        self.exp.run()
+        self.exp.amplitude = 2.0
+        with self.assertRaisesRegex(ValueError, "amplitude"):
+            self.exp.run()
+
+
+class _Target:
+    triple = "riscv32-unknown-linux"
+    data_layout = "e-m:e-p:32:32-i64:64-n32-S128"
+    features = []
+    additional_linker_options = []
+    tool_ld = "ld.lld"
+    tool_strip = "llvm-strip"
+    in_process_strip = True
+    compiled = []
+
+    def __init__(self, subkernel_id=None, optimization="default"):
+        self.subkernel_id = subkernel_id
+        self.optimization = optimization
+
+    def generate_llvm_ir(self, module):
+        return module
+
+    def compile_llvm_ir(self, llir):
+        self.compiled.append(llir)
+        return llir.encode()
+
+    def assemble(self, obj):
+        return obj
+
+    def link(self, objects):
+        return b"".join(objects)
+
+    def strip(self, library):
+        return library.upper()
+
+
+class CompileModuleCase(unittest.TestCase):
+    def setUp(self):
+        _Target.compiled = []
+        self.core = Core(dmgr={}, host=None, ref_period=1e-9)
+        self.environ = mock.patch.dict(os.environ)
+        self.environ.start()
+        for var in ["ARTIQ_DUMP_UNOPT_LLVM", "ARTIQ_DUMP_LLVM", "ARTIQ_DUMP_ASM",
+                    "ARTIQ_DUMP_OBJ", "ARTIQ_DUMP_ELF"]:
+            os.environ.pop(var, None)
+
+    def tearDown(self):
+        self.environ.stop()
+
+    def test_cache(self):
+        target = _Target()
+        for _ in range(2):
+            self.assertEqual(self.core._compile_module(target, "f"), (b"f", b"F"))
+        self.assertEqual(self.core._compile_module(target, "g"), (b"g", b"G"))
+        self.assertEqual(_Target.compiled, ["f", "g"])
+        self.assertEqual(self.core.compile_cache.stats,
+                         {"memory_hits": 1, "disk_hits": 0, "misses": 2})
+
+    def test_cache_executor(self):
+        for _ in range(2):
+            # Leaving the executor waits for the callback storing the entry.
+            with concurrent.futures.ThreadPoolExecutor(1) as executor:
+                future = self.core._compile_module(_Target(), "f", executor)
+            self.assertEqual(future.result(), (b"f", b"F"))
+        self.assertEqual(_Target.compiled, ["f"])
+
+    def test_dump_bypass(self):
+        os.environ["ARTIQ_DUMP_LLVM"] = "."
+        target = _Target()
+        for _ in range(2):
+            self.assertEqual(self.core._compile_module(target, "f"), (b"f", b"F"))
+        self.assertEqual(_Target.compiled, ["f", "f"])
+        self.assertEqual(self.core.compile_cache.stats,
+                         {"memory_hits": 0, "disk_hits": 0, "misses": 0})
@@ -0,0 +1,98 @@
+"""Test dataset DB persistence"""
+
+import asyncio
+import os
+import unittest
+import tempfile
+
+import lmdb
+import numpy as np
+
+from sipyco import pyon
+
+from artiq.master.databases import (DatasetDB, encode_dataset_value,
+                                    decode_dataset_value)
+
+
+class TestDatasetValueEncoding(unittest.TestCase):
+    def test_round_trip(self):
+        value = {"a": np.arange(10, dtype=np.int32),
+                 "b": [np.linspace(0, 1, 7).reshape(7, 1), "x"],
+                 "c": np.zeros((0, 3))}
+        metadata = {"unit": "V", "precision": 3}
+        data = encode_dataset_value((value, metadata))
+        r_value, r_metadata = decode_dataset_value(memoryview(data))
+        self.assertEqual(r_metadata, metadata)
+        self.assertEqual(set(r_value.keys()), set(value.keys()))
+        np.testing.assert_array_equal(r_value["a"], value["a"])
+        np.testing.assert_array_equal(r_value["b"][0], value["b"][0])
+        self.assertEqual(r_value["b"][1], "x")
+        self.assertEqual(r_value["c"].shape, (0, 3))
+        # arrays must remain mutable for mutate_dataset
+        r_value["a"][0] = 42
+
+    def test_pyon(self):
+        self.assertEqual(decode_dataset_value(
+            encode_dataset_value(([1, 2], {}))), ([1, 2], {}))
+        self.assertEqual(decode_dataset_value(
+            pyon.encode((1.5, {"unit": "s"})).encode()), (1.5, {"unit": "s"}))
+
+
+class TestDatasetDB(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.persist_file = os.path.join(self.tempdir.name, "dataset_db.mdb")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_persistence(self):
+        dataset_db = DatasetDB(self.persist_file)
+        dataset_db.set("array", np.arange(1000.), persist=True,
+                       metadata={"unit": "Hz"})
+        dataset_db.set("number", 3, persist=True)
+        dataset_db.set("volatile", 4, persist=False)
+        dataset_db.save()
+        dataset_db.delete("number")
+        dataset_db.save()
+        dataset_db.close_db()
+
+        dataset_db = DatasetDB(self.persist_file)
+        self.assertEqual(set(dataset_db.data.raw_view.keys()), {"array"})
+        np.testing.assert_array_equal(dataset_db.get("array"),
+                                      np.arange(1000.))
+        self.assertEqual(dataset_db.get_metadata("array"), {"unit": "Hz"})
+        dataset_db.close_db()
+
+    def test_legacy_format(self):
+        env = lmdb.open(self.persist_file, subdir=False, map_size=2**20)
+        with env.begin(write=True) as txn:
+            txn.put(b"x", pyon.encode((np.arange(3), {})).encode())
+        env.close()
+
+        dataset_db = DatasetDB(self.persist_file)
+        np.testing.assert_array_equal(dataset_db.get("x"), np.arange(3))
+        dataset_db.close_db()
+
+    def test_save_async(self):
+        dataset_db = DatasetDB(self.persist_file)
+        value = np.zeros(10)
+        dataset_db.set("x", value, persist=True)
+
+        async def save_and_mutate():
+            save = asyncio.ensure_future(dataset_db.save_async())
+            await asyncio.sleep(0)
+            # the background write uses the value at the time of the call
+            value[0] = 1
+            await save
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(save_and_mutate())
+        finally:
+            loop.close()
+        dataset_db.close_db()
+
+        dataset_db = DatasetDB(self.persist_file)
+        self.assertEqual(dataset_db.get("x")[0], 0)
+        dataset_db.close_db()
@@ -1,12 +1,16 @@
 """Tests for the (Env)Experiment-facing dataset interface."""
 
 import copy
+import time
 import unittest
 
+import h5py
+import numpy as np
+
 from sipyco.sync_struct import process_mod
 
 from artiq.experiment import EnvExperiment
-from artiq.master.worker_db import DatasetManager
+from artiq.master.worker_db import DatasetManager, write_hdf5_ops
 
 
 class MockDatasetDB:
@@ -29,6 +33,17 @@ class MockDatasetDB:
         del self.data[key]
 
 
+class MockBatchDatasetDB(MockDatasetDB):
+    def __init__(self):
+        MockDatasetDB.__init__(self)
+        self.batches = []
+
+    def update_batch(self, mods):
+        self.batches.append(copy.deepcopy(mods))
+        for mod in mods:
+            self.update(mod)
+
+
 class TestExperiment(EnvExperiment):
     def get(self, key):
         return self.get_dataset(key)
@@ -42,6 +57,9 @@ class TestExperiment(EnvExperiment):
     def append(self, key, value):
         self.append_to_dataset(key, value)
 
+    def mutate(self, key, index, value):
+        self.mutate_dataset(key, index, value)
+
 
 KEY = "foo"
 
@@ -132,3 +150,178 @@ class ExperimentDatasetCase(unittest.TestCase):
         self.assertEqual(self.dataset_db.get_metadata(KEY), {})
 
 
+class BatchedDatasetCase(unittest.TestCase):
+    def setUp(self):
+        self.dataset_db = MockBatchDatasetDB()
+        self.dataset_mgr = DatasetManager(self.dataset_db, batch=True)
+        # only flush explicitly or when setting datasets
+        self.dataset_mgr.batcher.period = float("inf")
+        self.exp = TestExperiment((None, self.dataset_mgr, None, None))
+
+    def test_set_flushes(self):
+        self.exp.set(KEY, [1], broadcast=True)
+        self.assertEqual(self.dataset_db.get(KEY), [1])
+        self.exp.append(KEY, 2)
+        self.assertEqual(self.dataset_db.get(KEY), [1])
+        self.exp.set("bar", 0, broadcast=True)
+        self.assertEqual(self.dataset_db.get(KEY), [1, 2])
+        self.assertEqual(self.dataset_db.get("bar"), 0)
+
+    def test_append_merged(self):
+        self.exp.set(KEY, [0], broadcast=True)
+        for i in range(1, 100):
+            self.exp.append(KEY, i)
+        self.dataset_mgr.flush()
+        self.assertEqual(self.dataset_db.get(KEY), list(range(100)))
+        self.assertEqual(len(self.dataset_db.batches[-1]), 1)
+        self.assertEqual(self.dataset_db.batches[-1][0]["key"],
+                         slice(1, 1))
+
+    def test_mutate_merged(self):
+        self.exp.set(KEY, [0]*10, broadcast=True)
+        for i in range(2, 8):
+            self.exp.mutate(KEY, i, i)
+        self.exp.mutate(KEY, 7, -1)
+        self.dataset_mgr.flush()
+        self.assertEqual(self.dataset_db.get(KEY),
+                         [0, 0, 2, 3, 4, 5, 6, -1, 0, 0])
+        self.assertEqual(len(self.dataset_db.batches[-1]), 1)
+
+        self.exp.mutate(KEY, 0, 1)
+        self.exp.mutate(KEY, 5, 1)
+        self.exp.append(KEY, 1)
+        self.dataset_mgr.flush()
+        self.assertEqual(self.dataset_db.get(KEY),
+                         [1, 0, 2, 3, 4, 1, 6, -1, 0, 0, 1])
+        self.assertEqual(len(self.dataset_db.batches[-1]), 3)
+
+    def test_mutate_not_merged(self):
+        # Consecutive integer keys of a dict or rows of a 2D array are not
+        # merged into a slice assignment.
+        self.exp.set(KEY, {}, broadcast=True)
+        for i in range(3):
+            self.exp.mutate(KEY, i, i)
+        self.exp.set("bar", np.zeros((3, 2)), broadcast=True)
+        for i in range(3):
+            self.exp.mutate("bar", i, [i, i])
+        self.dataset_mgr.flush()
+        self.assertEqual(self.dataset_db.get(KEY), {0: 0, 1: 1, 2: 2})
+        np.testing.assert_array_equal(self.dataset_db.get("bar"),
+                                      [[0, 0], [1, 1], [2, 2]])
+        for batch in self.dataset_db.batches:
+            for mod in batch:
+                self.assertNotIsInstance(mod.get("key"), slice)
+
+    def test_values_captured(self):
+        self.exp.set(KEY, [], broadcast=True)
+        value = [0]
+        for i in range(3):
+            value[0] = i
+            self.exp.append(KEY, value)
+        self.dataset_mgr.flush()
+        self.assertEqual(self.dataset_db.get(KEY), [[0], [1], [2]])
+
+    def test_max_mods(self):
+        self.dataset_mgr.batcher.max_mods = 3
+        self.exp.set(KEY, [0]*10, broadcast=True)
+        for i in range(0, 10, 2):
+            self.exp.mutate(KEY, i, 1)
+        self.assertEqual(self.dataset_db.get(KEY),
+                         [1, 0, 1, 0, 1, 0, 0, 0, 0, 0])
+        self.dataset_mgr.flush()
+        self.assertEqual(self.dataset_db.get(KEY), [1, 0]*5)
+
+    def test_period(self):
+        self.dataset_mgr.batcher.period = 0.01
+        self.exp.set(KEY, [], broadcast=True)
+        self.exp.append(KEY, 0)
+        # Published by the timer, without further mods or flushes.
+        for _ in range(100):
+            if self.dataset_db.get(KEY) == [0]:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.dataset_db.get(KEY), [0])
+
+    def test_archive_only(self):
+        self.exp.set(KEY, [], broadcast=False, archive=True)
+        self.exp.append(KEY, 0)
+        self.dataset_mgr.flush()
+        self.assertEqual(self.exp.get(KEY), [0])
+        self.assertEqual(self.dataset_db.batches, [])
+
+
+class HDF5WriteCase(unittest.TestCase):
+    def setUp(self):
+        self.dataset_db = MockDatasetDB()
+        self.dataset_mgr = DatasetManager(self.dataset_db)
+        self.exp = TestExperiment((None, self.dataset_mgr, None, None))
+        self.f = h5py.File("incremental.h5", "w", "core", backing_store=False)
+
+    def tearDown(self):
+        self.f.close()
+
+    def test_incremental(self):
+        self.exp.set(KEY, [1, 2])
+        self.exp.set("bar", 0)
+        write_hdf5_ops(self.f, self.dataset_mgr.hdf5_write_ops(checkpoint=True))
+        self.assertEqual(list(self.f["datasets"][KEY][()]), [1, 2])
+        self.assertEqual(self.f["datasets"][KEY].maxshape, (None,))
+        self.assertEqual(self.f["datasets"]["bar"][()], 0)
+
+        self.exp.append(KEY, 3)
+        self.exp.append(KEY, 4)
+        ops = self.dataset_mgr.hdf5_write_ops(checkpoint=True)
+        self.assertEqual([op[0] for op in ops], ["append"])
+        write_hdf5_ops(self.f, ops)
+        self.assertEqual(list(self.f["datasets"][KEY][()]), [1, 2, 3, 4])
+
+        self.exp.append(KEY, 5.5)
+        self.exp.set("bar", 1, archive=False)
+        write_hdf5_ops(self.f, self.dataset_mgr.hdf5_write_ops(checkpoint=True))
+        self.assertEqual(list(self.f["datasets"][KEY][()]),
+                         [1, 2, 3, 4, 5.5])
+        self.assertNotIn("bar", self.f["datasets"])
+
+        self.assertEqual(self.dataset_mgr.hdf5_write_ops(checkpoint=True), [])
+
+    def test_contiguous(self):
+        self.exp.set(KEY, [1, 2])
+        write_hdf5_ops(self.f, self.dataset_mgr.hdf5_write_ops())
+        dataset = self.f["datasets"][KEY]
+        self.assertEqual(dataset.maxshape, (2,))
+        self.assertIsNone(dataset.chunks)
+
+        self.exp.append(KEY, 3)
+        ops = self.dataset_mgr.hdf5_write_ops()
+        self.assertEqual([op[0] for op in ops], ["write"])
+        write_hdf5_ops(self.f, ops)
+        self.assertEqual(list(self.f["datasets"][KEY][()]), [1, 2, 3])
+
+    def test_overwrite(self):
+        self.exp.set(KEY, np.zeros(1000), unit="V")
+        self.exp.set("bar", 0)
+        self.exp.set("baz", "a")
+        write_hdf5_ops(self.f, self.dataset_mgr.hdf5_write_ops())
+        # handles to the original datasets see the new data only if they
+        # were overwritten in place rather than deleted and created again
+        datasets = {k: self.f["datasets"][k] for k in (KEY, "bar")}
+
+        self.exp.set(KEY, np.arange(1000.), unit="mV")
+        self.exp.set("bar", 1)
+        self.exp.set("baz", "bc")
+        write_hdf5_ops(self.f, self.dataset_mgr.hdf5_write_ops())
+        self.assertEqual(list(datasets[KEY][:3]), [0., 1., 2.])
+        self.assertEqual(dict(datasets[KEY].attrs), {"unit": "mV"})
+        self.assertEqual(datasets["bar"][()], 1)
+        self.assertEqual(self.f["datasets"]["baz"][()], b"bc")
+
+    def test_compression(self):
+        options = {"compression": "gzip", "shuffle": True}
+        self.exp.set(KEY, np.zeros(1000), unit="V", hdf5_options=options)
+        self.exp.set("bar", 0, hdf5_options=options)
+        write_hdf5_ops(self.f, self.dataset_mgr.hdf5_write_ops())
+        dataset = self.f["datasets"][KEY]
+        self.assertEqual(dataset.compression, "gzip")
+        self.assertTrue(dataset.shuffle)
+        self.assertEqual(dict(dataset.attrs), {"unit": "V"})
+        self.assertEqual(self.f["datasets"]["bar"][()], 0)
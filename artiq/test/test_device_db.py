@@ -6,6 +6,7 @@ import tempfile
 from pathlib import Path
 
 from artiq.master.databases import DeviceDB
+from artiq.master.worker_db import DeviceManager
 from artiq.tools import file_import
 
 
@@ -116,3 +117,34 @@ device_db["core_log"] = {
         raw = file_import(self.ddb_file.name).device_db
 
         self.assertEqual(ddb, raw)
+
+
+class TestDeviceManager(unittest.TestCase):
+    def setUp(self):
+        self.ddb_file = tempfile.NamedTemporaryFile(
+            mode="w+", suffix=".py", delete=False
+        )
+        print(DUMMY_DDB_FILE, file=self.ddb_file, flush=True)
+        print("""
+device_db["dummy_a"] = {"type": "dummy", "arguments": {"x": [1, 2]}}
+device_db["dummy_b"] = {"arguments": {"x": [1, 2]}, "type": "dummy"}
+device_db["dummy_c"] = {"type": "dummy", "arguments": {"x": (1, 2)}}
+device_db["dummy_alias"] = "dummy_a"
+""", file=self.ddb_file, flush=True)
+
+        self.device_mgr = DeviceManager(DeviceDB(self.ddb_file.name))
+
+    def tearDown(self):
+        self.device_mgr.close_devices()
+        self.ddb_file.close()
+        os.unlink(self.ddb_file.name)
+
+    def test_shared_devices(self):
+        dev = self.device_mgr.get("dummy_a")
+        self.assertIs(self.device_mgr.get("dummy_alias"), dev)
+        self.assertIs(self.device_mgr.get("dummy_b"), dev)
+        self.assertIsNot(self.device_mgr.get("dummy_c"), dev)
+        self.assertEqual(len(self.device_mgr.active_devices), 2)
+
+        self.device_mgr.close_devices()
+        self.assertIsNot(self.device_mgr.get("dummy_a"), dev)
@@ -0,0 +1,123 @@
+import unittest
+import asyncio
+import os
+import tempfile
+import shutil
+
+from artiq.master.experiments import (ExperimentDB, FilesystemBackend,
+                                     _ScanCache)
+from artiq.master.worker import Worker
+
+
+_helper = """
+DEFAULT = {}
+"""
+
+_experiment = """
+from artiq.experiment import *
+import {module}
+
+
+class {name}(EnvExperiment):
+    def build(self):
+        self.setattr_argument("x", NumberValue({module}.DEFAULT))
+
+    def run(self):
+        pass
+"""
+
+_dataset_experiment = """
+from artiq.experiment import *
+
+
+class UsesDataset(EnvExperiment):
+    def build(self):
+        self.setattr_argument("x", NumberValue(self.get_dataset("x")))
+
+    def run(self):
+        pass
+"""
+
+
+class ScanCacheCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.root = tempfile.mkdtemp()
+        self.write("helper_a.py", _helper.format(1))
+        os.mkdir(os.path.join(self.root, "sub"))
+        self.write(os.path.join("sub", "helper_b.py"), _helper.format(2))
+        self.write("exp_a.py", _experiment.format(module="helper_a", name="A"))
+        self.write(os.path.join("sub", "exp_b.py"),
+                   _experiment.format(module="helper_b", name="B"))
+        self.write("exp_c.py", _dataset_experiment)
+        self.examined = []
+
+        # record the files actually examined by a worker
+        self.original_examine = Worker.examine
+        original_examine = self.original_examine
+        examined = self.examined
+
+        async def examine(worker, rid, file, *args, **kwargs):
+            examined.append(os.path.relpath(file, self.root))
+            return await original_examine(worker, rid, file, *args, **kwargs)
+        Worker.examine = examine
+
+    def write(self, filename, content):
+        with open(os.path.join(self.root, filename), "w") as f:
+            f.write(content)
+
+    def scan(self, experiment_db):
+        self.examined.clear()
+        self.loop.run_until_complete(experiment_db.scan_repository())
+        return {k: v["arginfo"]["x"][0]["default"]
+                for k, v in experiment_db.explist.raw_view.items()}
+
+    def make_db(self, **kwargs):
+        handlers = {"get_dataset": lambda key: 3}
+        return ExperimentDB(FilesystemBackend(self.root), handlers, **kwargs)
+
+    def test_cache(self):
+        experiment_db = self.make_db(scan_workers=2, scan_cache=True)
+        expected = {"A": 1, "sub/B": 2, "UsesDataset": 3}
+        self.assertEqual(self.scan(experiment_db), expected)
+        self.assertEqual(len(self.examined), 5)
+
+        self.assertEqual(self.scan(experiment_db), expected)
+        self.assertEqual(self.examined, ["exp_c.py"])
+
+        # modifying an imported module invalidates the entry
+        self.write(os.path.join("sub", "helper_b.py"), _helper.format(4))
+        expected["sub/B"] = 4
+        self.assertEqual(self.scan(experiment_db), expected)
+        self.assertEqual(sorted(self.examined),
+                         ["exp_c.py", os.path.join("sub", "exp_b.py"),
+                          os.path.join("sub", "helper_b.py")])
+
+    def test_persistent_cache(self):
+        cache_file = os.path.join(self.root, ".scan_cache.pyon")
+        expected = {"A": 1, "sub/B": 2, "UsesDataset": 3}
+        self.assertEqual(self.scan(self.make_db(scan_cache=cache_file)),
+                         expected)
+        self.assertEqual(self.scan(self.make_db(scan_cache=cache_file)),
+                         expected)
+        self.assertEqual(self.examined, ["exp_c.py"])
+
+    def test_no_cache(self):
+        experiment_db = self.make_db()
+        self.scan(experiment_db)
+        self.assertEqual(self.scan(experiment_db),
+                         {"A": 1, "sub/B": 2, "UsesDataset": 3})
+        self.assertEqual(len(self.examined), 5)
+
+    def test_deleted_dependency(self):
+        cache = _ScanCache()
+        dependencies = {"cacheable": True,
+                        "files": [os.path.join(self.root, "deleted.py")]}
+        cache.set(self.root, "exp_a.py", {}, dependencies, dict())
+        self.assertEqual(cache.entries, dict())
+
+    def tearDown(self):
+        Worker.examine = self.original_examine
+        shutil.rmtree(self.root)
+        self.loop.close()
@@ -0,0 +1,151 @@
+import unittest
+import asyncio
+import copy
+
+from sipyco.sync_struct import Notifier, Subscriber, process_mod
+from sipyco import pyon
+
+from artiq.master.publisher import (ModCoalescer, Publisher,
+                                    filtered_notifier_name)
+
+
+def _coalesce(initial, change):
+    """Applies ``change`` to a notifier initialized with ``initial`` and
+    returns the final structure and the coalesced modifications."""
+    notifier = Notifier(copy.deepcopy(initial))
+    coalescer = ModCoalescer()
+
+    def publish(mod):
+        line = (pyon.encode(mod) + "\n").encode()
+        coalescer.add(mod, line, frozenset(["client"]), notifier.raw_view)
+    notifier.publish = publish
+    change(notifier)
+    lines = coalescer.lines_by_recipient().get("client", [])
+    return notifier.raw_view, [pyon.decode(line.decode()) for line in lines]
+
+
+class CoalescerCase(unittest.TestCase):
+    def check(self, initial, change, expected_count):
+        struct, mods = _coalesce(initial, change)
+        client = copy.deepcopy(initial)
+        for mod in mods:
+            process_mod(client, mod)
+        self.assertEqual(client, struct)
+        self.assertEqual(len(mods), expected_count)
+
+    def test_status(self):
+        def change(schedule):
+            schedule[1] = {"status": "pending"}
+            for status in "preparing", "prepare_done", "running":
+                schedule[1]["status"] = status
+            schedule[2] = {"status": "pending"}
+            schedule[2]["status"] = "preparing"
+            schedule[1]["status"] = "run_done"
+        self.check({}, change, 4)
+
+    def test_replace(self):
+        def change(datasets):
+            datasets["x"] = [1, 2]
+            datasets["x"].append(3)
+            datasets["x"][0] = 4
+            datasets["x"] = [5]
+            del datasets["y"]
+            datasets["y"] = 6
+        self.check({"y": 0}, change, 2)
+
+    def test_list_shift(self):
+        def change(struct):
+            struct["l"][1] = 5
+            struct["l"].pop(0)
+            struct["l"][1] = 6
+            del struct["l"][0]
+            struct["l"][0] = 7
+        self.check({"l": [1, 2, 3]}, change, 5)
+
+        def change(struct):
+            struct["l"][1] = 5
+            struct["l"].append(4)
+            struct["l"][1] = 6
+        self.check({"l": [1, 2, 3]}, change, 2)
+
+
+class PublisherCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def test_coalesced_subscription(self):
+        self.loop.run_until_complete(self._test_coalesced_subscription())
+
+    async def _test_coalesced_subscription(self):
+        notifier = Notifier(dict())
+        publisher = Publisher({"schedule": notifier}, coalesce=["schedule"],
+                              coalesce_window=0.01)
+        await publisher.start("::1", 7777)
+        try:
+            received = []
+            done = asyncio.Event()
+
+            def notify(mod):
+                received.append(mod)
+                if mod["action"] == "delitem":
+                    done.set()
+            subscriber = Subscriber("schedule", lambda init: init, notify)
+            await subscriber.connect("::1", 7777)
+            try:
+                while not publisher._recipients["schedule"]:
+                    await asyncio.sleep(0.01)
+                notifier[0] = {"status": "pending"}
+                for status in "preparing", "running", "run_done":
+                    notifier[0]["status"] = status
+                await asyncio.sleep(0.05)
+                del notifier[0]
+                await asyncio.wait_for(done.wait(), 1.0)
+            finally:
+                await subscriber.close()
+        finally:
+            await publisher.stop()
+        self.assertEqual(
+            [(mod["action"], mod["path"], mod["key"]) for mod in received[1:]],
+            [("setitem", [], 0), ("setitem", [0], "status"),
+             ("delitem", [], 0)])
+
+    def test_filtered_subscription(self):
+        self.loop.run_until_complete(self._test_filtered_subscription())
+
+    async def _test_filtered_subscription(self):
+        notifier = Notifier({"a": 1, "b.x": 2, "c": 3})
+        publisher = Publisher({"datasets": notifier})
+        await publisher.start("::1", 7777)
+        try:
+            received = []
+            done = asyncio.Event()
+
+            def notify(mod):
+                received.append(mod)
+                if mod["action"] == "delitem":
+                    done.set()
+            subscriber = Subscriber(
+                filtered_notifier_name("datasets", ["a"], ["b."]),
+                # apply the mods to a copy, leaving the received init mod
+                # unchanged
+                copy.deepcopy, notify)
+            await subscriber.connect("::1", 7777)
+            try:
+                while not publisher._filtered_recipients["datasets"]:
+                    await asyncio.sleep(0.01)
+                notifier["c"] = 4
+                notifier["b.y"] = 5
+                notifier["a"] = 6
+                del notifier["a"]
+                await asyncio.wait_for(done.wait(), 1.0)
+            finally:
+                await subscriber.close()
+        finally:
+            await publisher.stop()
+        self.assertEqual(received[0]["struct"], {"a": 1, "b.x": 2})
+        self.assertEqual([mod["key"] for mod in received[1:]],
+                         ["b.y", "a", "a"])
+
+    def tearDown(self):
+        self.loop.close()
@@ -2,10 +2,17 @@ import unittest
 import logging
 import asyncio
 import sys
-from time import time, sleep
+import os
+import random
+from time import time, sleep, perf_counter
+
+from sipyco.sync_struct import Notifier
 
 from artiq.experiment import *
-from artiq.master.scheduler import Scheduler
+from artiq.master.scheduler import Scheduler, RunPool, RunStatus, PrepareStage
+
+
+artiq_benchmark = os.getenv("ARTIQ_BENCHMARK")
 
 
 class EmptyExperiment(EnvExperiment):
@@ -124,6 +131,46 @@ class SchedulerCase(unittest.TestCase):
         scheduler.notifier.publish = None
         loop.run_until_complete(scheduler.stop())
 
+    def test_worker_pool(self):
+        loop = self.loop
+        scheduler = Scheduler(_RIDCounter(0), dict(), None, None,
+                              worker_pool_size=2, worker_preload=["json"])
+        expid = _get_expid("EmptyExperiment")
+
+        pool = scheduler._worker_pool
+        taken = []
+        pool_get = pool.get
+        def get():
+            worker = pool_get()
+            taken.append(worker)
+            return worker
+        pool.get = get
+
+        done = asyncio.Event()
+        completed = set()
+        def notify(mod):
+            if mod["action"] == "delitem":
+                completed.add(mod["key"])
+                if len(completed) == 3:
+                    done.set()
+        scheduler.notifier.publish = notify
+
+        scheduler.start(loop=loop)
+        async def wait_idle():
+            while len(pool._idle) < 2:
+                await asyncio.sleep(0.01)
+        loop.run_until_complete(asyncio.wait_for(wait_idle(), 30))
+        for _ in range(3):
+            scheduler.submit("main", expid, 0, None, False)
+        loop.run_until_complete(done.wait())
+        scheduler.notifier.publish = None
+        loop.run_until_complete(scheduler.stop())
+
+        # the first runs took over the workers started ahead of time
+        self.assertEqual(len(taken), 3)
+        self.assertIsNotNone(taken[0])
+        self.assertIsNotNone(taken[1])
+
     def test_pending_priority(self):
         """Check due dates take precedence over priorities when waiting to
         prepare."""
@@ -317,3 +364,116 @@ class SchedulerCase(unittest.TestCase):
 
     def tearDown(self):
         self.loop.close()
+
+
+def _get_run_by_scan(pool):
+    # Reference implementation of PrepareStage._get_run, scanning the pool.
+    pending_runs = [r for r in pool.runs.values()
+                    if r.status == RunStatus.pending]
+    now = time()
+    def is_runnable(r):
+        return (r.due_date or 0) < now
+
+    prepared_max = max((r.priority_key() for r in pool.runs.values()
+                        if r.status == RunStatus.prepare_done),
+                       default=None)
+    def takes_precedence(r):
+        return prepared_max is None or r.priority_key() > prepared_max
+
+    candidate = max(filter(is_runnable, pending_runs),
+                    key=lambda r: r.priority_key(),
+                    default=None)
+    if candidate is not None and takes_precedence(candidate):
+        return candidate
+    return min((r.due_date - now for r in pending_runs
+                if (not is_runnable(r) and takes_precedence(r))),
+               default=None)
+
+
+def _make_pool(n_runs):
+    random.seed(0)
+    pool = RunPool(_RIDCounter(0), dict(), Notifier(dict()), None, None)
+    expid = _get_expid("EmptyExperiment")
+    late = time() + 100000
+    for i in range(n_runs):
+        # a quarter of the runs are scheduled for later
+        due_date = late + i if i % 4 == 0 else None
+        pool.submit(dict(expid), random.randrange(10), due_date, False,
+                    "main")
+    return pool
+
+
+def _drain(pool, get_run, n):
+    # Takes runs through the stages as the scheduler would, without
+    # workers; each status change wakes the stages up. Returns the RIDs
+    # of the runs in the order they were selected.
+    rids = []
+    for _ in range(n):
+        run = get_run(pool)
+        if isinstance(run, float):
+            break
+        rids.append(run.rid)
+        for status in (RunStatus.preparing, RunStatus.prepare_done,
+                       RunStatus.running, RunStatus.run_done,
+                       RunStatus.analyzing, RunStatus.deleting):
+            run.status = status
+            get_run(pool)
+        del pool.runs[run.rid]
+    return rids
+
+
+def _get_run_by_queues(pool):
+    return PrepareStage(pool, None)._get_run()
+
+
+class RunSelectionCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def test_same_order(self):
+        n_runs = 200
+        rids = [_drain(_make_pool(n_runs), get_run, n_runs)
+                for get_run in (_get_run_by_scan, _get_run_by_queues)]
+        # The runs scheduled for later are not selected.
+        self.assertEqual(len(rids[0]), n_runs*3//4)
+        self.assertEqual(rids[0], rids[1])
+
+    def tearDown(self):
+        self.loop.close()
+
+
+@unittest.skipUnless(artiq_benchmark, "ARTIQ_BENCHMARK not set")
+class SchedulerBenchmark(unittest.TestCase):
+    """Measures the selection of the next run to prepare and the status
+    transitions of runs with a large queue."""
+    n_runs = 10000
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def test_queue(self):
+        results = []
+        n = 20
+        for name, get_run in [("scan", _get_run_by_scan),
+                              ("priority queues", _get_run_by_queues)]:
+            pool = _make_pool(self.n_runs)
+            t0 = perf_counter()
+            get_run(pool)
+            dt_select = perf_counter() - t0
+            t0 = perf_counter()
+            _drain(pool, get_run, n)
+            dt_drain = (perf_counter() - t0)/n
+            results.append((name, dt_select*1e3, dt_drain*1e3))
+
+        print()
+        print("{} queued runs".format(self.n_runs))
+        print("| Implementation  | First selection (ms) | Per run (ms) |")
+        print("| --------------- | -------------------- | ------------ |")
+        for name, dt_select, dt_drain in results:
+            print("| {:<15} | {:>20.3f} | {:>12.3f} |".format(
+                name, dt_select, dt_drain))
+
+    def tearDown(self):
+        self.loop.close()
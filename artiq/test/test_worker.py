@@ -52,6 +52,26 @@ class WatchdogTimeoutInBuild(EnvExperiment):
         pass
 
 
+class _Device:
+    def __init__(self, dmgr, value):
+        self.value = value
+
+
+class DeviceDBCache(EnvExperiment):
+    def build(self):
+        device_db = self.get_device_db()
+        device_db["device"]["arguments"]["value"] = 2
+        # The description is resolved from the cached device database,
+        # which is not affected by changes to the returned copies.
+        if self.get_device("alias").value != 1:
+            raise ValueError
+        if self.get_device_db()["device"]["arguments"]["value"] != 1:
+            raise ValueError
+
+    def run(self):
+        self.get_device_db()
+
+
 async def _call_worker(worker, expid):
     try:
         await worker.build(0, "main", None, expid, 0)
@@ -67,14 +87,14 @@ class WorkerCase(unittest.TestCase):
         self.loop = asyncio.new_event_loop()
         asyncio.set_event_loop(self.loop)
 
-    def _run_experiment(self, class_name):
+    def _run_experiment(self, class_name, handlers={}):
         expid = {
             "log_level": logging.WARNING,
             "file": sys.modules[__name__].__file__,
             "class_name": class_name,
             "arguments": dict()
         }
-        worker = Worker({})
+        worker = Worker(handlers)
         self.loop.run_until_complete(_call_worker(worker, expid))
 
     def test_simple_run(self):
@@ -88,6 +108,24 @@ class WorkerCase(unittest.TestCase):
             self.assertIn("Terminating with exception (TypeError)",
                           logs.output[-1])
 
+    def test_device_db_cache(self):
+        device_db = {
+            "device": {
+                "type": "local",
+                "module": "artiq.test.test_worker",
+                "class": "_Device",
+                "arguments": {"value": 1}
+            },
+            "alias": "device"
+        }
+        requests = []
+        def get_device_db():
+            requests.append(None)
+            return device_db
+        self._run_experiment("DeviceDBCache", {"get_device_db": get_device_db})
+        # Fetched once in build and again in run, after invalidation.
+        self.assertEqual(len(requests), 2)
+
     def test_watchdog_no_timeout(self):
         self._run_experiment("WatchdogNoTimeout")
 
@@ -0,0 +1,158 @@
+import unittest
+import os
+import io
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from artiq.master import worker_ipc
+
+
+artiq_benchmark = os.getenv("ARTIQ_BENCHMARK")
+
+
+class _PipeComm:
+    def __init__(self, rfd, wfd):
+        self.rf = open(rfd, "rb", 0)
+        self.wf = open(wfd, "wb", 0)
+
+    def read(self, n):
+        return self.rf.read(n)
+
+    def readline(self):
+        return self.rf.readline()
+
+    def write(self, data):
+        self.wf.write(data)
+
+    def close(self):
+        self.rf.close()
+        self.wf.close()
+
+
+def _start_echo():
+    r0, w0 = os.pipe()
+    r1, w1 = os.pipe()
+    parent = _PipeComm(r0, w1)
+    child = _PipeComm(r1, w0)
+
+    def echo():
+        while True:
+            obj = worker_ipc.read_object(child)
+            child.write(worker_ipc.encode(obj))
+            if obj is None:
+                break
+    thread = threading.Thread(target=echo)
+    thread.start()
+
+    def stop():
+        parent.write(worker_ipc.encode(None))
+        thread.join()
+        parent.close()
+        child.close()
+    return parent, stop
+
+
+def _round_trip(obj):
+    return worker_ipc.read_object(io.BytesIO(worker_ipc.encode(obj)))
+
+
+class FramingCase(unittest.TestCase):
+    def test_pyon_line(self):
+        obj = {"action": "update_dataset", "args": ([1, 2, 3],),
+               "kwargs": {}}
+        data = worker_ipc.encode(obj)
+        self.assertTrue(data.endswith(b"\n"))
+        self.assertEqual(_round_trip(obj), obj)
+
+        small = np.arange(4)
+        self.assertNotEqual(worker_ipc.encode(small)[:1],
+                            worker_ipc.FRAME_MARKER)
+        np.testing.assert_array_equal(_round_trip(small), small)
+
+    def test_binary_frame(self):
+        array = np.linspace(0, 1, 10000).reshape(100, 100)
+        obj = {"action": "update_dataset",
+               "args": ({"action": "setitem", "path": [], "key": "x",
+                         "value": (True, array, {"unit": "V"})},),
+               "kwargs": OrderedDict(a=[array.T, 1])}
+        data = worker_ipc.encode(obj)
+        self.assertEqual(data[:1], worker_ipc.FRAME_MARKER)
+        r = _round_trip(obj)
+        self.assertEqual(r["action"], "update_dataset")
+        mod = r["args"][0]
+        self.assertEqual(mod["value"][0], True)
+        self.assertEqual(mod["value"][2], {"unit": "V"})
+        np.testing.assert_array_equal(mod["value"][1], array)
+        self.assertIsInstance(r["kwargs"], OrderedDict)
+        np.testing.assert_array_equal(r["kwargs"]["a"][0], array.T)
+        self.assertEqual(r["kwargs"]["a"][1], 1)
+        # arrays must remain mutable for mutate_dataset
+        mod["value"][1][0, 0] = 2.0
+
+    def test_placeholder_escape(self):
+        array = np.zeros(10000, np.int32)
+        obj = [array, (worker_ipc._placeholder, 0), ("x",)]
+        r = _round_trip(obj)
+        np.testing.assert_array_equal(r[0], array)
+        self.assertEqual(r[1:], [(worker_ipc._placeholder, 0), ("x",)])
+
+    def test_pipe(self):
+        parent, stop = _start_echo()
+        try:
+            array = np.arange(1 << 20, dtype=np.uint8)
+            parent.write(worker_ipc.encode({"data": array}))
+            r = worker_ipc.read_object(parent)
+            np.testing.assert_array_equal(r["data"], array)
+        finally:
+            stop()
+
+
+@unittest.skipUnless(artiq_benchmark, "ARTIQ_BENCHMARK not set")
+class FramingBenchmark(unittest.TestCase):
+    """Compares round trips of dataset updates through a pipe with binary
+    frames and with PYON lines only."""
+    sizes = [1 << 10, 1 << 16, 1 << 20, 1 << 23]
+
+    def _measure(self, parent, obj, nbytes):
+        n = 0
+        t0 = time.perf_counter()
+        while n < 5 or time.perf_counter() - t0 < 0.5:
+            parent.write(worker_ipc.encode(obj))
+            worker_ipc.read_object(parent)
+            n += 1
+        dt = (time.perf_counter() - t0)/n
+        return dt*1e3, 2*nbytes/dt/(1 << 20)
+
+    def test_round_trip(self):
+        parent, stop = _start_echo()
+
+        threshold = worker_ipc.buffer_threshold
+        results = []
+        try:
+            for size in self.sizes:
+                array = np.random.rand(size // 8)
+                obj = {"action": "update_dataset",
+                       "args": ({"action": "setitem", "path": [],
+                                 "key": "x",
+                                 "value": (False, array, {})},),
+                       "kwargs": {}}
+                row = [size]
+                for framing_threshold in None, threshold:
+                    worker_ipc.buffer_threshold = framing_threshold
+                    row += self._measure(parent, obj, size)
+                results.append(row)
+        finally:
+            worker_ipc.buffer_threshold = threshold
+            stop()
+
+        print()
+        print("| Size (B) | PYON (ms) | PYON (MiB/s) "
+              "| Binary (ms) | Binary (MiB/s) |")
+        print("| -------- | --------- | ------------ "
+              "| ----------- | -------------- |")
+        for v in results:
+            print("| {:>8} | {:>9.3f} | {:>12.2f} | {:>11.3f} | {:>14.2f} |"
+                  .format(*v))